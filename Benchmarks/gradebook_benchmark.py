@@ -0,0 +1,387 @@
+# Student Gradebook Manager – benchmarks
+# Times the core gradebook operations of Version 3, Version 4 and Version 4 resit
+# on made-up gradebooks of different sizes, without showing any windows:
+#   load               load_gradebook() (Version 4 resit also builds its indexes, like main() does)
+#   save               save_gradebook() of the whole gradebook
+#   save_one_change    change one score and save it the way each version does
+#   search             search_student() for a name (10% of searches are near misses)
+#   calculate_average  calculate_average() for one student
+#   view_all_students  view_all_students() (first page only for Version 4 resit)
+# For each operation it reports latency percentiles, calls per second and the
+# peak memory allocated while it runs, and saves everything to a JSON results file
+# so later runs (or versions) can be compared with --compare.
+#   python Benchmarks/gradebook_benchmark.py --sizes 1000,100000,1000000
+#   python Benchmarks/gradebook_benchmark.py --compare results/old.json results/new.json
+# Each version and size runs in its own Python process, in a temporary folder,
+# so the real gradebook files are never touched and one run can't skew the next.
+# The easygui dialogs are replaced with scripted answers while benchmarking.
+import argparse
+import gc
+import importlib.util
+import json
+import os
+import platform
+import random
+import shutil
+import string
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import types
+from datetime import datetime
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(REPO_DIR, "Benchmarks", "results")
+# Program file and data file for each version, relative to the repo folder
+VERSIONS = {
+    "V3": ("Version 3", "V3_gradebook_mamager3.py"),
+    "V4": ("Version 4", "V4_gradebook_mamager4.py"),
+    "V4 resit": ("Version 4 resit", "V4_gradebook_mamager4_resit_code.py"),
+}
+OPERATIONS = ["load", "save", "save_one_change", "search", "calculate_average", "view_all_students"]
+DEFAULT_SIZES = [1000, 100000, 1000000]
+NAME_STYLES = ["realistic", "sequential", "random"]
+SUBJECTS = ["maths", "english", "science", "physics", "chemistry", "biology", "history", "geography",
+            "art", "music", "pe", "french", "spanish", "digital technologies", "economics", "te reo maori"]
+FIRST_NAMES = ["oliver", "jack", "noah", "leo", "george", "charlie", "lucas", "william", "theodore", "hunter",
+               "charlotte", "isla", "olivia", "amelia", "mia", "ava", "harper", "sophie", "ella", "grace",
+               "james", "liam", "mason", "luca", "hudson", "arlo", "max", "ruby", "lily", "zoe"]
+LAST_NAMES = ["smith", "wilson", "williams", "brown", "taylor", "jones", "singh", "wang", "anderson", "li",
+              "thompson", "walker", "white", "harris", "martin", "kumar", "lee", "chen", "patel", "king",
+              "campbell", "clarke", "young", "wright", "ngata", "tane", "kaur", "scott", "moore", "hall"]
+REGRESSION_THRESHOLD = 0.10  # How much slower (as a fraction) counts as a regression in --compare
+
+# Made-up data
+
+# Weights that fall away like 1/rank (a Zipf distribution), as running totals for random.choices
+def zipf_weights(count):
+    total = 0
+    weights = []
+    for rank in range(1, count + 1):
+        total += 1 / rank
+        weights.append(total)
+    return weights
+
+FIRST_WEIGHTS = zipf_weights(len(FIRST_NAMES))
+LAST_WEIGHTS = zipf_weights(len(LAST_NAMES))
+
+# Make count unique student names in the given style
+def make_names(count, style, rng):
+    if style == "sequential":
+        return [f"student {i:07d}" for i in range(count)]
+    names = []
+    used = {}
+    for _ in range(count):
+        if style == "realistic":
+            # A few first and last names are much more common than the rest, like real classes
+            base = f"{rng.choices(FIRST_NAMES, cum_weights=FIRST_WEIGHTS)[0]} " \
+                   f"{rng.choices(LAST_NAMES, cum_weights=LAST_WEIGHTS)[0]}"
+        else:
+            base = "".join(rng.choices(string.ascii_lowercase, k=rng.randint(3, 10))) + " " + \
+                   "".join(rng.choices(string.ascii_lowercase, k=rng.randint(3, 12)))
+        seen = used.get(base, 0)
+        used[base] = seen + 1
+        names.append(base if seen == 0 else f"{base} {seen + 1}")
+    return names
+
+# Make a gradebook in the JSON layout every version saves:
+#   {name: {"age", "subjects": {subject: score}, "total_score", "count_scores"}}
+# Each student takes subjects_per_student subjects (give or take 2) from the first subject_count subjects.
+def make_gradebook(students, subjects_per_student=6, subject_count=12, name_style="realistic", seed=1):
+    rng = random.Random(seed)
+    pool = SUBJECTS[:subject_count] + [f"subject {i}" for i in range(subject_count - len(SUBJECTS))]
+    gradebook = {}
+    for name in make_names(students, name_style, rng):
+        taken = rng.randint(max(1, subjects_per_student - 2), min(len(pool), subjects_per_student + 2))
+        subjects = {subject: rng.randint(0, 100) for subject in rng.sample(pool, taken)}
+        gradebook[name] = {"age": rng.randint(7, 18), "subjects": subjects,
+                           "total_score": sum(subjects.values()), "count_scores": len(subjects)}
+    return gradebook
+
+# Names to search for: mostly real names, with a few one-letter typos mixed in
+def make_queries(names, count, rng, miss_rate=0.1):
+    queries = []
+    for _ in range(count):
+        name = rng.choice(names)
+        if rng.random() < miss_rate:
+            i = rng.randrange(len(name))
+            name = name[:i] + rng.choice(string.ascii_lowercase) + name[i + 1:]
+        queries.append(name)
+    return queries
+
+# Running one version
+
+# Stands in for easygui: every dialog returns the next scripted answer (or None)
+class ScriptedDialogs(types.ModuleType):
+    def __init__(self):
+        super().__init__("easygui")
+        self.answers = []
+
+    def __getattr__(self, name):
+        return self.answer
+
+    def answer(self, *args, **kwargs):
+        return self.answers.pop(0) if self.answers else None
+
+# Load a version's program file as a module, with the scripted dialogs instead of easygui
+def load_version(version, dialogs):
+    folder, file_name = VERSIONS[version]
+    sys.path.insert(0, os.path.join(REPO_DIR, folder))
+    real_easygui = sys.modules.get("easygui")
+    sys.modules["easygui"] = dialogs
+    try:
+        spec = importlib.util.spec_from_file_location(f"benchmark_{folder.replace(' ', '_')}",
+                                                      os.path.join(REPO_DIR, folder, file_name))
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+    finally:
+        if real_easygui is None:
+            sys.modules.pop("easygui", None)
+        else:
+            sys.modules["easygui"] = real_easygui
+    return module
+
+# Work out the percentiles and rates for a list of call times (in seconds)
+def summarise(times):
+    times = sorted(times)
+    pick = lambda fraction: times[min(len(times) - 1, int(fraction * len(times)))]
+    total = sum(times)
+    return {"calls": len(times), "mean_ms": total / len(times) * 1000, "p50_ms": pick(0.5) * 1000,
+            "p90_ms": pick(0.9) * 1000, "p99_ms": pick(0.99) * 1000, "max_ms": times[-1] * 1000,
+            "per_second": len(times) / total if total else None}
+
+# Call an operation over and over until the time budget runs out (at least once)
+def time_calls(operation, budget, max_calls):
+    times = []
+    started = time.perf_counter()
+    while len(times) < max_calls and (not times or time.perf_counter() - started < budget):
+        call_start = time.perf_counter()
+        operation()
+        times.append(time.perf_counter() - call_start)
+    return times
+
+# Run one more call with tracemalloc on, to see how much memory the operation needs at its peak
+def peak_memory(operation):
+    gc.collect()
+    tracemalloc.start()
+    try:
+        start = tracemalloc.get_traced_memory()[0]
+        operation()
+        return tracemalloc.get_traced_memory()[1] - start
+    finally:
+        tracemalloc.stop()
+
+# Benchmark every operation of one version on one gradebook file (runs in its own process).
+# Returns {operation: stats}.
+def run_version(version, data_file, options):
+    folder = VERSIONS[version][0]
+    dialogs = ScriptedDialogs()
+    rng = random.Random(options.seed)
+    work_dir = tempfile.mkdtemp(prefix="gradebook_benchmark_")
+    os.makedirs(os.path.join(work_dir, folder))
+    shutil.copy(data_file, os.path.join(work_dir, folder, "gradebook_logs.json"))
+    os.chdir(work_dir)
+    try:
+        module = load_version(version, dialogs)
+        # The resit front end works on a GradeBook from gradebook_core instead of a dict
+        resit = hasattr(module, "core")
+        # Only time the searching, not the summary window or chart
+        for display in ("display_summary", "display_summary_and_plot"):
+            if hasattr(module, display):
+                setattr(module, display, lambda name, student: None)
+
+        if resit:
+            storage = module.core.gradebook_storage.open_storage(options.storage)
+
+            def load():
+                return module.core.GradeBook(storage)
+        else:
+            load = module.load_gradebook
+
+        gradebook = load()
+        names = list(gradebook.names() if resit else gradebook)
+        queries = iter(make_queries(names, options.max_calls + 1, rng))
+
+        def save_one_change():
+            name = rng.choice(names)
+            subject = rng.choice(SUBJECTS[:options.subject_count])
+            score = rng.randint(0, 100)
+            if resit:
+                gradebook.set_score(name, subject, score)
+            else:
+                # What add_student() does after each score in Version 3 and 4
+                student = gradebook[name]
+                student["subjects"][subject] = score
+                student["total_score"] = sum(student["subjects"].values())
+                student["count_scores"] = len(student["subjects"])
+                module.save_gradebook(gradebook)
+
+        def search():
+            dialogs.answers = [next(queries)]
+            module.search_student(gradebook)
+
+        def view_all_students():
+            dialogs.answers = ["Close"]
+            module.view_all_students(gradebook)
+
+        def save():
+            if resit:
+                gradebook.save()
+            else:
+                module.save_gradebook(gradebook)
+
+        def calculate_average():
+            name = rng.choice(names)
+            module.calculate_average(gradebook.student(name) if resit else gradebook[name])
+
+        operations = {
+            "load": load,
+            "save": save,
+            "save_one_change": save_one_change,
+            "search": search,
+            "calculate_average": calculate_average,
+            "view_all_students": view_all_students,
+        }
+        results = {}
+        for name in options.operations:
+            times = time_calls(operations[name], options.budget, options.max_calls)
+            results[name] = summarise(times)
+            if options.memory:
+                results[name]["peak_memory_bytes"] = peak_memory(operations[name])
+        if resit:
+            storage.close()
+        return results
+    finally:
+        os.chdir(REPO_DIR)
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+# Running everything
+
+# Run one version in a fresh Python process and read back its results
+def run_in_subprocess(version, data_file, options):
+    command = [sys.executable, os.path.abspath(__file__), "--one", version, data_file,
+               "--operations", ",".join(options.operations), "--budget", str(options.budget),
+               "--max-calls", str(options.max_calls), "--seed", str(options.seed),
+               "--subject-count", str(options.subject_count), "--storage", options.storage]
+    if not options.memory:
+        command.append("--no-memory")
+    environment = dict(os.environ, MPLBACKEND="Agg")
+    finished = subprocess.run(command, capture_output=True, text=True, env=environment)
+    if finished.returncode != 0:
+        return {"error": finished.stderr.strip().splitlines()[-1] if finished.stderr.strip() else "failed"}
+    return json.loads(finished.stdout.strip().splitlines()[-1])
+
+# Generate the data for each size and benchmark every chosen version on it
+def run_all(options):
+    results = {
+        "when": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "machine": f"{platform.system()} {platform.machine()}, {os.cpu_count()} CPUs",
+        "settings": {"sizes": options.sizes, "subjects_per_student": options.subjects_per_student,
+                     "subject_count": options.subject_count, "names": options.names, "seed": options.seed,
+                     "budget": options.budget, "max_calls": options.max_calls, "storage": options.storage},
+        "results": {version: {} for version in options.versions},
+    }
+    with tempfile.TemporaryDirectory(prefix="gradebook_benchmark_data_") as data_dir:
+        for size in options.sizes:
+            data_file = os.path.join(data_dir, f"gradebook_{size}.json")
+            print(f"Making a gradebook of {size} students...", flush=True)
+            with open(data_file, "w") as f:
+                json.dump(make_gradebook(size, options.subjects_per_student, options.subject_count,
+                                         options.names, options.seed), f, indent=2)
+            for version in options.versions:
+                print(f"  {version}...", flush=True)
+                results["results"][version][str(size)] = run_in_subprocess(version, data_file, options)
+    return results
+
+# Show results as a table
+def format_results(results):
+    lines = []
+    for version, sizes in results["results"].items():
+        for size, operations in sizes.items():
+            lines.append(f"{version}, {int(size):,} students")
+            if "error" in operations:
+                lines.append(f"  failed: {operations['error']}")
+                continue
+            lines.append(f"  {'operation':<20}{'calls':>7}{'p50 ms':>11}{'p90 ms':>11}{'p99 ms':>11}"
+                         f"{'per sec':>11}{'peak MB':>10}")
+            for name, stats in operations.items():
+                peak = stats.get("peak_memory_bytes")
+                peak = f"{peak / 1e6:.1f}" if peak is not None else "-"
+                lines.append(f"  {name:<20}{stats['calls']:>7}{stats['p50_ms']:>11.3f}{stats['p90_ms']:>11.3f}"
+                             f"{stats['p99_ms']:>11.3f}{stats['per_second'] or 0:>11.1f}{peak:>10}")
+    return "\n".join(lines)
+
+# Compare the median times of two results files, operation by operation
+def compare_results(old, new, threshold=REGRESSION_THRESHOLD):
+    lines = [f"{'version':<10}{'students':>10}  {'operation':<20}{'old p50 ms':>12}{'new p50 ms':>12}{'change':>9}"]
+    regressions = 0
+    for version, sizes in new["results"].items():
+        for size, operations in sizes.items():
+            old_operations = old["results"].get(version, {}).get(size, {})
+            for name, stats in operations.items():
+                if name == "error" or name not in old_operations or "error" in old_operations:
+                    continue
+                before, after = old_operations[name]["p50_ms"], stats["p50_ms"]
+                change = (after - before) / before if before else 0
+                flag = "  slower" if change > threshold else ""
+                regressions += bool(flag)
+                lines.append(f"{version:<10}{int(size):>10}  {name:<20}{before:>12.3f}{after:>12.3f}{change:>+9.0%}{flag}")
+    lines.append(f"{regressions} operation(s) more than {threshold:.0%} slower.")
+    return "\n".join(lines), regressions
+
+def parse_options(arguments):
+    parser = argparse.ArgumentParser(description="Benchmark the gradebook versions.")
+    parser.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)),
+                        type=lambda text: [int(size) for size in text.split(",")], help="student counts, e.g. 1000,100000")
+    parser.add_argument("--versions", default=",".join(VERSIONS), type=lambda text: text.split(","),
+                        help="versions to run: " + ", ".join(VERSIONS))
+    parser.add_argument("--operations", default=",".join(OPERATIONS), type=lambda text: text.split(","),
+                        help="operations to run: " + ", ".join(OPERATIONS))
+    parser.add_argument("--subjects-per-student", type=int, default=6)
+    parser.add_argument("--subject-count", type=int, default=12, help="number of different subjects")
+    parser.add_argument("--names", choices=NAME_STYLES, default="realistic", help="how student names look")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--budget", type=float, default=1.0, help="seconds to spend timing each operation")
+    parser.add_argument("--max-calls", type=int, default=1000, help="most calls timed per operation")
+    parser.add_argument("--storage", default="json", help="storage backend for Version 4 resit")
+    parser.add_argument("--no-memory", dest="memory", action="store_false", help="skip peak memory (faster)")
+    parser.add_argument("--out", help="results file (default Benchmarks/results/<date and time>.json)")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="compare two results files")
+    parser.add_argument("--one", nargs=2, metavar=("VERSION", "DATA_FILE"), help=argparse.SUPPRESS)
+    options = parser.parse_args(arguments)
+    for version in options.versions:
+        if version not in VERSIONS:
+            parser.error(f"unknown version {version!r}")
+    for name in options.operations:
+        if name not in OPERATIONS:
+            parser.error(f"unknown operation {name!r}")
+    return options
+
+def main(arguments):
+    options = parse_options(arguments)
+    if options.one:
+        # Inside the process for one version: print its results as one JSON line
+        print(json.dumps(run_version(options.one[0], options.one[1], options)))
+        return 0
+    if options.compare:
+        with open(options.compare[0]) as f:
+            old = json.load(f)
+        with open(options.compare[1]) as f:
+            new = json.load(f)
+        report, regressions = compare_results(old, new)
+        print(report)
+        return 1 if regressions else 0
+    results = run_all(options)
+    out = options.out or os.path.join(RESULTS_DIR, datetime.now().strftime("%Y%m%d-%H%M%S") + ".json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w") as f:
+        json.dump(results, f, indent=2)
+    print(format_results(results))
+    print(f"Results saved to {out}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
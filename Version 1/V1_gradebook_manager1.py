@@ -1,4 +1,16 @@
 # Gradebook Manager - Version 1
+import mmap
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+LOG_FILE = "Version 1\gradebook_logs.txt"
+# Sidecar index: one "name<TAB>start<TAB>end" line per summary in the log,
+# giving the byte offsets of each summary block so searches can jump straight to it
+INDEX_FILE = "Version 1\gradebook_logs.idx"
+SEPARATOR = "-" * 40
+# Where "Generate All Summaries" puts one report file per age group
+REPORT_DIR = "Version 1\\reports"
+SHARD_SIZE = 2000  # Students formatted by a worker process in one go
 
 def add_student(gradebook):
     """
@@ -64,45 +76,272 @@ def display_and_save_summary(name, data):
     """
     Display a summary report for a single student and save it to an external file.
     """
+    summary = format_summary(name, data)
     print("\nSummary Report:")
-    print(f"Name: {name}")
-    print(f"Age: {data['age']}")
-    print("Subjects and Scores:")
-    for subject, score in data["subjects"].items():
-        print(f"  {subject}: {score}")
-    avg_score = calculate_average(data)
-    print(f"Average Score: {avg_score:.2f}\n")
+    print(summary + "\n")
 
     # Save the summary to an external file for record-keeping
-    with open("Version 1\gradebook_logs.txt", "a") as file:
-        file.write(f"Name: {name}\n")
-        file.write(f"Age: {data['age']}\n")
-        file.write("Subjects and Scores:\n")
-        for subject, score in data["subjects"].items():
-            file.write(f"  {subject}: {score}\n")
-        file.write(f"Average Score: {avg_score:.2f}\n")
-        file.write("-" * 40 + "\n")
+    summary += "\n" + SEPARATOR + "\n"
+    if not index_is_current():
+        load_index()  # Rebuilds the index if it is missing or out of date
+    with open(LOG_FILE, "ab") as file:
+        start = file.tell()
+        file.write(summary.encode("utf-8"))
+        end = file.tell()
+    # Record where this summary is in the log
+    with open(INDEX_FILE, "a", encoding="utf-8") as file:
+        file.write(f"{name}\t{start}\t{end}\n")
+
+
+def format_summary(name, data):
+    """
+    Build the summary text for one student (the same text is saved in the log).
+    The lines are collected in a list and joined once, instead of adding to a string.
+    """
+    lines = [f"Name: {name}", f"Age: {data['age']}", "Subjects and Scores:"]
+    lines += [f"  {subject}: {score}" for subject, score in data["subjects"].items()]
+    lines.append(f"Average Score: {calculate_average(data):.2f}")
+    return "\n".join(lines)
+
+
+def index_is_current():
+    """
+    Quick check that the last line of the index ends exactly where the log ends.
+    Only reads the end of the index file, not the whole thing.
+    """
+    if not os.path.exists(LOG_FILE) or not os.path.exists(INDEX_FILE):
+        return not os.path.exists(LOG_FILE)
+    with open(INDEX_FILE, "rb") as file:
+        file.seek(max(0, os.path.getsize(INDEX_FILE) - 4096))
+        lines = file.read().splitlines()
+    if not lines:
+        return False
+    try:
+        last_end = int(lines[-1].rsplit(b"\t", 1)[1])
+    except (IndexError, ValueError):
+        return False
+    return last_end == os.path.getsize(LOG_FILE)
+
+
+def rebuild_index():
+    """
+    Scan the whole log once and rewrite the index file from it.
+    Used when there is no index yet, or the log was changed without updating it.
+    Returns the index as a dictionary of name -> list of (start, end) offsets.
+    """
+    index = {}
+    lines = []
+    with open(LOG_FILE, "rb") as file:
+        offset = 0
+        name = None
+        start = 0
+        for line in file:
+            text = line.rstrip(b"\r\n").decode("utf-8", errors="replace")
+            if text.startswith("Name: "):
+                name = text[len("Name: "):]
+                start = offset
+            offset += len(line)
+            if text == SEPARATOR and name is not None:
+                index.setdefault(name, []).append((start, offset))
+                lines.append(f"{name}\t{start}\t{offset}\n")
+                name = None
+    with open(INDEX_FILE, "w", encoding="utf-8") as file:
+        file.writelines(lines)
+    return index
+
+
+def load_index():
+    """
+    Load the summary index from the sidecar file.
+    If the index is missing or doesn't reach the end of the log, it is rebuilt.
+    """
+    if not os.path.exists(LOG_FILE):
+        return {}
+    index = {}
+    last_end = 0
+    try:
+        with open(INDEX_FILE, "r", encoding="utf-8") as file:
+            for line in file:
+                name, start, end = line.rstrip("\n").rsplit("\t", 2)
+                index.setdefault(name, []).append((int(start), int(end)))
+                last_end = max(last_end, int(end))
+    except (FileNotFoundError, ValueError):
+        return rebuild_index()
+    log_size = os.path.getsize(LOG_FILE)
+    # The log was cut short or replaced since the index was written
+    if last_end > log_size or not entries_match(index):
+        return rebuild_index()
+    # Anything left over after the last indexed summary is only whitespace, or the index is stale
+    if last_end != log_size:
+        with open(LOG_FILE, "rb") as file:
+            file.seek(last_end)
+            if file.read().strip():
+                return rebuild_index()
+    return index
+
+
+def entries_match(index):
+    """
+    Check that the first and last summaries in the index are really in the log where it says,
+    which catches a log that was replaced by a different one (even one of the same size).
+    """
+    entries = [(start, end, name) for name, positions in index.items() for start, end in positions]
+    if not entries:
+        return True
+    with open(LOG_FILE, "rb") as file:
+        for start, end, name in (min(entries), max(entries)):
+            file.seek(start)
+            lines = file.read(end - start).decode("utf-8", errors="replace").splitlines()
+            if not lines or lines[0] != f"Name: {name}" or lines[-1] != SEPARATOR:
+                return False
+    return True
+
+
+def read_summary(log, start, end):
+    """
+    Read one summary block out of the memory-mapped log, without the dashed line.
+    """
+    text = log[start:end].decode("utf-8", errors="replace")
+    return text.replace(SEPARATOR, "").strip()
 
 
 def search_student():
     """
     Search for a student's summary in the external file and display it.
+    Uses the index to jump straight to the latest summary for the exact name.
     """
     name = input("Enter the student's name to search: ").strip()  # Get student name to search
     try:
-        with open("Version 1\gradebook_logs.txt", "r") as file:
-            summaries = file.read()  # Read all summaries
-        if name in summaries:   
-            print("\nStudent Summary Found:")
-            start = summaries.find(f"Name: {name}")  # Find start of summary
-            end = summaries.find("-" * 40, start)    # Find end of summary
-            print(summaries[start:end])
-        else:
+        positions = load_index().get(name)
+        if not positions:
             print(f"No summary found for student {name}.")
+            return
+        with open(LOG_FILE, "rb") as file:
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as log:
+                print("\nStudent Summary Found:")
+                start, end = positions[-1]  # The newest summary is the last one added
+                print(read_summary(log, start, end))
+                if len(positions) > 1:
+                    show_all = input(f"Show all {len(positions)} summaries for {name}? (y/n): ").strip().lower()
+                    if show_all == "y":
+                        for number, (start, end) in enumerate(positions, 1):
+                            print(f"\nSummary {number} of {len(positions)}:")
+                            print(read_summary(log, start, end))
     except FileNotFoundError:
         print("No summaries file found. Please add students first.")
 
 
+def parse_summary(text):
+    """
+    Turn one saved summary back into a name and student dictionary.
+    """
+    lines = text.splitlines()
+    name = lines[0][len("Name: "):]
+    subjects = {}
+    for line in lines[3:]:
+        if line.startswith("  "):
+            subject, score = line.strip().rsplit(": ", 1)
+            subjects[subject] = int(score)
+    student = {"age": int(lines[1][len("Age: "):]), "subjects": subjects,
+               "total_score": sum(subjects.values()), "count_scores": len(subjects)}
+    return name, student
+
+
+def write_pdf(path, cards):
+    """
+    Save report cards to a PDF file, one page per student.
+    Needs matplotlib, which is only imported here so the rest of the program doesn't need it.
+    """
+    import matplotlib
+    matplotlib.use("Agg")  # Draw straight to the file, no windows
+    import matplotlib.pyplot as plt
+    from matplotlib.backends.backend_pdf import PdfPages
+    with PdfPages(path) as pdf:
+        for card in cards:
+            figure = plt.figure(figsize=(8.27, 11.69))  # A4
+            figure.text(0.1, 0.9, card, family="monospace", fontsize=11, va="top")
+            pdf.savefig(figure)
+            plt.close(figure)
+
+
+def format_shard(shard_number, positions, pdf_dir=None):
+    """
+    Format the report cards for one shard of students (runs in a worker process).
+    Takes a list of (start, end) offsets of summaries in the log, reads and re-formats
+    each one, and returns a list of (age, text, number of cards) with one block of
+    text per age group. Only the offsets are sent to the worker, not the students,
+    so handing out the work costs almost nothing.
+    If pdf_dir is given, each age group of the shard is also saved as a PDF there.
+    """
+    groups = {}
+    with open(LOG_FILE, "rb") as file:
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as log:
+            for start, end in positions:
+                name, student = parse_summary(read_summary(log, start, end))
+                groups.setdefault(student["age"], []).append(format_summary(name, student))
+    if pdf_dir:
+        for age, cards in groups.items():
+            write_pdf(os.path.join(pdf_dir, f"age_{age}_part{shard_number:05d}.pdf"), cards)
+    ending = "\n" + SEPARATOR + "\n"
+    return [(age, ending.join(cards) + ending, len(cards)) for age, cards in groups.items()]
+
+
+def generate_all_summaries(out_dir=REPORT_DIR, workers=None, pdf=False):
+    """
+    Write a report card for every student in the log (their newest summary),
+    one text file per age group, sorted by name.
+    The students are split into shards that worker processes format at the same time,
+    and only this process writes the text files (in big buffered writes). The shards
+    come back in order, so the files are the same no matter which worker finishes first.
+    With pdf=True the workers also save PDF report cards (in parts) in out_dir/pdf.
+    Returns a dictionary of age -> number of report cards written.
+    """
+    index = load_index()
+    positions = [index[name][-1] for name in sorted(index)]
+    shards = [positions[i:i + SHARD_SIZE] for i in range(0, len(positions), SHARD_SIZE)]
+    os.makedirs(out_dir, exist_ok=True)
+    pdf_dir = os.path.join(out_dir, "pdf") if pdf else None
+    if pdf_dir:
+        os.makedirs(pdf_dir, exist_ok=True)
+    files = {}
+    counts = {}
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            # map() hands back the shards in order, while the workers keep formatting the next ones
+            results = pool.map(format_shard, range(len(shards)), shards, [pdf_dir] * len(shards))
+            for groups in results:
+                for age, text, count in groups:
+                    if age not in files:
+                        path = os.path.join(out_dir, f"age_{age}_summaries.txt")
+                        files[age] = open(path, "w", encoding="utf-8", buffering=1024 * 1024)
+                    files[age].write(text)
+                    counts[age] = counts.get(age, 0) + count
+    finally:
+        for file in files.values():
+            file.close()
+    return counts
+
+
+def generate_summaries_menu():
+    """
+    Generate report cards for every student saved in the log.
+    """
+    if not load_index():
+        print("No summaries file found. Please add students first.")
+        return
+    pdf = input("Also save PDF report cards? (y/n): ").strip().lower() == "y"
+    if pdf:
+        try:
+            import matplotlib  # Only checking it is installed before the workers start
+        except ImportError:
+            print("PDF report cards need matplotlib (pip install matplotlib).")
+            return
+    counts = generate_all_summaries(pdf=pdf)
+    for age in sorted(counts):
+        print(f"  Age {age}: {counts[age]} report cards")
+    print(f"Wrote {sum(counts.values())} report cards to {REPORT_DIR}")
+
+
 def main():
     """
     Main function to run the gradebook manager.
@@ -113,8 +352,9 @@ def main():
         print("\nGradebook Manager")
         print("1. Add/Update Student")
         print("2. Search Student Summary")  
-        print("3. Exit")
-        choice = input("Enter your choice (1-3): ").strip()
+        print("3. Generate All Summaries")
+        print("4. Exit")
+        choice = input("Enter your choice (1-4): ").strip()
         if not choice.isdigit():
             print("Invalid choice. Please enter a numeric value.")
             continue
@@ -124,6 +364,8 @@ def main():
         elif choice == 2:
             search_student()        # Search for student summary
         elif choice == 3:
+            generate_summaries_menu()  # Report cards for the whole school
+        elif choice == 4:
             print("Exiting the program. Goodbye!")
             break
         else:
@@ -1,6 +1,18 @@
 # Student Gradebook Manager – Version 2 
 
 import easygui as eg  # Import the EasyGUI library for GUI dialogs
+import mmap
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+LOG_FILE = "Version 2\gradebook_logs.txt"
+# Sidecar index: one "name<TAB>start<TAB>end" line per summary in the log,
+# giving the byte offsets of each summary block so searches can jump straight to it
+INDEX_FILE = "Version 2\gradebook_logs.idx"
+SEPARATOR = "-" * 40
+# Where "Generate All Summaries" puts one report file per age group
+REPORT_DIR = "Version 2\\reports"
+SHARD_SIZE = 2000  # Students formatted by a worker process in one go
 
 def add_student(gradebook):
     """
@@ -54,20 +66,115 @@ def calculate_average(student_data):
         return 0
     return student_data["total_score"] / student_data["count_scores"]
 
+# Create the summary text for one student (the same text is saved in the log).
+# The lines are collected in a list and joined once, instead of adding to a string.
+def format_summary(name, student_data):
+    lines = [f"Name: {name}", f"Age: {student_data['age']}", "Subjects and Scores:"]
+    lines += [f"  {subject}: {score}" for subject, score in student_data["subjects"].items()]
+    lines.append(f"Average Score: {calculate_average(student_data):.2f}")
+    return "\n".join(lines)
+
 def display_and_save_summary(name, student_data):
-    # Create a summary string for the student
-    summary = f"Name: {name}\nAge: {student_data['age']}\nSubjects and Scores:\n"
-    for subject, score in student_data["subjects"].items():
-        summary += f"  {subject}: {score}\n"
-    avg = calculate_average(student_data)
-    summary += f"Average Score: {avg:.2f}"
+    summary = format_summary(name, student_data)
 
     # Display the summary in a message box
     eg.msgbox(summary, title="Student Summary")
 
-    # Save the summary to an external file
-    with open("Version 2\gradebook_logs.txt", "a") as file:
-        file.write(f"{summary}\n{'-' * 40}\n")
+    # Make sure the index is up to date before adding to it
+    if not index_is_current():
+        load_index()
+    # Save the summary to an external file, noting where it starts and ends
+    with open(LOG_FILE, "ab") as file:
+        start = file.tell()
+        file.write(f"{summary}\n{SEPARATOR}\n".encode("utf-8"))
+        end = file.tell()
+    with open(INDEX_FILE, "a", encoding="utf-8") as file:
+        file.write(f"{name}\t{start}\t{end}\n")
+
+# Quick check that the last line of the index ends exactly where the log ends.
+# Only reads the end of the index file, not the whole thing.
+def index_is_current():
+    if not os.path.exists(LOG_FILE) or not os.path.exists(INDEX_FILE):
+        return not os.path.exists(LOG_FILE)
+    with open(INDEX_FILE, "rb") as file:
+        file.seek(max(0, os.path.getsize(INDEX_FILE) - 4096))
+        lines = file.read().splitlines()
+    if not lines:
+        return False
+    try:
+        last_end = int(lines[-1].rsplit(b"\t", 1)[1])
+    except (IndexError, ValueError):
+        return False
+    return last_end == os.path.getsize(LOG_FILE)
+
+# Scan the whole log once and rewrite the index file from it.
+# Used when there is no index yet, or the log was changed without updating it.
+def rebuild_index():
+    index = {}
+    lines = []
+    with open(LOG_FILE, "rb") as file:
+        offset = 0
+        name = None
+        start = 0
+        for line in file:
+            text = line.rstrip(b"\r\n").decode("utf-8", errors="replace")
+            if text.startswith("Name: "):
+                name = text[len("Name: "):]
+                start = offset
+            offset += len(line)
+            if text == SEPARATOR and name is not None:
+                index.setdefault(name, []).append((start, offset))
+                lines.append(f"{name}\t{start}\t{offset}\n")
+                name = None
+    with open(INDEX_FILE, "w", encoding="utf-8") as file:
+        file.writelines(lines)
+    return index
+
+# Load the index as a dict of name -> list of (start, end) offsets.
+# If the index is missing or doesn't reach the end of the log, it is rebuilt.
+def load_index():
+    if not os.path.exists(LOG_FILE):
+        return {}
+    index = {}
+    last_end = 0
+    try:
+        with open(INDEX_FILE, "r", encoding="utf-8") as file:
+            for line in file:
+                name, start, end = line.rstrip("\n").rsplit("\t", 2)
+                index.setdefault(name, []).append((int(start), int(end)))
+                last_end = max(last_end, int(end))
+    except (FileNotFoundError, ValueError):
+        return rebuild_index()
+    log_size = os.path.getsize(LOG_FILE)
+    # The log was cut short or replaced since the index was written
+    if last_end > log_size or not entries_match(index):
+        return rebuild_index()
+    # Anything left over after the last indexed summary is only whitespace, or the index is stale
+    if last_end != log_size:
+        with open(LOG_FILE, "rb") as file:
+            file.seek(last_end)
+            if file.read().strip():
+                return rebuild_index()
+    return index
+
+# Check that the first and last summaries in the index are really in the log where it says,
+# which catches a log that was replaced by a different one (even one of the same size)
+def entries_match(index):
+    entries = [(start, end, name) for name, positions in index.items() for start, end in positions]
+    if not entries:
+        return True
+    with open(LOG_FILE, "rb") as file:
+        for start, end, name in (min(entries), max(entries)):
+            file.seek(start)
+            lines = file.read(end - start).decode("utf-8", errors="replace").splitlines()
+            if not lines or lines[0] != f"Name: {name}" or lines[-1] != SEPARATOR:
+                return False
+    return True
+
+# Read one summary block out of the memory-mapped log, without the dashed line
+def read_summary(log, start, end):
+    text = log[start:end].decode("utf-8", errors="replace")
+    return text.replace(SEPARATOR, "").strip()
 
 def search_student():
     # Prompt user to enter the student's name to search
@@ -75,30 +182,134 @@ def search_student():
     if not name:
         return
     try:
-        # Read summaries from the log file
-        with open("Version 2\gradebook_logs.txt", "r") as file:
-            summaries = file.read()
-        # Search for the student's summary
-        if name in summaries:
-            start = summaries.find(f"Name: {name}")
-            end = summaries.find("-" * 40, start)
-            result = summaries[start:end] if end != -1 else summaries[start:]
-            eg.msgbox(result.strip(), title="Search Result")
-        else:
+        # Look up where this exact name's summaries are in the log
+        positions = load_index().get(name)
+        if not positions:
             eg.msgbox(f"No summary found for student '{name}'.")
+            return
+        with open(LOG_FILE, "rb") as file:
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as log:
+                # The newest summary is the last one added
+                start, end = positions[-1]
+                result = read_summary(log, start, end)
+                if len(positions) == 1:
+                    eg.msgbox(result, title="Search Result")
+                    return
+                message = f"{result}\n\n{name} has {len(positions)} saved summaries. Show them all?"
+                if eg.ynbox(message, title="Search Result"):
+                    all_summaries = f"\n{SEPARATOR}\n".join(read_summary(log, start, end) for start, end in positions)
+                    eg.textbox(f"All summaries for {name} (oldest first):", title="Search Result", text=all_summaries)
     except FileNotFoundError:
         eg.msgbox("No summaries file found. Please add students first.")
 
+# Turn one saved summary back into a name and student dict
+def parse_summary(text):
+    lines = text.splitlines()
+    name = lines[0][len("Name: "):]
+    subjects = {}
+    for line in lines[3:]:
+        if line.startswith("  "):
+            subject, score = line.strip().rsplit(": ", 1)
+            subjects[subject] = int(score)
+    student_data = {"age": int(lines[1][len("Age: "):]), "subjects": subjects,
+                    "total_score": sum(subjects.values()), "count_scores": len(subjects)}
+    return name, student_data
+
+# Save report cards to a PDF file, one page per student.
+# Needs matplotlib, which is only imported here so the rest of the program doesn't need it.
+def write_pdf(path, cards):
+    import matplotlib
+    matplotlib.use("Agg")  # Draw straight to the file, no windows
+    import matplotlib.pyplot as plt
+    from matplotlib.backends.backend_pdf import PdfPages
+    with PdfPages(path) as pdf:
+        for card in cards:
+            figure = plt.figure(figsize=(8.27, 11.69))  # A4
+            figure.text(0.1, 0.9, card, family="monospace", fontsize=11, va="top")
+            pdf.savefig(figure)
+            plt.close(figure)
+
+# Format the report cards for one shard of students (runs in a worker process).
+# Takes a list of (start, end) offsets of summaries in the log, reads and re-formats
+# each one, and returns a list of (age, text, number of cards) with one block of
+# text per age group. Only the offsets are sent to the worker, not the students,
+# so handing out the work costs almost nothing.
+# If pdf_dir is given, each age group of the shard is also saved as a PDF there.
+def format_shard(shard_number, positions, pdf_dir=None):
+    groups = {}
+    with open(LOG_FILE, "rb") as file:
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as log:
+            for start, end in positions:
+                name, student_data = parse_summary(read_summary(log, start, end))
+                groups.setdefault(student_data["age"], []).append(format_summary(name, student_data))
+    if pdf_dir:
+        for age, cards in groups.items():
+            write_pdf(os.path.join(pdf_dir, f"age_{age}_part{shard_number:05d}.pdf"), cards)
+    ending = "\n" + SEPARATOR + "\n"
+    return [(age, ending.join(cards) + ending, len(cards)) for age, cards in groups.items()]
+
+# Write a report card for every student in the log (their newest summary),
+# one text file per age group, sorted by name.
+# The students are split into shards that worker processes format at the same time,
+# and only this process writes the text files (in big buffered writes). The shards
+# come back in order, so the files are the same no matter which worker finishes first.
+# With pdf=True the workers also save PDF report cards (in parts) in out_dir/pdf.
+# Returns a dict of age -> number of report cards written.
+def generate_all_summaries(out_dir=REPORT_DIR, workers=None, pdf=False):
+    index = load_index()
+    positions = [index[name][-1] for name in sorted(index)]
+    shards = [positions[i:i + SHARD_SIZE] for i in range(0, len(positions), SHARD_SIZE)]
+    os.makedirs(out_dir, exist_ok=True)
+    pdf_dir = os.path.join(out_dir, "pdf") if pdf else None
+    if pdf_dir:
+        os.makedirs(pdf_dir, exist_ok=True)
+    files = {}
+    counts = {}
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            # map() hands back the shards in order, while the workers keep formatting the next ones
+            results = pool.map(format_shard, range(len(shards)), shards, [pdf_dir] * len(shards))
+            for groups in results:
+                for age, text, count in groups:
+                    if age not in files:
+                        path = os.path.join(out_dir, f"age_{age}_summaries.txt")
+                        files[age] = open(path, "w", encoding="utf-8", buffering=1024 * 1024)
+                    files[age].write(text)
+                    counts[age] = counts.get(age, 0) + count
+    finally:
+        for file in files.values():
+            file.close()
+    return counts
+
+# Generate report cards for every student saved in the log
+def generate_summaries_menu():
+    if not load_index():
+        eg.msgbox("No summaries file found. Please add students first.")
+        return
+    pdf = eg.ynbox("Also save PDF report cards?", title="Generate All Summaries")
+    if pdf:
+        try:
+            import matplotlib  # Only checking it is installed before the workers start
+        except ImportError:
+            eg.msgbox("PDF report cards need matplotlib (pip install matplotlib).")
+            return
+    counts = generate_all_summaries(pdf=pdf)
+    lines = [f"Age {age}: {counts[age]} report cards" for age in sorted(counts)]
+    lines.append(f"\nWrote {sum(counts.values())} report cards to {REPORT_DIR}")
+    eg.msgbox("\n".join(lines), title="Generate All Summaries")
+
 def main():
     # Main program loop
     gradebook = {}
     while True:
         # Show main menu options
-        choice = eg.buttonbox("Choose an option:", choices=["Add/Update Student", "Search Student Summary", "Exit"], title="Student Gradebook Manager")
+        choice = eg.buttonbox("Choose an option:", choices=["Add/Update Student", "Search Student Summary", "Generate All Summaries", "Exit"], title="Student Gradebook Manager")
         if choice == "Add/Update Student":
             add_student(gradebook)
         elif choice == "Search Student Summary":
             search_student()
+        elif choice == "Generate All Summaries":
+            generate_summaries_menu()
         elif choice == "Exit":
             eg.msgbox("Exiting the program. Goodbye!")
             break
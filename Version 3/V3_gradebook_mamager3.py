@@ -118,6 +118,11 @@ def search_student(gradebook):
     student_name = eg.enterbox("Enter the student's name to search:")
     if not student_name:
         return
+    # Try the name exactly as typed first, this is a direct dict lookup
+    if student_name in gradebook:
+        display_summary(student_name, gradebook[student_name])
+        return
+    # Names are stored as typed, so fall back to a case-insensitive check
     for name in gradebook:
         if name.lower() == student_name.lower():
             display_summary(name, gradebook[name])  # Use the actual key
@@ -1,209 +1,361 @@
-# Student Gradebook Manager – Version 4 
-import json
+# Student Gradebook Manager – Version 4
+# The easygui screens. All the checking, indexes and saving is done by the
+# GradeBook in gradebook_core.py, these functions just ask and show.
+import os
+import tempfile
 import easygui as eg
-import pandas as pd
-import matplotlib.pyplot as plt
+import gradebook_charts as charts
+import gradebook_core as core
+import gradebook_import as importer
+import gradebook_metrics as metrics
+import gradebook_paging as paging
+import gradebook_rules as rules
+from gradebook_core import calculate_average
+from gradebook_rules import AGE_MIN, AGE_MAX, SCORE_MIN, SCORE_MAX
 
-# Constants
-AGE_MIN = 7
-AGE_MAX = 18
-SCORE_MIN = 0
-SCORE_MAX = 100
+MAX_RANKED = 500  # Students listed at most for a score range
 
-# Load the gradebook data from a JSON file, or return an empty dict if file not found
-def load_gradebook():
+# Tell the user when another teacher changed the same student while they were editing
+def warn_about_conflicts(conflicts):
+    if conflicts:
+        names = ", ".join(sorted(set(name.title() for name in conflicts)))
+        eg.msgbox(f"{names} was also changed by someone else just now. "
+                  "Both sets of changes have been kept; yours were saved last.", title="Shared Gradebook")
+
+# Display a summary of a student's info with a chart of their scores.
+# The summary and chart come from the gradebook's cache if the student was shown recently.
+def display_summary_and_plot(book, name):
+    summary = book.summary(name)
+    # Ranks change whenever anyone's scores do, so they are looked up each time (not cached)
+    rank = book.rank(name)
+    if rank:
+        summary += (f"\nRank: {rank['rank']} of {rank['out_of']} "
+                    f"(higher than {rank['percentile']:.0f}% of students)")
+    if not book.student(name)["subjects"]:
+        with metrics.span("summary_dialog"):
+            eg.msgbox(summary, title="Student Summary")
+        return
+    with metrics.span("plot"):
+        # easygui shows images from a file, so put the chart in a temporary one
+        with tempfile.NamedTemporaryFile(suffix=".png", delete=False) as image_file:
+            image_file.write(book.chart_image(name))
     try:
-        with open("Version 4 resit/gradebook_logs.json", "r") as f:
-            return json.load(f)
-    except FileNotFoundError:
-        return {}
-
-# Save the gradebook data to a JSON file
-def save_gradebook(gradebook):
-    with open("Version 4 resit/gradebook_logs.json", "w") as f:
-        json.dump(gradebook, f, indent=2)
-
-# Calculate the average score for a student
-def calculate_average(student_data):
-    if student_data["count_scores"] == 0:
-        return 0
-    return student_data["total_score"] / student_data["count_scores"]
-
-# Display a summary of a student's info and plot their scores
-def display_summary_and_plot(name, student_data):
-    subjects = student_data["subjects"]
-    summary = f"Name: {name}\nAge: {student_data['age']}\nSubjects and Scores:\n"
-    for subject, score in subjects.items():
-        summary += f"  {subject}: {score}\n"
-    avg = calculate_average(student_data)
-    summary += f"Average Score: {avg:.2f}"
-    eg.msgbox(summary, title="Student Summary")
-
-    # Plot the student's scores if there are any subjects
-    if subjects:
-        # Convert subjects dict to DataFrame for easier plotting
-        df = pd.DataFrame(subjects.items(), columns=["Subject", "Score"])
-        plt.figure(figsize=(8, 4))
-        plt.bar(df["Subject"], df["Score"], color="skyblue")
-        plt.title(f"{name}'s Scores")
-        plt.xlabel("Subject")
-        plt.ylabel("Score")
-        plt.ylim(0, 100)
-        plt.tight_layout()
-        plt.show()
+        with metrics.span("summary_dialog"):
+            eg.msgbox(summary, title="Student Summary", image=image_file.name)
+    finally:
+        os.remove(image_file.name)
 
 # Add a new student or update an existing student's info and scores
-def add_student(gradebook):
+def add_student(book):
     name = eg.enterbox("Enter student's name:")
     if not name:
         eg.msgbox("Name cannot be blank.")
         return
-    name = name.strip().lower()  # Make name case-insensitive
+    name = rules.clean_name(name)  # Make name case-insensitive
 
-    if name in gradebook:
+    if name in book:
         eg.msgbox(f"Student {name.title()} already exists. You can add or update their scores.")
     else:
         while True:
             age_input = eg.enterbox(f"Enter student's age ({AGE_MIN}-{AGE_MAX}):")
-            # Validate age input: must be a digit and within a reasonable range
-            if not age_input or not age_input.isdigit():
-                eg.msgbox("Invalid input. Please enter a number.")
-                continue
-            age = int(age_input)
-            if age < AGE_MIN or age > AGE_MAX:
-                eg.msgbox(f"Age must be between {AGE_MIN} and {AGE_MAX}.")
+            # The age is checked by the gradebook: must be a number within the allowed range
+            try:
+                warn_about_conflicts(book.add_student(name, age_input))
+            except core.GradebookError as error:
+                eg.msgbox(str(error))
                 continue
             break
-        # Initialize student data structure
-        gradebook[name] = {"age": age, "subjects": {}, "total_score": 0, "count_scores": 0}
 
     # Loop to add subjects and scores
     while True:
         subject = eg.enterbox("Enter subject name (or leave blank to finish):")
         if not subject:
             break
-        subject = subject.strip().lower()  # Make subject case-insensitive
+        subject = rules.clean_name(subject)  # Make subject case-insensitive
         while True:
             score_input = eg.enterbox(f"Enter score for {subject.title()} ({SCORE_MIN}-{SCORE_MAX}):")
-            # Validate score input
-            if not score_input or not score_input.isdigit():
-                eg.msgbox("Invalid input. Please enter a number.")
-                continue
-            score = int(score_input)
-            if score < SCORE_MIN or score > SCORE_MAX:
-                eg.msgbox(f"Score must be between {SCORE_MIN} and {SCORE_MAX}.")
+            # Store the score (total and count are updated with it), if it is valid
+            try:
+                book.set_score(name, subject, score_input)
+            except core.GradebookError as error:
+                eg.msgbox(str(error))
                 continue
             break
-        gradebook[name]["subjects"][subject] = score
-        # Update total and count for average calculation
-        gradebook[name]["total_score"] = sum(gradebook[name]["subjects"].values())
-        gradebook[name]["count_scores"] = len(gradebook[name]["subjects"])
 
     eg.msgbox(f"Student {name.title()} updated successfully!")
-    save_gradebook(gradebook)
 
 # Edit an existing student's age or subjects/scores, or delete subjects
-def edit_student(gradebook):
+def edit_student(book):
     name = eg.enterbox("Enter the student’s name to edit:")
     if not name:
         return
-    name = name.strip().lower()
-    if name not in gradebook:
+    name = rules.clean_name(name)
+    if name not in book:
         eg.msgbox(f"{name.title()} not found.")
         return
 
-    student = gradebook[name]
+    student = book.student(name)
+    # Remember which version of the student we showed, to spot edits by someone else
+    seen_version = student.get("version", 0)
     # Loop to edit age
     while True:
         age_input = eg.enterbox(f"Current age is {student['age']}. Enter new age or leave blank:")
         if not age_input:
             eg.msgbox("Age not changed.")
             break
-        if age_input.isdigit():
-            new_age = int(age_input)
-            if AGE_MIN <= new_age <= AGE_MAX:
-                student['age'] = new_age
-                break
-            else:
-                eg.msgbox(f"Age must be between {AGE_MIN} and {AGE_MAX}.")
-        else:
-            eg.msgbox("Invalid age input.")
-            
+        try:
+            warn_about_conflicts(book.set_age(name, age_input, seen_version))
+        except core.GradebookError as error:
+            eg.msgbox(str(error))
+            continue
+        student = book.student(name)
+        seen_version = student["version"]
+        break
 
     # Loop to edit or delete subjects
     while True:
         subject = eg.enterbox("Enter subject to edit or delete (or leave blank to finish):")
         if not subject:
             break
-        subject = subject.strip().lower()
+        subject = rules.clean_name(subject)
         if subject not in student['subjects']:
             eg.msgbox("Subject not found.")
             continue
         while True:
             score_input = eg.enterbox(f"Current score is {student['subjects'][subject]}. Enter new score or leave blank to delete:")
-            # If blank, delete the subject
-            if not score_input:
-                del student['subjects'][subject]
-                break
-            # If valid score, update it
-            elif score_input.isdigit():
-                score = int(score_input)
-                if SCORE_MIN <= score <= SCORE_MAX:
-                    student['subjects'][subject] = score
-                    break
+            try:
+                # If blank, delete the subject, otherwise update it if the score is valid
+                if not score_input:
+                    conflicts = book.delete_subject(name, subject, seen_version)
                 else:
-                    eg.msgbox(f"Invalid score, score must be between {SCORE_MIN} and {SCORE_MAX}.")
-            else:
-                eg.msgbox(f"Invalid score, score must be an integer and between {SCORE_MIN} and {SCORE_MAX}.")
-
-    # Update total and count after editing
-    student['total_score'] = sum(student['subjects'].values())
-    student['count_scores'] = len(student['subjects'])
-    save_gradebook(gradebook)
+                    conflicts = book.set_score(name, subject, score_input, seen_version)
+            except core.GradebookError as error:
+                eg.msgbox(str(error))
+                continue
+            warn_about_conflicts(conflicts)
+            # The gradebook may have been reloaded while saving, so look the student up again
+            student = book.student(name)
+            seen_version = student["version"]
+            break
+
+    # Each change was already saved by the gradebook
     eg.msgbox(f"Student {name.title()} updated.")
 
-# Search for a student by name and display their summary and plot
-def search_student(gradebook):
+# Search for a student by name and display their summary and plot.
+# If there is no exact match, offer names that start with what was typed
+# or are spelt nearly the same.
+def search_student(book):
     student_name = eg.enterbox("Enter the student's name to search:")
     if not student_name:
         return
-    student_name = student_name.strip().lower()
-    for name in gradebook:
-        if name == student_name:
-            display_summary_and_plot(name.title(), gradebook[name])
+    student_name = rules.clean_name(student_name)
+    # Names are the dict keys, so an exact match is a direct lookup
+    if student_name in book:
+        display_summary_and_plot(book, student_name)
+        return
+    matches = book.search(student_name)
+    if not matches:
+        eg.msgbox(f"No summary found for student '{student_name.title()}'.")
+        return
+    if len(matches) == 1:
+        if eg.ynbox(f"No exact match. Did you mean {matches[0].title()}?", title="Search Student"):
+            display_summary_and_plot(book, matches[0])
+        return
+    choice = eg.choicebox(f"No exact match for '{student_name.title()}'. Did you mean:",
+                          title="Search Student", choices=[name.title() for name in matches])
+    if choice:
+        display_summary_and_plot(book, choice)
+
+# Show everyone who took a subject, the subject average and the top scorers
+def subject_report(book):
+    subject = eg.enterbox("Enter the subject name:")
+    if not subject:
+        return
+    subject = rules.clean_name(subject)
+    # Count, average, lowest and highest come straight from the running totals
+    summary = book.subject_report(subject)
+    if summary is None:
+        eg.msgbox(f"No students have a score for {subject.title()}.")
+        return
+    report = (f"Subject: {subject.title()}\nStudents: {summary['count']}\nAverage Score: {summary['average']:.2f}\n"
+              f"Lowest Score: {summary['lowest']}\nHighest Score: {summary['highest']}\n\nTop Scores:\n")
+    for name, score in summary["top"]:
+        report += f"  {name.title()}: {score}\n"
+    report += "\nAll Students:\n"
+    report += "\n".join(f"  {name.title()}: {score}" for name, score in summary["roster"])
+    eg.textbox(f"{subject.title()} Report", text=report)
+
+# Import scores from a CSV or JSON-lines file instead of typing them in.
+# Each batch of rows is applied and saved in one go.
+def import_scores(book):
+    path = eg.fileopenbox("Choose a CSV or JSON-lines file of scores (name, age, subject, score):",
+                          filetypes=["*.csv", "*.jsonl"])
+    if not path:
+        return
+    try:
+        report = book.import_file(path)
+    except (OSError, UnicodeDecodeError) as error:
+        eg.msgbox(f"Could not read {path}: {error}")
+        return
+    eg.msgbox(importer.format_report(report), title="Import Scores")
+
+# Show whole-school statistics: averages, spreads and grade bands for
+# every subject, and the top students by average
+def class_statistics(book):
+    if not len(book):
+        eg.msgbox("No students in the gradebook.")
+        return
+    eg.textbox("Class Statistics", text=book.class_statistics())
+
+# Ask for an optional age range and subject to filter the student list by.
+# Returns a new pager, or None if the filter was cancelled or invalid.
+def filter_students(book):
+    values = eg.multenterbox("Leave a box blank for no filter.", title="Filter Students",
+                             fields=[f"Minimum age ({AGE_MIN}-{AGE_MAX})", f"Maximum age ({AGE_MIN}-{AGE_MAX})", "Subject"])
+    if values is None:
+        return None
+    ages = []
+    for age_input in values[:2]:
+        if not age_input.strip():
+            ages.append(None)
+            continue
+        age, error = rules.check_age(age_input)
+        if error:
+            eg.msgbox(error)
+            return None
+        ages.append(age)
+    return book.pager(ages[0], ages[1], values[2])
+
+# Show the top students by average or in one subject, or everyone within a score range
+def show_rankings(book):
+    values = eg.multenterbox("Leave the subject blank to rank by average, and both scores blank for the top students.",
+                             title="Rankings", fields=["Subject", f"Lowest score ({SCORE_MIN}-{SCORE_MAX})",
+                                                       f"Highest score ({SCORE_MIN}-{SCORE_MAX})"])
+    if values is None:
+        return
+    subject, low, high = values
+    subject = rules.clean_name(subject)
+    heading = f"{subject.title()} scores" if subject else "Averages"
+    if not low.strip() and not high.strip():
+        lines = [f"{rank}. {name.title()}: {value:g}" for rank, name, value in book.top_students(paging.PAGE_SIZE, subject)]
+        heading = f"Top {paging.PAGE_SIZE} - {heading}"
+    else:
+        try:
+            students = book.students_between(low, high, subject, limit=MAX_RANKED + 1)
+        except core.GradebookError as error:
+            eg.msgbox(str(error))
             return
-    eg.msgbox(f"No summary found for student '{student_name.title()}'.")
+        lines = [f"{name.title()}: {value:g}" for name, value in students[:MAX_RANKED]]
+        if len(students) > MAX_RANKED:
+            lines.append(f"... only the first {MAX_RANKED} are shown")
+        heading = f"{heading} from {low.strip() or SCORE_MIN} to {high.strip() or SCORE_MAX}"
+    eg.textbox(heading, title="Rankings", text="\n".join(lines) or "No students have scores in this range.")
+
+# Save a chart file for every student (without showing them), for report cards.
+# Students whose scores haven't changed since the last run are skipped.
+def render_all_charts(book):
+    file_format = eg.buttonbox("Choose a file format for the charts:", title="Render All Charts",
+                               choices=[file_format.upper() for file_format in charts.FORMATS])
+    if not file_format:
+        return
+    out_dir = eg.diropenbox("Choose a folder for the charts:", default=charts.CHART_DIR)
+    if not out_dir:
+        return
+    result = book.render_all_charts(out_dir, file_format.lower())
+    eg.msgbox(f"Rendered {result['rendered']} charts and skipped {result['skipped']} unchanged ones.\n"
+              f"Charts saved in: {result['out_dir']}", title="Render All Charts")
 
-# View a list of all students in the gradebook
-def view_all_students(gradebook):
-    if not gradebook:
+# View a list of all students in the gradebook, one page at a time
+def view_all_students(book):
+    if not len(book):
         eg.msgbox("No students in the gradebook.")
         return
-    # Show all student names (keys of the gradebook)
-    student_list = "\n".join(name.title() for name in gradebook.keys())
-    eg.textbox("All Students:", text=student_list)
+    # The search index already keeps the names sorted, so no sorting is needed here
+    pager = book.pager()
+    page_number = 0
+    while True:
+        names, has_next = paging.get_page(pager, page_number)
+        total_pages = paging.page_count(pager)
+        heading = f"Page {page_number + 1}" + (f" of {total_pages}" if total_pages else "")
+        student_list = "\n".join(name.title() for name in names) or "No students match this filter."
+        choices = []
+        if page_number > 0:
+            choices.append("Previous")
+        if has_next:
+            choices.append("Next")
+        choices += ["Filter", "Rankings", "Close"]
+        choice = eg.buttonbox(f"{heading}\n\n{student_list}", title="All Students", choices=choices)
+        if choice == "Previous":
+            page_number -= 1
+        elif choice == "Next":
+            page_number += 1
+        elif choice == "Filter":
+            new_pager = filter_students(book)
+            if new_pager is not None:
+                pager = new_pager
+                page_number = 0
+        elif choice == "Rankings":
+            show_rankings(book)
+        else:
+            break
 
 # Main program loop: show menu and call functions based on user choice
 def main():
-    gradebook = load_gradebook()
+    # Timings and profiles, only if GRADEBOOK_METRICS or GRADEBOOK_PROFILE is set
+    metrics.start()
+    # Loads the gradebook from the storage backend (JSON snapshot + journal, or SQLite).
+    # Changes are saved in the background, so the screens never wait for the disk.
+    book = core.GradeBook(write_behind=True)
     while True:
-        choice = eg.buttonbox("Choose an option:", choices=[
-            "Add/Update Student",
-            "Edit/Delete Student",
-            "Search Student",
-            "View All Students",
-            "Exit"
-        ], title="Student Gradebook Manager")
+        # Pick up anything other teachers have saved since the last screen
+        # (skipped this time round if a save is writing to the disk right now)
+        book.sync(wait=False)
+        try:
+            book.check_saving()
+        except Exception as error:  # Disk full, file in use, ...
+            eg.msgbox(f"Your latest changes couldn't be saved yet ({error}). "
+                      "They will be tried again.", title="Saving")
+        warn_about_conflicts(book.take_late_conflicts())
+        # Small dashboard from the running totals, no need to look at every student
+        totals = book.dashboard()
+        dashboard = (f"Students: {totals['students']}   Scores: {totals['scores']}   "
+                     f"School average: {totals['average']:.2f}")
+        with metrics.span("menu_dialog"):
+            choice = eg.buttonbox(f"{dashboard}\n\nChoose an option:", choices=[
+                "Add/Update Student",
+                "Edit/Delete Student",
+                "Search Student",
+                "View All Students",
+                "Subject Report",
+                "Import Scores",
+                "Class Statistics",
+                "Render All Charts",
+                "Exit"
+            ], title="Student Gradebook Manager")
         if choice == "Add/Update Student":
-            add_student(gradebook)
+            add_student(book)
         elif choice == "Edit/Delete Student":
-            edit_student(gradebook)
+            edit_student(book)
         elif choice == "Search Student":
-            search_student(gradebook)
+            search_student(book)
         elif choice == "View All Students":
-            view_all_students(gradebook)
+            view_all_students(book)
+        elif choice == "Subject Report":
+            subject_report(book)
+        elif choice == "Import Scores":
+            import_scores(book)
+        elif choice == "Class Statistics":
+            class_statistics(book)
+        elif choice == "Render All Charts":
+            render_all_charts(book)
         elif choice == "Exit":
-            save_gradebook(gradebook)
+            # Wait for the background saver to finish before leaving
+            try:
+                book.flush()
+            except Exception as error:
+                eg.msgbox(f"Your latest changes couldn't be saved ({error}). Please try again.", title="Saving")
+                continue
+            book.close()
             eg.msgbox("Exiting the program. Goodbye!")
             break
 
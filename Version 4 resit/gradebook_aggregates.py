@@ -0,0 +1,80 @@
+# Student Gradebook Manager – Version 4 running totals
+# Keeps class-wide numbers up to date as each change is made, so the menu and
+# subject reports can show them straight away without adding up every score:
+#   - number of students, number of scores and the total of all scores
+#   - for each subject: count, total and a tally of how many students got
+#     each possible score (0-100), which gives the lowest and highest score
+#     even after scores are deleted, by checking at most 101 tallies
+from gradebook_rules import SCORE_MIN, SCORE_MAX
+
+# Build the running totals from a whole gradebook (used once after loading)
+def build_aggregates(gradebook):
+    aggregates = {"students": 0, "count": 0, "total": 0, "subjects": {}}
+    for student in gradebook.values():
+        aggregates["students"] += 1
+        for subject, score in student["subjects"].items():
+            add_score(aggregates, subject, score)
+    return aggregates
+
+# Count one score into the totals
+def add_score(aggregates, subject, score):
+    stats = aggregates["subjects"].get(subject)
+    if stats is None:
+        stats = {"count": 0, "total": 0, "tally": [0] * (SCORE_MAX - SCORE_MIN + 1)}
+        aggregates["subjects"][subject] = stats
+    stats["count"] += 1
+    stats["total"] += score
+    stats["tally"][score - SCORE_MIN] += 1
+    aggregates["count"] += 1
+    aggregates["total"] += score
+
+# Take one score back out of the totals
+def remove_score(aggregates, subject, score):
+    stats = aggregates["subjects"][subject]
+    stats["count"] -= 1
+    stats["total"] -= score
+    stats["tally"][score - SCORE_MIN] -= 1
+    if stats["count"] == 0:
+        del aggregates["subjects"][subject]
+    aggregates["count"] -= 1
+    aggregates["total"] -= score
+
+# Update the totals for one journal change record.
+# Like the subject index, this is called before the change is applied so the old score is still there.
+def update_aggregates(aggregates, gradebook, change):
+    op = change["op"]
+    student = gradebook.get(change["name"])
+    if op == "add_student":
+        if student is None:
+            aggregates["students"] += 1
+        else:
+            # Re-adding a student starts them again with no scores
+            for subject, score in student["subjects"].items():
+                remove_score(aggregates, subject, score)
+    elif student is None:
+        return
+    elif op == "set_score":
+        old_score = student["subjects"].get(change["subject"])
+        if old_score is not None:
+            remove_score(aggregates, change["subject"], old_score)
+        add_score(aggregates, change["subject"], change["score"])
+    elif op == "delete_subject":
+        old_score = student["subjects"].get(change["subject"])
+        if old_score is not None:
+            remove_score(aggregates, change["subject"], old_score)
+
+# Average of every score in the school, or 0 if there are none
+def school_average(aggregates):
+    if aggregates["count"] == 0:
+        return 0
+    return aggregates["total"] / aggregates["count"]
+
+# Return (count, average, lowest, highest) for a subject, or None if nobody has taken it
+def subject_summary(aggregates, subject):
+    stats = aggregates["subjects"].get(subject)
+    if stats is None:
+        return None
+    tally = stats["tally"]
+    lowest = next(score for score, count in enumerate(tally) if count) + SCORE_MIN
+    highest = SCORE_MAX - next(score for score, count in enumerate(reversed(tally)) if count)
+    return stats["count"], stats["total"] / stats["count"], lowest, highest
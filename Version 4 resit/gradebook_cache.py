@@ -0,0 +1,47 @@
+# Student Gradebook Manager – Version 4 cache
+# Keeps the summary text, average and chart image of the students looked up
+# most recently, so showing the same popular students again and again (like at
+# parent-teacher evenings) doesn't format the text or draw the chart again.
+#   - entries are kept per student, with the student's version when they were made
+#   - an entry made for an older version is never handed back
+#   - the GradeBook also forgets a student as soon as they are changed
+#   - only the MAX_STUDENTS most recently used students are kept
+from collections import OrderedDict
+import gradebook_metrics as metrics
+
+MAX_STUDENTS = 256
+
+# Least-recently-used cache of {name: (version, {kind: value})}
+class LRUCache:
+    def __init__(self, max_students=MAX_STUDENTS):
+        self.max_students = max_students
+        self.entries = OrderedDict()
+
+    # The cached value, or None if there isn't one for this version of the student
+    def get(self, name, version, kind):
+        entry = self.entries.get(name)
+        if entry is None or entry[0] != version or kind not in entry[1]:
+            metrics.count("cache_misses")
+            return None
+        self.entries.move_to_end(name)
+        metrics.count("cache_hits")
+        return entry[1][kind]
+
+    def put(self, name, version, kind, value):
+        entry = self.entries.get(name)
+        if entry is None or entry[0] != version:
+            entry = self.entries[name] = (version, {})
+        entry[1][kind] = value
+        self.entries.move_to_end(name)
+        if len(self.entries) > self.max_students:
+            self.entries.popitem(last=False)
+
+    # Drop everything cached for a student (they have been changed)
+    def forget(self, name):
+        self.entries.pop(name, None)
+
+    def clear(self):
+        self.entries.clear()
+
+    def __len__(self):
+        return len(self.entries)
@@ -0,0 +1,141 @@
+# Student Gradebook Manager – Version 4 batch chart renderer
+# Saves a score chart for every student as a PNG, SVG or PDF file without
+# opening any windows, for printing report cards.
+#   - charts are drawn with matplotlib's Agg backend, never plt.show()
+#   - each worker process makes one figure and reuses it for every student
+#   - students are split across a process pool
+#   - a hash of each student's data is saved, so students whose scores have
+#     not changed since the last run are skipped
+import hashlib
+import io
+import json
+import os
+import re
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+CHART_DIR = "Version 4 resit/charts"
+HASH_FILE_NAME = "chart_hashes.json"
+FORMATS = ["png", "svg", "pdf"]
+JOBS_PER_TASK = 50  # Students sent to a worker at a time
+
+# The figure and axes each worker process reuses (set up by start_worker)
+worker_figure = None
+worker_axes = None
+
+# Draw a student's scores as a bar chart on the given axes
+def draw_scores(axes, name, subjects):
+    axes.bar(list(subjects.keys()), list(subjects.values()), color="skyblue")
+    axes.set_title(f"{name}'s Scores")
+    axes.set_xlabel("Subject")
+    axes.set_ylabel("Score")
+    axes.set_ylim(0, 100)
+
+# Turn a student name into a safe file name, e.g. "mary-jane o'neil" -> "mary_jane_o_neil_3f1c2a9b".
+# Letters with accents are kept. The end is a hash of the exact name, so names that
+# only differ in punctuation ("mary-jane" and "mary jane") get different files.
+def chart_file_name(name, file_format):
+    readable = re.sub(r"[\W_]+", "_", name.lower()).strip("_")
+    name_hash = hashlib.sha1(name.encode("utf-8")).hexdigest()[:8]
+    return f"{readable}_{name_hash}.{file_format}" if readable else f"{name_hash}.{file_format}"
+
+# Hash of everything that appears on a student's chart
+def chart_hash(name, student, file_format):
+    data = json.dumps([name, list(student["subjects"].items()), file_format])
+    return hashlib.sha1(data.encode("utf-8")).hexdigest()
+
+# Set up one reusable figure in a worker process
+def start_worker():
+    global worker_figure, worker_axes
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    worker_figure = Figure(figsize=(8, 4))
+    FigureCanvasAgg(worker_figure)
+    worker_axes = worker_figure.add_subplot()
+    # Fixed margins, so the layout isn't worked out again for every chart
+    worker_figure.subplots_adjust(left=0.08, right=0.98, top=0.9, bottom=0.15)
+
+# Render a list of (name, subjects, path) jobs on the worker's figure.
+# Returns the number of charts written.
+def render_jobs(jobs):
+    if worker_figure is None:
+        start_worker()
+    for name, subjects, path in jobs:
+        worker_axes.clear()
+        draw_scores(worker_axes, name.title(), subjects)
+        worker_figure.savefig(path)
+    return len(jobs)
+
+# Draw one student's chart and return the image file's contents (bytes), without saving it.
+# Reuses the same figure as render_jobs.
+def render_image(name, subjects, file_format="png"):
+    if worker_figure is None:
+        start_worker()
+    worker_axes.clear()
+    draw_scores(worker_axes, name.title(), subjects)
+    image = io.BytesIO()
+    worker_figure.savefig(image, format=file_format)
+    return image.getvalue()
+
+# Load the saved chart hashes, or an empty dict if there are none yet
+def load_hashes(out_dir):
+    try:
+        with open(os.path.join(out_dir, HASH_FILE_NAME), "r") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+# Save the chart hashes next to the charts
+def save_hashes(out_dir, hashes):
+    path = os.path.join(out_dir, HASH_FILE_NAME)
+    with open(path + ".tmp", "w") as f:
+        json.dump(hashes, f)
+    os.replace(path + ".tmp", path)
+
+# Render charts for every student with scores whose data has changed.
+# Returns a dict with how many charts were rendered and skipped.
+def render_all_charts(gradebook, out_dir=CHART_DIR, file_format="png", workers=None):
+    if file_format not in FORMATS:
+        raise ValueError(f"Chart format must be one of {', '.join(FORMATS)}")
+    os.makedirs(out_dir, exist_ok=True)
+    hashes = load_hashes(out_dir)
+    jobs = []
+    new_hashes = {}
+    skipped = 0
+    for name, student in gradebook.items():
+        if not student["subjects"]:
+            continue
+        # The hashes are kept by file name, so each file is only skipped if it has this student's chart
+        key = chart_file_name(name, file_format)
+        path = os.path.join(out_dir, key)
+        new_hashes[key] = chart_hash(name, student, file_format)
+        if hashes.get(key) == new_hashes[key] and os.path.exists(path):
+            skipped += 1
+            continue
+        # Sent to a worker process, so send a plain dict rather than the student record
+        jobs.append((name, dict(student["subjects"].items()), path))
+
+    tasks = [jobs[i:i + JOBS_PER_TASK] for i in range(0, len(jobs), JOBS_PER_TASK)]
+    if len(tasks) <= 1:
+        # Not worth starting a process pool for a handful of charts
+        rendered = sum(render_jobs(task) for task in tasks)
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=start_worker) as pool:
+            rendered = sum(pool.map(render_jobs, tasks))
+
+    # Keep hashes for the other formats, replace the ones for this format
+    hashes = {key: value for key, value in hashes.items() if not key.endswith(f".{file_format}")}
+    hashes.update(new_hashes)
+    save_hashes(out_dir, hashes)
+    return {"rendered": rendered, "skipped": skipped, "out_dir": out_dir}
+
+# Render every chart from the command line:
+#   python "Version 4 resit/gradebook_charts.py" [png|svg|pdf]
+if __name__ == "__main__":
+    import gradebook_storage
+
+    chosen_format = sys.argv[1] if len(sys.argv) > 1 else "png"
+    storage = gradebook_storage.open_storage()
+    result = render_all_charts(storage.load(), file_format=chosen_format)
+    storage.close()
+    print(f"Rendered {result['rendered']} charts, skipped {result['skipped']} unchanged, in {result['out_dir']}")
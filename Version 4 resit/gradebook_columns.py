@@ -0,0 +1,130 @@
+# Student Gradebook Manager – Version 4 class-wide statistics
+# Turns the nested gradebook dict into flat NumPy columns, one entry per score:
+#   student[i], subject[i], score[i]
+# (student and subject are stored as numbers that index into the name lists).
+# Once the columns are built, means, medians, spreads, percentiles, ranks and
+# grade bands for the whole school are worked out with array operations
+# instead of Python loops over every student.
+import numpy as np
+
+# Lower score limit for each grade band (NCEA style), checked from the top down
+GRADE_BANDS = [(0, "Not Achieved"), (50, "Achieved"), (65, "Merit"), (80, "Excellence")]
+PERCENTILES = [10, 25, 50, 75, 90]
+
+# Build the score columns from the gradebook dict
+def build_columns(gradebook):
+    names = list(gradebook)
+    subject_ids = {}
+    counts = np.fromiter((len(gradebook[name]["subjects"]) for name in names), dtype=np.int64, count=len(names))
+    total = int(counts.sum())
+    subject_column = np.empty(total, dtype=np.int32)
+    score_column = np.empty(total, dtype=np.int16)
+    position = 0
+    for name in names:
+        for subject, score in gradebook[name]["subjects"].items():
+            subject_column[position] = subject_ids.setdefault(subject, len(subject_ids))
+            score_column[position] = score
+            position += 1
+    return {
+        "names": names,
+        "subjects": list(subject_ids),
+        "age": np.fromiter((gradebook[name]["age"] for name in names), dtype=np.int16, count=len(names)),
+        "student": np.repeat(np.arange(len(names), dtype=np.int32), counts),
+        "subject": subject_column,
+        "score": score_column,
+    }
+
+# Work out percentiles for every group at once.
+# sorted_scores must be sorted by group and then by score, starts/counts give
+# where each group begins and how many scores it has. Uses the same linear
+# interpolation as np.percentile.
+def group_percentiles(sorted_scores, starts, counts, percent):
+    result = np.full(len(counts), np.nan)
+    has_scores = counts > 0
+    place = (counts[has_scores] - 1) * (percent / 100)
+    lower = np.floor(place).astype(np.int64)
+    upper = np.minimum(lower + 1, counts[has_scores] - 1)
+    fraction = place - lower
+    low_values = sorted_scores[starts[has_scores] + lower]
+    high_values = sorted_scores[starts[has_scores] + upper]
+    result[has_scores] = low_values + (high_values - low_values) * fraction
+    return result
+
+# Mean, median, standard deviation and percentiles for each group.
+# group_ids says which group each score belongs to, group_count is how many groups there are.
+def group_stats(group_ids, scores, group_count):
+    counts = np.bincount(group_ids, minlength=group_count)
+    sums = np.bincount(group_ids, weights=scores, minlength=group_count)
+    squares = np.bincount(group_ids, weights=scores.astype(np.float64) ** 2, minlength=group_count)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        means = sums / counts
+        spreads = np.sqrt(np.maximum(squares / counts - means ** 2, 0))
+    # Sort by group, then score, so each group's scores sit together in order
+    order = np.lexsort((scores, group_ids))
+    sorted_scores = scores[order].astype(np.float64)
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    stats = {"count": counts, "mean": means, "std": spreads,
+             "median": group_percentiles(sorted_scores, starts, counts, 50)}
+    for percent in PERCENTILES:
+        stats[f"p{percent}"] = group_percentiles(sorted_scores, starts, counts, percent)
+    return stats
+
+# Stats for each subject
+def subject_stats(columns):
+    return group_stats(columns["subject"], columns["score"], len(columns["subjects"]))
+
+# Stats for each student, plus their rank by average (1 = best, ties share a rank)
+def student_stats(columns):
+    stats = group_stats(columns["student"], columns["score"], len(columns["names"]))
+    # Students with no scores count as an average of 0, like calculate_average
+    averages = np.nan_to_num(stats["mean"])
+    ascending = np.sort(averages)
+    stats["rank"] = len(averages) - np.searchsorted(ascending, averages, side="right") + 1
+    stats["percentile"] = np.searchsorted(ascending, averages, side="right") / max(len(averages), 1) * 100
+    return stats
+
+# Stats for every score in the school
+def school_stats(columns):
+    scores = columns["score"]
+    if len(scores) == 0:
+        return {"count": 0}
+    stats = {"count": len(scores), "mean": float(scores.mean()), "std": float(scores.std()),
+             "median": float(np.median(scores))}
+    for percent, value in zip(PERCENTILES, np.percentile(scores, PERCENTILES)):
+        stats[f"p{percent}"] = float(value)
+    return stats
+
+# Count scores in each grade band for each subject.
+# Returns a (number of subjects) x (number of bands) array.
+def grade_band_counts(columns):
+    limits = np.array([limit for limit, _ in GRADE_BANDS[1:]])
+    bands = np.searchsorted(limits, columns["score"], side="right")
+    band_count = len(GRADE_BANDS)
+    counts = np.bincount(columns["subject"] * band_count + bands, minlength=len(columns["subjects"]) * band_count)
+    return counts.reshape(len(columns["subjects"]), band_count)
+
+# Build the text for the whole-school report shown in the Class Statistics screen
+def format_school_report(columns, top_n=10):
+    school = school_stats(columns)
+    if school["count"] == 0:
+        return "No scores in the gradebook."
+    report = (f"Students: {len(columns['names'])}\nScores: {school['count']}\n"
+              f"School average: {school['mean']:.2f}  median: {school['median']:.1f}  "
+              f"std dev: {school['std']:.2f}\n"
+              f"Percentiles: " + ", ".join(f"{p}th {school[f'p{p}']:.1f}" for p in PERCENTILES) + "\n\n")
+
+    subjects = subject_stats(columns)
+    bands = grade_band_counts(columns)
+    report += "Subjects (count, mean, median, std dev, " + " / ".join(label for _, label in GRADE_BANDS) + "):\n"
+    for subject_id in np.argsort(columns["subjects"]):
+        report += (f"  {columns['subjects'][subject_id].title()}: {subjects['count'][subject_id]}, "
+                   f"{subjects['mean'][subject_id]:.2f}, {subjects['median'][subject_id]:.1f}, "
+                   f"{subjects['std'][subject_id]:.2f}, "
+                   + " / ".join(str(count) for count in bands[subject_id]) + "\n")
+
+    students = student_stats(columns)
+    report += f"\nTop {top_n} students by average:\n"
+    for student_id in np.argsort(students["rank"], kind="stable")[:top_n]:
+        report += (f"  {students['rank'][student_id]}. {columns['names'][student_id].title()}: "
+                   f"{np.nan_to_num(students['mean'][student_id]):.2f}\n")
+    return report
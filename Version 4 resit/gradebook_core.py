@@ -0,0 +1,586 @@
+# Student Gradebook Manager – Version 4 core
+# Everything the gradebook does, without any windows: checking input, keeping
+# the indexes and running totals up to date, and saving through the storage
+# backend. The easygui program, the HTTP server and scripts all go through a
+# GradeBook, e.g.
+#   book = GradeBook()
+#   book.add_student("Amy Lee", 15)
+#   book.set_score("amy lee", "maths", 88)
+#   print(book.summary("amy lee"))
+#   book.save()
+#   book.close()
+# NumPy (class statistics) and matplotlib (charts) are only imported when they
+# are first needed, so scripts that just read or change scores start quickly.
+# Summaries, averages and chart images of recently shown students are cached
+# (gradebook_cache.py) until the student changes.
+# With GradeBook(write_behind=True) changes are saved by a background thread
+# (gradebook_saver.py), so editing doesn't wait for the disk. flush() waits
+# until they are saved, and close() saves everything that is left.
+# Two locks keep things in order: the storage's shared file lock (lock()) for
+# reading and writing the saved files, and the mutex for the gradebook in
+# memory. When both are needed the file lock is taken first. Saving only holds
+# the mutex while the changes are applied and the save is prepared, and writes
+# to the disk after letting it go, so reading the gradebook doesn't wait for the disk.
+import threading
+import gradebook_aggregates as aggregates
+import gradebook_cache as cache
+import gradebook_history as score_history
+import gradebook_import as importer
+import gradebook_journal as journal
+import gradebook_leaderboard as leaderboard
+import gradebook_metrics as metrics
+import gradebook_paging as paging
+import gradebook_rules as rules
+import gradebook_saver as saver
+import gradebook_search as search
+import gradebook_storage
+import gradebook_subject_index as subject_idx
+
+# Raised for input the gradebook can't accept. The message is ready to show to the user.
+class GradebookError(ValueError):
+    pass
+
+class NotFoundError(GradebookError):
+    pass
+
+class AlreadyExistsError(GradebookError):
+    pass
+
+# Calculate the average score for a student
+def calculate_average(student):
+    if student["count_scores"] == 0:
+        return 0
+    return student["total_score"] / student["count_scores"]
+
+# The text summary of one student shown by the search screen
+def format_summary(name, student):
+    lines = [f"Name: {name.title()}", f"Age: {student['age']}", "Subjects and Scores:"]
+    lines += [f"  {subject}: {score}" for subject, score in student["subjects"].items()]
+    lines.append(f"Average Score: {calculate_average(student):.2f}")
+    return "\n".join(lines)
+
+# Check one change record (from a script, the server or a file) and return a tidy
+# copy of it, using the same rules as the easygui screens.
+def check_change(change):
+    if not isinstance(change, dict):
+        raise GradebookError("Each change must be a JSON object.")
+    op = change.get("op")
+    for key in ("name", "subject"):
+        if change.get(key) is not None and not isinstance(change[key], str):
+            raise GradebookError(f"{key.title()} must be text.")
+    name = rules.clean_name(change.get("name"))
+    if not name:
+        raise GradebookError("Name cannot be blank.")
+    clean = {"op": op, "name": name}
+    if op in ("add_student", "set_age"):
+        clean["age"], error = rules.check_age(change.get("age"))
+        if error:
+            raise GradebookError(f"Age: {error}")
+    elif op in ("set_score", "delete_subject"):
+        clean["subject"] = rules.clean_name(change.get("subject"))
+        if not clean["subject"]:
+            raise GradebookError("Subject cannot be blank.")
+        if op == "set_score":
+            clean["score"], error = rules.check_score(change.get("score"))
+            if error:
+                raise GradebookError(f"Score: {error}")
+    else:
+        raise GradebookError("op must be add_student, set_age, set_score or delete_subject.")
+    return clean
+
+# The gradebook, its indexes and where it is saved
+class GradeBook:
+    # Opens the storage backend chosen with GRADEBOOK_STORAGE unless one is given.
+    # write_behind: save changes in the background instead of before returning.
+    def __init__(self, storage=None, write_behind=False):
+        self.storage = storage or gradebook_storage.open_storage()
+        self.cache = cache.LRUCache()
+        self.loaded_history = None  # Read in when first asked about
+        # id(change) -> its score history line, for our changes until they are saved
+        self.history_lines = {}
+        # Held while the gradebook is changed, or read through from start to finish
+        self.mutex = threading.RLock()
+        self.saver = saver.WriteBehindSaver(self.write_changes) if write_behind else None
+        # Students someone else changed while our changes to them were waiting to be saved
+        self.late_conflicts = []
+        with metrics.span("load"):
+            self.students = self.storage.load()
+        metrics.count("records_read", len(self.students))
+        self.rebuild_indexes()
+
+    # Start the indexes again after (re)loading the gradebook. With storage that only reads
+    # students as they are used (sharded, SQLite), they are built the first time they are needed.
+    def rebuild_indexes(self):
+        self.subject_index = self.search_index = self.totals = None
+        # NumPy columns for class statistics, built when first asked for
+        self.columns = None
+        # Rankings by average and subject score, built when first asked for and then kept up to date
+        self.leaderboard = None
+        if not self.storage.lazy:
+            self.build_indexes()
+
+    # Build the subject index, search index and running totals from the whole gradebook
+    def build_indexes(self):
+        with self.mutex:
+            if self.totals is not None:
+                return
+            with metrics.span("build_indexes"):
+                # Subject -> {student: score}, for subject reports and filters
+                self.subject_index = subject_idx.build_subject_index(self.students)
+                # Sorted names and trigrams, for search and the paged student list
+                self.search_index = search.build_search_index(self.students)
+                # Class-wide counts, totals and per-subject tallies
+                self.totals = aggregates.build_aggregates(self.students)
+
+    def __contains__(self, name):
+        return rules.clean_name(name) in self.students
+
+    def __len__(self):
+        return len(self.students)
+
+    # Look up a student's record, or raise NotFoundError
+    def student(self, name):
+        name = rules.clean_name(name)
+        with self.mutex:
+            student = self.students.get(name)
+        if student is None:
+            raise NotFoundError(f"{name.title()} not found.")
+        return student
+
+    # Every student name, sorted
+    def names(self):
+        self.build_indexes()
+        return self.search_index["names"]
+
+    # The cached value of one kind for a student, made with make(name, student) if it isn't cached
+    def cached(self, name, kind, make):
+        name = rules.clean_name(name)
+        with self.mutex:
+            student = self.student(name)
+            value = self.cache.get(name, student.get("version", 0), kind)
+            if value is None:
+                value = make(name, student)
+                self.cache.put(name, student.get("version", 0), kind, value)
+            return value
+
+    def average(self, name):
+        return self.cached(name, "average", lambda name, student: calculate_average(student))
+
+    def summary(self, name):
+        return self.cached(name, "summary", format_summary)
+
+    # A student's score chart as image file contents (bytes)
+    def chart_image(self, name, file_format="png"):
+        import gradebook_charts as charts
+        return self.cached(name, f"chart.{file_format}", lambda name, student: charts.render_image(
+            name, dict(student["subjects"].items()), file_format))
+
+    # Changing the gradebook
+
+    # Apply one change to the gradebook and keep every index up to date (doesn't save it)
+    def apply(self, change):
+        self.columns = None
+        self.cache.forget(change["name"])
+        if self.totals is None:
+            journal.apply_change(self.students, change)
+            return
+        subject_idx.update_subject_index(self.subject_index, self.students, change)
+        aggregates.update_aggregates(self.totals, self.students, change)
+        if self.leaderboard is not None:
+            self.leaderboard.update(self.students, change)
+        journal.apply_change(self.students, change)
+        if change["op"] == "add_student":
+            search.add_name(self.search_index, change["name"])
+
+    # Catch up with changes other copies of the program have saved since we last looked.
+    # If the saved gradebook was rewritten since then, load it all again.
+    # unsaved: our changes that are applied in memory but not saved yet (by default the
+    # ones waiting for the background saver). If someone else changed the same students,
+    # everything is loaded again and our changes are put back on top.
+    # With wait=False it gives up straight away if someone is saving (the background
+    # saver, or another copy) and returns False, so the screens never wait for the disk.
+    def sync(self, unsaved=None, wait=True):
+        lock = self.storage.lock()
+        if not lock.acquire(wait):
+            return False
+        try:
+            self.catch_up(unsaved)
+        finally:
+            lock.release()
+        return True
+
+    # The work of sync, while holding the shared file lock
+    def catch_up(self, unsaved):
+        with self.mutex:
+            if unsaved is None:
+                unsaved = self.saver.waiting() if self.saver else []
+            incoming = self.storage.read_new_changes()
+            if incoming is not None:
+                metrics.count("changes_read", len(incoming))
+                ours = {change["name"] for change in unsaved}
+                clashes = sorted({change["name"] for change in incoming if change["name"] in ours})
+                if not clashes:
+                    for change in incoming:
+                        self.apply(change)
+                    return
+                self.late_conflicts.extend(clashes)
+            self.reload(unsaved)
+
+    # Load the whole gradebook again from the saved files and put our unsaved changes
+    # back on top. Call while holding the shared file lock.
+    def reload(self, unsaved):
+        with self.mutex:
+            students = self.storage.load()
+            if students is not self.students:
+                # Keep the same dict, anything holding on to it (like the importer) sees the new data
+                self.students.clear()
+                self.students.update(students)
+            self.cache.clear()
+            self.rebuild_indexes()
+            for change in unsaved:
+                # Someone else added this student first: keep their scores and just set the age
+                if change["op"] == "add_student" and change["name"] in self.students:
+                    change["op"] = "set_age"
+                    self.late_conflicts.append(change["name"])
+                self.apply(change)
+
+    # Apply a list of checked changes and save them together (one journal write or one transaction).
+    # While holding the shared lock, other teachers' changes are read in first and only
+    # our own changes are added on top, so nobody's edits are lost.
+    # seen_versions is {name: version when this student was shown} (if known).
+    # Returns the names of students someone else changed in the meantime.
+    # With write_behind the changes are only applied here and handed to the background
+    # saver, which catches up with other teachers' changes when it saves them.
+    def record_changes(self, changes, seen_versions=None):
+        if self.saver:
+            with self.mutex:
+                saved_changes, conflicts = self.stage_changes(changes, seen_versions)
+                self.saver.submit(saved_changes)
+            return conflicts
+        with metrics.span("save_changes"), self.storage.lock():
+            with self.mutex:
+                self.sync()
+                saved_changes, conflicts = self.stage_changes(changes, seen_versions)
+                save = self.storage.prepare_save(self.students, saved_changes)
+                history = self.history_of(saved_changes)
+            self.save_or_undo(save, saved_changes)
+            score_history.record(history)
+        metrics.count("changes_written", len(saved_changes))
+        return conflicts
+
+    # Apply changes in memory for record_changes. Returns the changes to save and the conflicts.
+    def stage_changes(self, changes, seen_versions):
+        conflicts = []
+        for name, version in (seen_versions or {}).items():
+            if name in self.students and self.students[name].get("version", 0) != version:
+                conflicts.append(name)
+        saved_changes = []
+        for change in changes:
+            # Someone else added this student first: keep their scores and just set the age
+            if change["op"] == "add_student" and change["name"] in self.students:
+                change = {"op": "set_age", "name": change["name"], "age": change["age"]}
+                conflicts.append(change["name"])
+            self.note_history(change)
+            self.apply(change)
+            saved_changes.append(change)
+        return saved_changes, conflicts
+
+    # Keep the score history line for one of our changes, just before it is applied.
+    # It holds the score before, so the history never has to read the whole gradebook.
+    def note_history(self, change):
+        before = None
+        if change["op"] in ("set_score", "delete_subject"):
+            student = self.students.get(change["name"])
+            if student is not None:
+                before = student["subjects"].get(change["subject"])
+        line = score_history.entry(change, before)
+        if line is not None:
+            self.history_lines[id(change)] = line
+
+    # The score history lines for changes that are being saved. They are kept until
+    # forget_history, so changes the background saver tries again still have theirs.
+    def history_of(self, changes):
+        with self.mutex:
+            lines = [self.history_lines.get(id(change)) for change in changes]
+        return [line for line in lines if line is not None]
+
+    # Drop the history lines of changes that are saved (or won't be)
+    def forget_history(self, changes):
+        with self.mutex:
+            for change in changes:
+                self.history_lines.pop(id(change), None)
+
+    # Run save() for changes already applied in memory. If it fails, whatever of them
+    # did get saved is all that is kept: the gradebook is loaded again from the files
+    # (with the background saver's waiting changes put back on top), so nothing is
+    # shown that another copy of the program wouldn't see. Call holding the file lock.
+    def save_or_undo(self, save, changes):
+        try:
+            save()
+        except BaseException:
+            self.reload(self.saver.waiting() if self.saver else [])
+            raise
+        finally:
+            self.forget_history(changes)
+
+    # Save the changes waiting for the background saver, which are already applied in memory
+    # (called by the saver's thread). Other teachers' changes are read in first, as in record_changes.
+    def write_changes(self):
+        with self.storage.lock():
+            with self.mutex:
+                changes = self.saver.take_batch()
+                self.sync()
+                save = self.storage.prepare_save(self.students, changes)
+                history = self.history_of(changes)
+            # If this fails the saver tries the changes again, and their history lines are still kept
+            save()
+            self.forget_history(changes)
+            try:
+                score_history.record(history)
+            finally:
+                # Saved either way, so flush() returns once the history is written too
+                self.saver.batch_saved()
+        metrics.count("changes_written", len(changes))
+
+    # Students someone else changed while our changes to them were waiting to be saved
+    # (write_behind only). Each is only handed back once.
+    def take_late_conflicts(self):
+        with self.mutex:
+            conflicts, self.late_conflicts = self.late_conflicts, []
+        return sorted(set(conflicts))
+
+    # Save a single change, see record_changes
+    def record_change(self, change, seen_version=None):
+        seen_versions = {change["name"]: seen_version} if seen_version is not None else None
+        return self.record_changes([change], seen_versions)
+
+    # Check changes against the gradebook as it is now and save the ones that fit,
+    # all in one go. Used where nobody is there to sort out a conflict (the server).
+    # Returns one result per change: "ok", or the GradebookError saying why it wasn't saved.
+    def record_checked_changes(self, changes):
+        results = []
+        self.flush()
+        with metrics.span("save_changes"), self.storage.lock():
+            with self.mutex:
+                self.sync()
+                saved_changes = []
+                for change in changes:
+                    error = self.problem_with(change)
+                    if error:
+                        results.append(error)
+                        continue
+                    self.note_history(change)
+                    self.apply(change)
+                    saved_changes.append(change)
+                    results.append("ok")
+                save = self.storage.prepare_save(self.students, saved_changes)
+                history = self.history_of(saved_changes)
+            self.save_or_undo(save, saved_changes)
+            score_history.record(history)
+        metrics.count("changes_written", len(saved_changes))
+        return results
+
+    # Checks that depend on what is in the gradebook right now
+    def problem_with(self, change):
+        if change["op"] == "add_student":
+            if change["name"] in self.students:
+                return AlreadyExistsError(f"Student {change['name'].title()} already exists.")
+        elif change["name"] not in self.students:
+            return NotFoundError(f"{change['name'].title()} not found.")
+        elif change["op"] == "delete_subject" and change["subject"] not in self.students[change["name"]]["subjects"]:
+            return NotFoundError("Subject not found.")
+        return None
+
+    # Add a new student. If someone else added them first, their age is updated instead.
+    # Returns the names of students someone else changed in the meantime.
+    def add_student(self, name, age):
+        change = check_change({"op": "add_student", "name": name, "age": age})
+        if change["name"] in self.students:
+            raise AlreadyExistsError(f"Student {change['name'].title()} already exists.")
+        return self.record_change(change)
+
+    def set_age(self, name, age, seen_version=None):
+        change = check_change({"op": "set_age", "name": name, "age": age})
+        self.student(change["name"])
+        return self.record_change(change, seen_version)
+
+    def set_score(self, name, subject, score, seen_version=None):
+        change = check_change({"op": "set_score", "name": name, "subject": subject, "score": score})
+        self.student(change["name"])
+        return self.record_change(change, seen_version)
+
+    def delete_subject(self, name, subject, seen_version=None):
+        change = check_change({"op": "delete_subject", "name": name, "subject": subject})
+        if change["subject"] not in self.student(change["name"])["subjects"]:
+            raise NotFoundError("Subject not found.")
+        return self.record_change(change, seen_version)
+
+    # Import scores from a CSV or JSON-lines file, saving each batch in one go
+    def import_file(self, path, rejects_path=None):
+        return importer.import_file(path, self.students, self.record_changes, rejects_path)
+
+    # Make sure everything is saved in its final form (rewrites the JSON snapshot
+    # and clears the journal, SQLite is already up to date).
+    # Other teachers' latest changes are read in first so they are not written over.
+    def save(self):
+        self.flush()
+        with metrics.span("save"), self.storage.lock():
+            with self.mutex:
+                self.sync()
+                save = self.storage.prepare_checkpoint(self.students)
+                written = len(self.students)
+            save()
+        metrics.count("records_written", written)
+
+    # Wait until the background saver has saved every change made so far (write_behind only).
+    # Returns False if that took longer than timeout seconds. Raises if saving failed.
+    def flush(self, timeout=None):
+        return self.saver.flush(timeout) if self.saver else True
+
+    # Raise the error from a background save that failed since last asked (write_behind only).
+    # The changes are kept and tried again.
+    def check_saving(self):
+        if self.saver:
+            self.saver.check()
+
+    # Save anything still waiting and close the storage
+    def close(self):
+        try:
+            if self.saver:
+                self.saver.close()
+        finally:
+            self.storage.close()
+
+    # Questions about the whole gradebook
+
+    # Ranked search: exact match first, then names that start with the query, then small typos
+    def search(self, query, limit=search.MAX_RESULTS):
+        self.build_indexes()
+        with metrics.span("search"), self.mutex:
+            return search.search_names(self.search_index, self.students, query, limit)
+
+    # Number of students and scores and the school average, from the running totals
+    def dashboard(self):
+        # Sharded storage keeps these numbers per shard and SQLite adds them up, so the indexes aren't needed yet
+        totals = self.totals if self.totals is not None else self.students.totals()
+        return {"students": totals["students"], "scores": totals["count"],
+                "average": aggregates.school_average(totals)}
+
+    # Count, average, lowest, highest, top scores and (if roster) every score for a subject,
+    # or None if nobody has taken it
+    def subject_report(self, subject, top=5, roster=True):
+        subject = rules.clean_name(subject)
+        with self.mutex:
+            if self.totals is None and not roster and hasattr(self.students, "subject_summary"):
+                # Added up by the database, without reading every student in (SQLite)
+                summary = self.students.subject_summary(subject, top)
+                if summary is None:
+                    return None
+                count, average, lowest, highest, top_scores = summary
+                return {"subject": subject, "count": count, "average": average, "lowest": lowest,
+                        "highest": highest, "top": top_scores, "roster": None}
+            self.build_indexes()
+            summary = aggregates.subject_summary(self.totals, subject)
+            if summary is None:
+                return None
+            count, average, lowest, highest = summary
+            return {"subject": subject, "count": count, "average": average, "lowest": lowest, "highest": highest,
+                    "top": subject_idx.top_students(self.subject_index, subject, top),
+                    "roster": subject_idx.subject_roster(self.subject_index, subject) if roster else None}
+
+    # Whole-school statistics report (means, spreads, grade bands, top students)
+    def class_statistics(self):
+        import gradebook_columns as columns
+        with self.mutex:
+            # Only rebuild the columns if the gradebook has changed since last time
+            if self.columns is None:
+                self.columns = columns.build_columns(self.students)
+            return columns.format_school_report(self.columns)
+
+    # A pager over the sorted names, optionally only an age range and/or one subject's students
+    def pager(self, min_age=None, max_age=None, subject=None):
+        subject = rules.clean_name(subject)
+        self.build_indexes()
+        subject_students = self.subject_index.get(subject, {}) if subject else None
+        return paging.make_pager(self.search_index["names"], self.students, min_age, max_age, subject_students)
+
+    # Rankings (see gradebook_leaderboard.py)
+
+    def rankings(self):
+        with self.mutex:
+            if self.leaderboard is None:
+                self.build_indexes()
+                with metrics.span("build_leaderboard"):
+                    self.leaderboard = leaderboard.Leaderboard(self.students, self.subject_index)
+            return self.leaderboard
+
+    # [(rank, name, average or score)] for the top n students by average, or in a subject
+    def top_students(self, n=10, subject=None):
+        with self.mutex:
+            return self.rankings().top(n, rules.clean_name(subject))
+
+    # A student's rank by average (or in a subject): {"rank", "out_of", "percentile"},
+    # or None if they have no scores (or no score in that subject)
+    def rank(self, name, subject=None):
+        name = rules.clean_name(name)
+        with self.mutex:
+            self.student(name)
+            return self.rankings().rank(name, rules.clean_name(subject))
+
+    # [(name, average or score)] for students whose average (or subject score) is
+    # from low to high, highest first. Leave low or high as None (or blank) for no limit.
+    def students_between(self, low=None, high=None, subject=None, limit=None):
+        bounds = []
+        for bound in (low, high):
+            bound = str(bound).strip() if bound is not None else ""
+            try:
+                bounds.append(float(bound) if bound else None)
+            except ValueError:
+                raise GradebookError("Invalid input. Please enter a number.")
+            if bound and not rules.SCORE_MIN <= bounds[-1] <= rules.SCORE_MAX:
+                raise GradebookError(f"Score must be between {rules.SCORE_MIN} and {rules.SCORE_MAX}.")
+        with self.mutex:
+            return self.rankings().between(bounds[0], bounds[1], rules.clean_name(subject), limit)
+
+    # Score history
+
+    # The history of every score change, brought up to date (see gradebook_history.py).
+    # Changes still waiting for the background saver are saved first, so they are in it.
+    def history(self):
+        self.flush()
+        if self.loaded_history is None:
+            self.loaded_history = score_history.ScoreHistory()
+        return self.loaded_history.refresh()
+
+    # Everyone's scores as they were at a time (seconds since 1970): {name: {subject: score}}
+    def scores_as_of(self, when):
+        history = self.history()
+        with self.mutex:
+            return history.as_of(when, self.students)
+
+    # A student's average at the end of each term: [(term, average), ...]
+    def student_trend(self, name):
+        name = rules.clean_name(name)
+        history = self.history()
+        with self.mutex:
+            return history.student_trend(name, self.students.get(name))
+
+    # Each subject's class average at the end of two terms, and the change
+    def compare_terms(self, first_term, second_term):
+        history = self.history()
+        with self.mutex:
+            return history.compare_terms(first_term, second_term, self.students)
+
+    # Write the scores to a CSV or Parquet file for analytics tools (changed_only: only
+    # students changed since the last export), see gradebook_export.py
+    def export(self, path, changed_only=False):
+        import gradebook_export as export
+        self.sync()
+        with self.mutex:
+            return export.export_gradebook(self.students, path, changed_only)
+
+    # Save a chart file for every student, skipping ones that haven't changed
+    def render_all_charts(self, out_dir=None, file_format="png"):
+        import gradebook_charts as charts
+        with self.mutex:
+            return charts.render_all_charts(self.students, out_dir or charts.CHART_DIR, file_format)
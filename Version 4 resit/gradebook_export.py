@@ -0,0 +1,132 @@
+# Student Gradebook Manager – Version 4 analytics export
+# Writes the gradebook as a table with one row per score (name, age, subject,
+# score, version) for spreadsheets and analytics tools:
+#   - CSV, or Parquet if pyarrow is installed (pip install pyarrow)
+#   - rows are made one at a time and written CHUNK_ROWS at a time, so memory
+#     use doesn't grow with the size of the export
+#   - students with no scores get one row with a blank subject and score
+#   - changed_only=True only writes students whose version has changed since the
+#     last export (the versions exported are kept in a state file). Their rows
+#     replace all of their older rows.
+# The file is written under a temporary name and renamed at the end, and the
+# state file is only updated once the export has finished.
+import csv
+import json
+import os
+import sys
+from itertools import islice
+import gradebook_journal as journal
+
+EXPORT_STATE_FILE = "Version 4 resit/gradebook_export_state.json"
+CHUNK_ROWS = 50000
+FIELDS = ["name", "age", "subject", "score", "version"]
+FORMATS = ["csv", "parquet"]
+
+# The version of every student written by the last export, or {} if there wasn't one
+def load_state(state_file=EXPORT_STATE_FILE):
+    try:
+        with open(state_file, "r") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+# Names of the students to export, in order. With changed_only, only the
+# students whose version isn't the one in the state.
+def names_to_export(gradebook, state, changed_only):
+    names = sorted(gradebook)
+    if not changed_only:
+        return names
+    return [name for name in names if state.get(name) != gradebook[name].get("version", 0)]
+
+# Yield one (name, age, subject, score, version) row per score
+def export_rows(gradebook, names):
+    for name in names:
+        student = gradebook[name]
+        age = student["age"]
+        version = student.get("version", 0)
+        scores = student["subjects"].items()
+        if not scores:
+            yield name, age, None, None, version
+        for subject, score in scores:
+            yield name, age, subject, score, version
+
+# Yield the rows in lists of up to CHUNK_ROWS
+def chunks(rows, size=CHUNK_ROWS):
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, size))
+        if not chunk:
+            return
+        yield chunk
+
+# Write rows to a CSV file with a header row. Returns the number of rows written.
+def write_csv(rows, path):
+    written = 0
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(FIELDS)
+        for chunk in chunks(rows):
+            writer.writerows(chunk)
+            written += len(chunk)
+    return written
+
+# Write rows to a Parquet file, one row group per chunk. Returns the number of rows written.
+def write_parquet(rows, path):
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("Parquet export needs pyarrow (pip install pyarrow), or export to CSV instead.")
+    schema = pa.schema([("name", pa.string()), ("age", pa.uint8()), ("subject", pa.string()),
+                        ("score", pa.uint8()), ("version", pa.uint32())])
+    written = 0
+    with pq.ParquetWriter(path, schema) as writer:
+        for chunk in chunks(rows):
+            columns = list(zip(*chunk))
+            writer.write_table(pa.Table.from_arrays([pa.array(column, field.type)
+                                                     for column, field in zip(columns, schema)], schema=schema))
+            written += len(chunk)
+    return written
+
+# Export the gradebook to a CSV or Parquet file (chosen by the file's extension).
+# Returns a dict with how many students and rows were written.
+def export_gradebook(gradebook, path, changed_only=False, state_file=EXPORT_STATE_FILE):
+    file_format = os.path.splitext(path)[1].lower().lstrip(".")
+    if file_format not in FORMATS:
+        raise ValueError(f"Export file must end in .{' or .'.join(FORMATS)}")
+    state = load_state(state_file)
+    names = names_to_export(gradebook, state, changed_only)
+    temp_file = path + ".tmp"
+    write = write_csv if file_format == "csv" else write_parquet
+    try:
+        rows = write(export_rows(gradebook, names), temp_file)
+    except BaseException:
+        if os.path.exists(temp_file):
+            os.remove(temp_file)
+        raise
+    os.replace(temp_file, path)
+    # Remember what was exported, for the next changed_only export
+    if not changed_only:
+        state = {}
+    state.update((name, gradebook[name].get("version", 0)) for name in names)
+    journal.write_file_safely(state_file, json.dumps(state))
+    return {"students": len(names), "rows": rows, "path": path}
+
+# Export from the command line:
+#   python "Version 4 resit/gradebook_export.py" scores.csv [--changed]
+#   python "Version 4 resit/gradebook_export.py" scores.parquet [--changed]
+if __name__ == "__main__":
+    import gradebook_storage
+
+    if len(sys.argv) not in (2, 3) or sys.argv[2:] not in ([], ["--changed"]):
+        print("Usage: python gradebook_export.py <scores.csv | scores.parquet> [--changed]")
+        sys.exit(1)
+    storage = gradebook_storage.open_storage()
+    try:
+        result = export_gradebook(storage.load(), sys.argv[1], changed_only=len(sys.argv) == 3)
+    except (ValueError, RuntimeError) as error:
+        print(error)
+        sys.exit(1)
+    finally:
+        storage.close()
+    print(f"Exported {result['rows']} rows for {result['students']} students to {result['path']}.")
@@ -0,0 +1,301 @@
+# Student Gradebook Manager – Version 4 score history
+# The gradebook only keeps each student's current scores, so an edited or
+# deleted score is gone. This keeps every score change in a separate history
+# file, so progress can be shown across terms:
+#   - each saved set_score / delete_subject is appended to HISTORY_FILE as one
+#     JSON line [time, name, subject, score, score before] (null for no score),
+#     with the time it was made
+#   - the first line [time, null, null, null] marks when the history started.
+#     Scores that haven't changed since then come from the gradebook itself, and
+#     the score before a subject's first change is kept with that change, so
+#     starting the history doesn't have to read every student
+#   - the history is only read when a question is asked about it, so looking up
+#     and changing current scores doesn't get any slower
+#   - lines are forced onto the disk like the journal's, and a line left
+#     half-written by a crash is skipped when reading and cut off before the next write
+#   - in memory each (student, subject) has a Series: two small arrays holding
+#     each entry's time (4 bytes) and score (1 byte), so the score at a time is
+#     found with a binary search of the times
+# Terms are worked out from the date: term 1 starts in January, 2 in April,
+# 3 in July and 4 in October (TERM_START_MONTHS), e.g. "2026 T3".
+import gc
+import json
+import os
+import sys
+import time
+from array import array
+from bisect import bisect_right
+from datetime import datetime
+import gradebook_rules as rules
+
+HISTORY_FILE = "Version 4 resit/gradebook_history.jsonl"
+TERM_START_MONTHS = [1, 4, 7, 10]
+DELETED = -1  # Stored in place of the score when a subject is deleted
+UINT32 = "I" if array("I").itemsize == 4 else "L"  # Seconds since 1970 fit until 2106
+
+# The term a time (seconds since 1970) falls in, e.g. "2026 T3"
+def term_of(when):
+    date = datetime.fromtimestamp(when)
+    number = max(i for i, month in enumerate(TERM_START_MONTHS, 1) if month <= date.month)
+    return f"{date.year} T{number}"
+
+# The last second of a term like "2026 T3"
+def term_end(term):
+    year, number = term.split(" T")
+    year, number = int(year), int(number)
+    if number == len(TERM_START_MONTHS):
+        start_of_next = datetime(year + 1, TERM_START_MONTHS[0], 1)
+    else:
+        start_of_next = datetime(year, TERM_START_MONTHS[number], 1)
+    return int(start_of_next.timestamp()) - 1
+
+# All the changes to one student's score in one subject, oldest first
+class Series:
+    __slots__ = ("times", "scores", "before")
+
+    # before: the score before the first change (DELETED for none), which it had since the history started
+    def __init__(self, before=DELETED):
+        self.times = array(UINT32)
+        self.scores = array("b")  # 0-100, or DELETED
+        self.before = before
+
+    def add(self, when, score):
+        # Keep the times in order even if another computer's clock was a little behind
+        if self.times and when < self.times[-1]:
+            when = self.times[-1]
+        self.times.append(when)
+        self.scores.append(score)
+
+    # (time, score) for every entry, score is DELETED for a deletion
+    def entries(self):
+        return zip(self.times, self.scores)
+
+    # The score at a time (None if there wasn't one then, or it had been deleted).
+    # Before the first change it is the score before, from when the history started.
+    def score_at(self, when, started):
+        count = bisect_right(self.times, when)
+        if count:
+            score = self.scores[count - 1]
+        else:
+            score = self.before if when >= started else DELETED
+        return None if score == DELETED else score
+
+# The history of every score, read in from the history file when needed.
+# Questions are asked with the current gradebook, which has the scores that
+# haven't changed since the history started.
+class ScoreHistory:
+    def __init__(self, history_file=HISTORY_FILE):
+        self.history_file = history_file
+        self.series = {}  # name -> {subject: Series}
+        self.started = None  # Time of the first line in the file
+        self.offset = 0  # How far into the file has been read
+        self.term_cache = {}  # term -> term_averages(term), until more history is read
+
+    # Read any entries added to the file since last time (by us or other copies of the program)
+    def refresh(self):
+        try:
+            with open(self.history_file, "rb") as f:
+                f.seek(self.offset)
+                data = f.read()
+        except FileNotFoundError:
+            return self
+        # Leave out a last line that is still being written
+        end = data.rfind(b"\n") + 1
+        if not end:
+            return self
+        self.offset += end
+        self.term_cache.clear()
+        entries = parse_entries(data[:end])
+        # None of the new series can be garbage, so don't let the collector keep scanning them
+        collecting = gc.isenabled()
+        gc.disable()
+        try:
+            for entry in entries:
+                self.add(*entry)
+        finally:
+            if collecting:
+                gc.enable()
+        return self
+
+    def add(self, when, name, subject, score, before=None):
+        if self.started is None:
+            # Files written before there was a start line begin with the scores at the start
+            self.started = when
+        if name is None:
+            return
+        subjects = self.series.get(name)
+        if subjects is None:
+            subjects = self.series[name] = {}
+        series = subjects.get(subject)
+        if series is None:
+            series = subjects[subject] = Series(DELETED if before is None else before)
+        series.add(when, DELETED if score is None else score)
+
+    # The scores a student has had since the history started, going by the gradebook:
+    # {subject: score} for the ones with no changes in the history
+    def unchanged_scores(self, name, student):
+        if student is None:
+            return {}
+        changed = self.series.get(name, {})
+        return {subject: score for subject, score in student["subjects"].items() if subject not in changed}
+
+    # Students' scores as they were at a time: {name: {subject: score}}
+    def as_of(self, when, gradebook):
+        snapshot = {}
+        if self.started is None:
+            # No history yet: the scores have been the same all along
+            self.started = int(time.time())
+        if when >= self.started:
+            for name, student in gradebook.items():
+                scores = self.unchanged_scores(name, student)
+                if scores:
+                    snapshot[name] = scores
+        for name, subjects in self.series.items():
+            scores = {}
+            for subject, series in subjects.items():
+                score = series.score_at(when, self.started)
+                if score is not None:
+                    scores[subject] = score
+            if scores:
+                snapshot.setdefault(name, {}).update(scores)
+        return snapshot
+
+    # Every change to one student's scores: {subject: [(time, score or None), ...]}
+    def student_history(self, name):
+        return {subject: [(when, None if score == DELETED else score) for when, score in series.entries()]
+                for subject, series in self.series.get(name, {}).items()}
+
+    # A student's average at the end of the term the history started in and every
+    # term they had a score change in: [(term, average), ...] oldest first.
+    # student is their record in the gradebook now (None if they aren't in it).
+    def student_trend(self, name, student):
+        subjects = self.series.get(name, {})
+        unchanged = list(self.unchanged_scores(name, student).values())
+        terms = {term_of(when) for series in subjects.values() for when, _ in series.entries()}
+        if self.started is not None:
+            terms.add(term_of(self.started))
+        trend = []
+        for term in sorted(terms, key=term_end):
+            end = term_end(term)
+            scores = [score for score in (series.score_at(end, self.started) for series in subjects.values())
+                      if score is not None]
+            if self.started is None or end >= self.started:
+                scores += unchanged
+            if scores:
+                trend.append((term, sum(scores) / len(scores)))
+        return trend
+
+    # Number of scores and the average for every subject at the end of a term: {subject: (count, average)}
+    def term_averages(self, term, gradebook):
+        if term in self.term_cache:
+            return self.term_cache[term]
+        totals = {}
+        for subjects in self.as_of(term_end(term), gradebook).values():
+            for subject, score in subjects.items():
+                count, total = totals.get(subject, (0, 0))
+                totals[subject] = (count + 1, total + score)
+        averages = {subject: (count, total / count) for subject, (count, total) in totals.items()}
+        self.term_cache[term] = averages
+        return averages
+
+    # Compare every subject's class average at the end of two terms:
+    # {subject: (average in first term or None, average in second term or None, change or None)}
+    def compare_terms(self, first_term, second_term, gradebook):
+        first = self.term_averages(first_term, gradebook)
+        second = self.term_averages(second_term, gradebook)
+        comparison = {}
+        for subject in sorted(set(first) | set(second)):
+            before = first[subject][1] if subject in first else None
+            after = second[subject][1] if subject in second else None
+            change = after - before if before is not None and after is not None else None
+            comparison[subject] = (before, after, change)
+        return comparison
+
+# A line is [time, name, subject, score] or, since the score before was added, [time, name, subject, score, before]
+def good_entry(entry):
+    return type(entry) is list and 4 <= len(entry) <= 5
+
+# Turn complete lines from the history file into entries, leaving out any line that is damaged
+def parse_entries(data):
+    try:
+        # Parse all the lines as one JSON list, much faster than one json.loads per line
+        entries = json.loads(b"[" + data[:-1].replace(b"\n", b",") + b"]")
+        if all(good_entry(entry) for entry in entries):
+            return entries
+    except ValueError:
+        pass
+    entries = []
+    for line in data.splitlines():
+        try:
+            entry = json.loads(line)
+        except ValueError:
+            continue
+        if good_entry(entry):
+            entries.append(entry)
+    return entries
+
+# Append lines to the history file and force them onto the disk.
+# Called while holding the gradebook's lock, so a last line without a newline can
+# only be left over from a crash: it is cut off first, so the new lines start cleanly.
+def append_lines(lines, history_file=HISTORY_FILE):
+    with open(history_file, "a+b") as f:
+        size = f.seek(0, os.SEEK_END)
+        if size:
+            f.seek(size - 1)
+            if f.read(1) != b"\n":
+                f.seek(0)
+                f.truncate(f.read().rfind(b"\n") + 1)
+        f.write("".join(json.dumps(line, separators=(",", ":")) + "\n" for line in lines).encode("utf-8"))
+        f.flush()
+        os.fsync(f.fileno())
+
+# The history line for a change about to be applied, or None if it doesn't change a score.
+# before is the student's score for the subject right now (None if they have none).
+def entry(change, before):
+    if change["op"] == "set_score":
+        score = change["score"]
+    elif change["op"] == "delete_subject":
+        score = None
+    else:
+        return None
+    return [int(time.time()), change["name"], change["subject"], score, before]
+
+# Append history lines (from entry) to the history file. The first time, a line
+# marking when the history started goes first.
+def record(lines, history_file=HISTORY_FILE):
+    if not lines:
+        return
+    if not os.path.exists(history_file):
+        lines = [[min(line[0] for line in lines), None, None, None]] + lines
+    append_lines(lines, history_file)
+
+# Parse a date like 2026-06-30 into the last second of that day
+def end_of_day(text):
+    return int(datetime.strptime(text, "%Y-%m-%d").timestamp()) + 24 * 60 * 60 - 1
+
+# Ask about the history from the command line:
+#   python "Version 4 resit/gradebook_history.py" as-of 2026-06-30
+#   python "Version 4 resit/gradebook_history.py" trend "amy lee"
+#   python "Version 4 resit/gradebook_history.py" compare "2026 T1" "2026 T2"
+if __name__ == "__main__":
+    import gradebook_storage
+
+    history = ScoreHistory().refresh()
+    storage = gradebook_storage.open_storage()
+    # The scores that haven't changed come from the gradebook (sharded storage only reads what is asked for)
+    current = storage.load()
+    if sys.argv[1:2] == ["as-of"] and len(sys.argv) == 3:
+        for name, subjects in sorted(history.as_of(end_of_day(sys.argv[2]), current).items()):
+            print(f"{name.title()}: " + ", ".join(f"{subject} {score}" for subject, score in subjects.items()))
+    elif sys.argv[1:2] == ["trend"] and len(sys.argv) == 3:
+        name = rules.clean_name(sys.argv[2])
+        for term, average in history.student_trend(name, current.get(name)):
+            print(f"{term}: {average:.2f}")
+    elif sys.argv[1:2] == ["compare"] and len(sys.argv) == 4:
+        show = lambda value, sign="": "-" if value is None else f"{value:{sign}.2f}"
+        for subject, (before, after, change) in history.compare_terms(sys.argv[2], sys.argv[3], current).items():
+            print(f"{subject}: {show(before)} -> {show(after)} ({show(change, '+')})")
+    else:
+        print('Usage: python gradebook_history.py as-of YYYY-MM-DD | trend "<name>" | compare "<term>" "<term>"')
+        sys.exit(1)
+    storage.close()
@@ -0,0 +1,143 @@
+# Student Gradebook Manager – Version 4 bulk importer
+# Reads score rows from a CSV file (with a header row) or a JSON-lines file
+# (one {"name": ..., "age": ..., "subject": ..., "score": ...} object per line)
+# without going through the easygui dialogs.
+# Rows are checked with the same rules as the dialogs, turned into journal
+# change records and saved one batch at a time, so memory use stays the same
+# however big the file is. Rejected rows are written to a separate CSV file.
+import csv
+import json
+import sys
+import time
+import gradebook_rules as rules
+
+BATCH_SIZE = 5000  # Rows per batch, each batch is saved with one journal write
+FIELDS = ["name", "age", "subject", "score"]
+
+# Yield (line number, row dict) from a CSV or JSON-lines file, one row at a time
+def read_rows(path):
+    if path.lower().endswith(".csv"):
+        with open(path, "r", newline="", encoding="utf-8-sig") as f:
+            reader = csv.DictReader(f)
+            for row in reader:
+                # Normalise header names so "Name" and " name " both work
+                yield reader.line_num, {clean_header(key): value for key, value in row.items()}
+    else:
+        with open(path, "r", encoding="utf-8") as f:
+            for line_number, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    row = json.loads(line)
+                except json.JSONDecodeError:
+                    yield line_number, None
+                    continue
+                if not isinstance(row, dict):
+                    yield line_number, None
+                    continue
+                yield line_number, {clean_header(key): value for key, value in row.items()}
+
+# Make a column header lower case with no spaces around it
+def clean_header(key):
+    return key.strip().lower() if isinstance(key, str) else key
+
+# Turn one row into journal change records.
+# Returns (changes, None) or (None, reason the row was rejected).
+# new_names holds students added earlier in the same batch (not yet in the gradebook).
+def row_to_changes(row, gradebook, new_names):
+    if row is None:
+        return None, "Row is not valid JSON."
+    name = rules.clean_name(row.get("name"))
+    if not name:
+        return None, "Name cannot be blank."
+    subject = rules.clean_name(row.get("subject"))
+    if not subject:
+        return None, "Subject cannot be blank."
+    score, error = rules.check_score(row.get("score"))
+    if error:
+        return None, f"Score: {error}"
+
+    changes = []
+    age_input = row.get("age")
+    has_age = age_input is not None and str(age_input).strip() != ""
+    if has_age:
+        age, error = rules.check_age(age_input)
+        if error:
+            return None, f"Age: {error}"
+    if name in gradebook or name in new_names:
+        # Existing student, only change the age if the file gives a different one
+        current_age = new_names[name] if name in new_names else gradebook[name]["age"]
+        if has_age and age != current_age:
+            changes.append({"op": "set_age", "name": name, "age": age})
+            new_names[name] = age
+    else:
+        if not has_age:
+            return None, "Age is needed for a new student."
+        changes.append({"op": "add_student", "name": name, "age": age})
+        new_names[name] = age
+    changes.append({"op": "set_score", "name": name, "subject": subject, "score": score})
+    return changes, None
+
+# Import every row in the file.
+# commit_batch(changes) is called once per batch to apply and save the changes.
+# Returns a dict with counts of rows read, imported and rejected.
+def import_file(path, gradebook, commit_batch, rejects_path=None, batch_size=BATCH_SIZE):
+    if rejects_path is None:
+        rejects_path = path + ".rejected.csv"
+    report = {"rows": 0, "imported": 0, "rejected": 0, "batches": 0,
+              "rejects_file": rejects_path, "seconds": 0.0}
+    start = time.perf_counter()
+    batch = []
+    batch_rows = 0
+    new_names = {}
+    with open(rejects_path, "w", newline="", encoding="utf-8") as rejects_file:
+        rejects = csv.writer(rejects_file)
+        rejects.writerow(["line", "reason"] + FIELDS)
+        for line_number, row in read_rows(path):
+            report["rows"] += 1
+            changes, reason = row_to_changes(row, gradebook, new_names)
+            if reason:
+                report["rejected"] += 1
+                values = [row.get(field, "") for field in FIELDS] if row else [""] * len(FIELDS)
+                rejects.writerow([line_number, reason] + values)
+                continue
+            batch.extend(changes)
+            batch_rows += 1
+            if batch_rows >= batch_size:
+                commit_batch(batch)
+                report["imported"] += batch_rows
+                report["batches"] += 1
+                batch = []
+                batch_rows = 0
+                new_names = {}
+        if batch:
+            commit_batch(batch)
+            report["imported"] += batch_rows
+            report["batches"] += 1
+    report["seconds"] = time.perf_counter() - start
+    return report
+
+# Describe an import report in a few lines for a message box or the terminal
+def format_report(report):
+    rate = report["rows"] / report["seconds"] if report["seconds"] else 0
+    text = (f"Rows read: {report['rows']}\n"
+            f"Rows imported: {report['imported']} in {report['batches']} batches\n"
+            f"Rows rejected: {report['rejected']}\n"
+            f"Time: {report['seconds']:.2f}s ({rate:.0f} rows/s)")
+    if report["rejected"]:
+        text += f"\nRejected rows saved to: {report['rejects_file']}"
+    return text
+
+# Import a file from the command line without opening the GUI:
+#   python "Version 4 resit/gradebook_import.py" scores.csv
+if __name__ == "__main__":
+    import gradebook_core as core
+
+    if len(sys.argv) != 2:
+        print("Usage: python gradebook_import.py <scores.csv | scores.jsonl>")
+        sys.exit(1)
+    # The GradeBook catches up with anyone else using the gradebook before adding each batch,
+    # and keeps the score history
+    book = core.GradeBook()
+    print(format_report(book.import_file(sys.argv[1])))
+    book.close()
@@ -0,0 +1,246 @@
+# Student Gradebook Manager – Version 4 write-ahead journal
+# Every change to the gradebook is appended to a journal file as one JSON line,
+# so saving an edit no longer rewrites the whole gradebook_logs.json file.
+# The journal is folded back into the JSON snapshot once it has grown to about
+# the size of the snapshot (see compact_due).
+# Each time that happens the new journal starts with a line holding a new
+# random "generation", so another copy of the program reading the journal can
+# tell it has been restarted and it needs to load the snapshot again.
+import json
+import os
+import uuid
+from collections.abc import Mapping
+import gradebook_metrics as metrics
+import gradebook_snapshot
+from gradebook_records import StudentRecord, copy_record, from_plain_gradebook, plain_json
+
+SNAPSHOT_FILE = "Version 4 resit/gradebook_logs.json"
+JOURNAL_FILE = "Version 4 resit/gradebook_journal.jsonl"
+COMPACT_MIN_BYTES = 256 * 1024  # The snapshot is never rewritten for a journal smaller than this
+COMPACT_RATIO = 1  # ...and otherwise once the journal is this many times the size of the snapshot
+frozen = {}  # id(gradebook) -> the FrozenGradebook being written out from it
+LIVE = object()  # Stands for "not changed since it was frozen, read the gradebook itself"
+
+# Apply one change record to the gradebook dictionary of StudentRecords.
+# Change records look like {"op": "set_score", "name": ..., "subject": ..., "score": ...}
+# Every change also adds one to the student's "version", so copies of the program
+# sharing the gradebook can tell when a student was changed by someone else.
+def apply_change(gradebook, change):
+    op = change["op"]
+    name = change["name"]
+    if frozen:
+        view = frozen.get(id(gradebook))
+        if view is not None:
+            view.keep_original(name)
+    if op == "add_student":
+        old_student = gradebook.get(name)
+        version = old_student.version + 1 if old_student else 1
+        gradebook[name] = StudentRecord(change["age"], version)
+        return
+    student = gradebook.get(name)
+    if student is None:
+        # Change for a student we never saw being added, ignore it
+        return
+    # The record adjusts its total as scores are set and deleted, nothing is re-added
+    if op == "set_age":
+        student.age = change["age"]
+    elif op == "set_score":
+        student["subjects"][change["subject"]] = change["score"]
+    elif op == "delete_subject":
+        student["subjects"].pop(change["subject"], None)
+    else:
+        raise ValueError(f"Unknown journal operation: {op}")
+    student.version += 1
+    # Store it back, so a gradebook that loads students in shards knows which shard changed
+    gradebook[name] = student
+
+# The gradebook as it was when a save was prepared, for writing a snapshot from
+# without holding the gradebook's mutex (so edits carry on in the meantime).
+# Until close(), apply_change copies a record before it changes it (copy on
+# write) and the view reads that copy. Other records are read from the gradebook
+# itself: a read is only kept if the record wasn't copied by the end of it, so
+# it can't have been changed half way through. Only one thread reads a view.
+class FrozenGradebook(Mapping):
+    def __init__(self, gradebook):
+        self.gradebook = gradebook
+        self.originals = {}  # name -> copy of the record before it first changed, None if added since
+        frozen[id(gradebook)] = self
+
+    # Called by apply_change (holding the mutex) just before it changes a student
+    def keep_original(self, name):
+        if name not in self.originals:
+            student = self.gradebook.get(name)
+            self.originals[name] = None if student is None else copy_record(student)
+
+    # A copy of a student as they were when frozen (KeyError if added since).
+    # students is where to find them if unchanged, by default the whole gradebook.
+    def original(self, name, students=None):
+        original = self.originals.get(name, LIVE)
+        if original is LIVE:
+            student = copy_record((self.gradebook if students is None else students)[name])
+            original = self.originals.get(name, LIVE)
+            if original is LIVE:
+                return student
+        if original is None:
+            raise KeyError(name)
+        return original
+
+    def __getitem__(self, name):
+        return self.original(name)
+
+    # Names when frozen, in the gradebook's order (list() copies the keys in one go)
+    def __iter__(self):
+        return (name for name in list(self.gradebook) if self.originals.get(name, LIVE) is not None)
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    # Stop copying records, once the snapshot is written
+    def close(self):
+        if frozen.get(id(self.gradebook)) is self:
+            del frozen[id(self.gradebook)]
+
+# Whether it is time to fold the journal into the snapshot. Rewriting the snapshot
+# takes time in proportion to its size, so it waits until the journal has grown
+# about as big: a bulk import then rewrites it a handful of times instead of every
+# few hundred changes, and loading never replays more than a snapshot's worth of journal.
+def compact_due(journal_bytes, snapshot_bytes):
+    return journal_bytes >= max(COMPACT_MIN_BYTES, snapshot_bytes * COMPACT_RATIO)
+
+# Append change records to the journal and force them onto the disk.
+# Each record is one line, so a crash can only ever damage the last line.
+# Call while holding the gradebook lock: a last line without a newline can then only
+# be left over from a copy that crashed, and it is cut off first so the new records
+# start on a line of their own instead of being glued onto it.
+# Returns the size of the journal afterwards (where the next record will start).
+def append_changes(changes, journal_file=JOURNAL_FILE):
+    lines = "".join(json.dumps(change, separators=(",", ":")) + "\n" for change in changes).encode("utf-8")
+    metrics.count("journal_bytes_written", len(lines))
+    with open(journal_file, "a+b") as f:
+        size = f.seek(0, os.SEEK_END)
+        if size:
+            f.seek(size - 1)
+            if f.read(1) != b"\n":
+                f.seek(0)
+                f.truncate(f.read().rfind(b"\n") + 1)
+        f.write(lines)
+        f.flush()
+        os.fsync(f.fileno())
+        return f.tell()
+
+# Read the generation from the first line of the journal (None for a journal without one)
+def read_generation(journal_file=JOURNAL_FILE):
+    try:
+        with open(journal_file, "rb") as f:
+            first_line = f.readline()
+    except FileNotFoundError:
+        return None
+    try:
+        record = json.loads(first_line)
+    except json.JSONDecodeError:
+        return None
+    return record.get("generation") if record.get("op") == "start" else None
+
+# Read the complete change records in the journal from byte offset start onwards.
+# Returns (list of changes, offset just after the last complete line).
+# A half-written last line (from a crash, or another copy still writing) is left out.
+# A complete line that isn't a change record (e.g. a crash fragment a record was
+# written straight after, by an older version) is skipped, so the records after it still count.
+def read_journal(journal_file=JOURNAL_FILE, start=0):
+    changes = []
+    offset = start
+    try:
+        with open(journal_file, "rb") as f:
+            f.seek(start)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                offset += len(line)
+                try:
+                    change = json.loads(line)
+                except ValueError:
+                    continue
+                if not isinstance(change, dict) or "op" not in change:
+                    continue
+                if change["op"] != "start":
+                    changes.append(change)
+    except FileNotFoundError:
+        pass
+    return changes, offset
+
+# Read the snapshot file, either JSON or a binary snapshot (see gradebook_snapshot.py)
+# Returns a gradebook of StudentRecords.
+def read_snapshot(snapshot_file=SNAPSHOT_FILE):
+    try:
+        if metrics.ENABLED:
+            metrics.count("snapshot_bytes_read", os.path.getsize(snapshot_file))
+        with metrics.span("parse_snapshot"):
+            if snapshot_file.endswith(gradebook_snapshot.EXTENSION):
+                return gradebook_snapshot.load(snapshot_file)
+            with open(snapshot_file, "r") as f:
+                return from_plain_gradebook(json.load(f))
+    except FileNotFoundError:
+        return {}
+
+# Load the snapshot, then replay the journal on top of it.
+# Returns (gradebook, position), where position remembers how far through the
+# journal we have read: {"offset": ..., "generation": ..., "count": ...}
+# A half-written last line from a crash is cut off the file, so the next append
+# starts on a clean line (call this while holding the gradebook lock).
+def load_snapshot_and_journal(snapshot_file=SNAPSHOT_FILE, journal_file=JOURNAL_FILE):
+    gradebook = read_snapshot(snapshot_file)
+    return gradebook, replay_journal(gradebook, journal_file)
+
+# Apply the journal's changes to a gradebook and return the position after them (see above)
+def replay_journal(gradebook, journal_file=JOURNAL_FILE):
+    changes, offset = read_journal(journal_file)
+    for change in changes:
+        apply_change(gradebook, change)
+    if os.path.exists(journal_file) and offset < os.path.getsize(journal_file):
+        with open(journal_file, "r+b") as f:
+            f.truncate(offset)
+    return {"offset": offset, "generation": read_generation(journal_file), "count": len(changes)}
+
+# Write the whole gradebook to the snapshot and start a new, empty journal.
+# Both files are written to a temp file first and then renamed over the old one,
+# so a crash leaves either the old snapshot plus journal or the new snapshot.
+# Every record sets a value outright, so replaying a journal that is already part
+# of the new snapshot (crash before the journal was replaced) gives the same ages and scores.
+# Returns the position at the start of the new journal.
+def compact(gradebook, snapshot_file=SNAPSHOT_FILE, journal_file=JOURNAL_FILE):
+    return write_snapshot(serialize_snapshot(gradebook, snapshot_file), snapshot_file, journal_file)
+
+# The bytes of the snapshot file for the gradebook (binary if the file name ends in .gbs).
+# Give it a FrozenGradebook to do this without holding the gradebook's mutex.
+def serialize_snapshot(gradebook, snapshot_file=SNAPSHOT_FILE):
+    with metrics.span("serialize_snapshot"):
+        if snapshot_file.endswith(gradebook_snapshot.EXTENSION):
+            return gradebook_snapshot.encode(gradebook)
+        if not isinstance(gradebook, dict):
+            gradebook = dict(gradebook.items())  # e.g. a FrozenGradebook, json only takes dicts
+        return json.dumps(gradebook, indent=2, default=plain_json).encode("utf-8")
+
+# Write the bytes from serialize_snapshot and start a new journal, see compact
+def write_snapshot(data, snapshot_file=SNAPSHOT_FILE, journal_file=JOURNAL_FILE):
+    metrics.count("snapshot_bytes_written", len(data))
+    with metrics.span("write_snapshot"):
+        write_file_safely(snapshot_file, data)
+    # Only replace the journal once the new snapshot is safely in place
+    return start_journal(journal_file)
+
+# Replace the journal with an empty one that starts with a new generation.
+# Returns the position at the start of the new journal.
+def start_journal(journal_file=JOURNAL_FILE):
+    generation = uuid.uuid4().hex
+    header = json.dumps({"op": "start", "generation": generation}) + "\n"
+    write_file_safely(journal_file, header)
+    return {"offset": len(header.encode("utf-8")), "generation": generation, "count": 0}
+
+# Write text (or bytes) to a temp file, flush it to disk, then rename it over the real file
+def write_file_safely(path, text):
+    temp_file = path + ".tmp"
+    with open(temp_file, "wb") as f:
+        f.write(text.encode("utf-8") if isinstance(text, str) else text)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_file, path)
@@ -0,0 +1,212 @@
+# Student Gradebook Manager – Version 4 leaderboard
+# Ranks students by their average, and by their score in each subject, without
+# sorting the whole gradebook every time someone asks:
+#   - scores are whole numbers 0-100 and averages are ranked to 2 decimal places
+#     (what the screens show), so every student's ranking key is a whole number
+#     in a small fixed range (KEY_STEPS per point)
+#   - a Fenwick tree (binary indexed tree) counts how many students have each
+#     key, so "how many students are above this one" takes O(log keys) steps
+#   - the names with each key are kept in a set, for top lists and score ranges
+#   - the GradeBook updates it with every change (O(log keys)), like the subject
+#     index and running totals
+# Students with no scores aren't ranked. Students on the same key share a rank.
+import math
+from gradebook_rules import SCORE_MAX
+
+KEY_STEPS = 100  # Average keys per point (2 decimal places)
+
+# Counts for keys 0..size-1, with prefix sums and "find the k-th" in O(log size)
+class FenwickTree:
+    def __init__(self, counts):
+        # Build in one pass: each node adds itself into the next node that covers it
+        self.size = len(counts)
+        self.tree = [0] + list(counts)
+        for i in range(1, self.size + 1):
+            parent = i + (i & -i)
+            if parent <= self.size:
+                self.tree[parent] += self.tree[i]
+        self.total = sum(counts)
+
+    def add(self, key, amount):
+        self.total += amount
+        i = key + 1
+        while i <= self.size:
+            self.tree[i] += amount
+            i += i & -i
+
+    # How many counted keys are <= key
+    def count_up_to(self, key):
+        if key < 0:
+            return 0
+        total = 0
+        i = min(key + 1, self.size)
+        while i > 0:
+            total += self.tree[i]
+            i -= i & -i
+        return total
+
+    # The key of the k-th counted key, lowest first (k starts at 1)
+    def find(self, k):
+        position = 0
+        step = 1 << self.size.bit_length()
+        while step:
+            if position + step <= self.size and self.tree[position + step] < k:
+                position += step
+                k -= self.tree[position]
+            step >>= 1
+        return position
+
+# One ranking: every student's whole-number key, highest first
+class Ranking:
+    def __init__(self, size, keys=None):
+        self.keys = dict(keys or {})  # name -> key
+        self.buckets = {}  # key -> set of names
+        counts = [0] * size
+        for name, key in self.keys.items():
+            self.buckets.setdefault(key, set()).add(name)
+            counts[key] += 1
+        self.tree = FenwickTree(counts)
+
+    def __len__(self):
+        return self.tree.total
+
+    def __contains__(self, name):
+        return name in self.keys
+
+    def set(self, name, key):
+        old_key = self.keys.get(name)
+        if old_key == key:
+            return
+        if old_key is not None:
+            self.remove(name)
+        self.keys[name] = key
+        self.buckets.setdefault(key, set()).add(name)
+        self.tree.add(key, 1)
+
+    def remove(self, name):
+        key = self.keys.pop(name, None)
+        if key is None:
+            return
+        names = self.buckets[key]
+        names.discard(name)
+        if not names:
+            del self.buckets[key]
+        self.tree.add(key, -1)
+
+    # 1 + how many students have a higher key, or None if the student isn't ranked
+    def rank(self, name):
+        key = self.keys.get(name)
+        if key is None:
+            return None
+        return len(self) - self.tree.count_up_to(key) + 1
+
+    # The highest key at or below `key` that someone has, or None
+    def key_at_or_below(self, key):
+        below = self.tree.count_up_to(key)
+        return self.tree.find(below) if below else None
+
+    # (name, key) from the highest key down, names in order within a key.
+    # Only keys between low and high (inclusive), at most limit students.
+    def ranked(self, low=None, high=None, limit=None):
+        low = 0 if low is None else max(low, 0)
+        key = self.key_at_or_below(self.tree.size - 1 if high is None else high)
+        found = []
+        while key is not None and key >= low:
+            for name in sorted(self.buckets[key]):
+                if limit is not None and len(found) >= limit:
+                    return found
+                found.append((name, key))
+            key = self.key_at_or_below(key - 1)
+        return found
+
+# The ranking key of an average: 87.456 -> 8746
+def average_key(total, count):
+    return to_key(total / count)
+
+# Rankings by average and (made when first asked for) by each subject's score
+class Leaderboard:
+    def __init__(self, gradebook, subject_index):
+        self.subject_index = subject_index
+        self.averages = Ranking((SCORE_MAX + 1) * KEY_STEPS, {
+            name: average_key(student["total_score"], student["count_scores"])
+            for name, student in gradebook.items() if student["count_scores"]})
+        self.subjects = {}  # subject -> Ranking of scores
+
+    # The ranking for one subject, made from the subject index the first time it's needed
+    def subject(self, subject):
+        ranking = self.subjects.get(subject)
+        if ranking is None:
+            ranking = self.subjects[subject] = Ranking(SCORE_MAX + 1, self.subject_index.get(subject, {}))
+        return ranking
+
+    # Update the rankings for one journal change record.
+    # Like the subject index, this is called before the change is applied so the old scores are still there.
+    def update(self, gradebook, change):
+        op = change["op"]
+        name = change["name"]
+        student = gradebook.get(name)
+        if student is None:
+            return
+        if op == "add_student":
+            # Re-adding a student starts them again with no scores
+            self.averages.remove(name)
+            for subject in student["subjects"]:
+                if subject in self.subjects:
+                    self.subjects[subject].remove(name)
+            return
+        if op not in ("set_score", "delete_subject"):
+            return
+        subject = change["subject"]
+        old_score = student["subjects"].get(subject)
+        total = student["total_score"] - (old_score or 0)
+        count = student["count_scores"] - (old_score is not None)
+        if op == "set_score":
+            total += change["score"]
+            count += 1
+            if subject in self.subjects:
+                self.subjects[subject].set(name, change["score"])
+        elif subject in self.subjects:
+            self.subjects[subject].remove(name)
+        if count:
+            self.averages.set(name, average_key(total, count))
+        else:
+            self.averages.remove(name)
+
+    def ranking(self, subject=None):
+        return self.subject(subject) if subject else self.averages
+
+    # A student's rank, how many are ranked and the percent of them with a lower
+    # key, or None if the student isn't ranked
+    def rank(self, name, subject=None):
+        ranking = self.ranking(subject)
+        rank = ranking.rank(name)
+        if rank is None:
+            return None
+        below = ranking.tree.count_up_to(ranking.keys[name] - 1)
+        return {"rank": rank, "out_of": len(ranking), "percentile": 100 * below / len(ranking)}
+
+    # [(rank, name, average or score)] for the top students (rank shared by ties)
+    def top(self, n=10, subject=None):
+        ranking = self.ranking(subject)
+        top = []
+        for name, key in ranking.ranked(limit=n):
+            rank = top[-1][0] if top and to_value(key, subject) == top[-1][2] else ranking.rank(name)
+            top.append((rank, name, to_value(key, subject)))
+        return top
+
+    # [(name, average or score)] for students from low to high (inclusive), highest first
+    def between(self, low=None, high=None, subject=None, limit=None):
+        steps = 1 if subject else KEY_STEPS
+        # Only keys inside the range: round low up and high down (after tidying float error)
+        low_key = None if low is None else math.ceil(round(low * steps, 6))
+        high_key = None if high is None else math.floor(round(high * steps, 6))
+        return [(name, to_value(key, subject)) for name, key in self.ranking(subject).ranked(
+            low_key, high_key, limit)]
+
+# The ranking key for an average (87.456 -> 8746) or a subject score (unchanged)
+def to_key(value, subject=None):
+    return value if subject else round(value * KEY_STEPS)
+
+# The average or score a key stands for
+def to_value(key, subject=None):
+    return key if subject else key / KEY_STEPS
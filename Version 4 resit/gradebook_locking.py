@@ -0,0 +1,84 @@
+# Student Gradebook Manager – Version 4 file locking
+# Lets several copies of the program share one gradebook safely. Before a copy
+# reads or writes the shared files it takes an advisory lock on a small
+# ".lock" file next to them, and other copies wait until it is released.
+import os
+import threading
+
+if os.name == "nt":
+    import msvcrt
+else:
+    import fcntl
+
+# A lock on a file that can be taken again by the same thread while it
+# already holds it (only the outermost "with" actually locks and unlocks).
+# Other threads in the same program wait for it too, like other copies do.
+class FileLock:
+    def __init__(self, path):
+        self.path = path
+        self.file = None
+        self.depth = 0
+        self.thread_lock = threading.RLock()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+        return False
+
+    # Take the lock, waiting for it unless blocking is False.
+    # Returns False if it is held by another thread or copy and blocking is False.
+    def acquire(self, blocking=True):
+        if not self.thread_lock.acquire(blocking):
+            return False
+        if self.depth == 0:
+            locked = False
+            try:
+                locked = self.lock_file(blocking)
+            finally:
+                # Didn't get it (or failed): leave nothing held
+                if not locked:
+                    if self.file is not None:
+                        self.file.close()
+                        self.file = None
+                    self.thread_lock.release()
+            if not locked:
+                return False
+        self.depth += 1
+        return True
+
+    # Take the lock on the file itself. Returns False if another copy has it and blocking is False.
+    def lock_file(self, blocking):
+        self.file = open(self.path, "a+b")
+        if os.name == "nt":
+            # msvcrt only waits about 10 seconds each try, so keep trying
+            while True:
+                try:
+                    self.file.seek(0)
+                    msvcrt.locking(self.file.fileno(), msvcrt.LK_LOCK if blocking else msvcrt.LK_NBLCK, 1)
+                    return True
+                except OSError:
+                    if not blocking:
+                        return False
+        else:
+            try:
+                fcntl.flock(self.file.fileno(), fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return False
+            return True
+
+    def release(self):
+        try:
+            self.depth -= 1
+            if self.depth == 0:
+                if os.name == "nt":
+                    self.file.seek(0)
+                    msvcrt.locking(self.file.fileno(), msvcrt.LK_UNLCK, 1)
+                else:
+                    fcntl.flock(self.file.fileno(), fcntl.LOCK_UN)
+                self.file.close()
+                self.file = None
+        finally:
+            self.thread_lock.release()
@@ -0,0 +1,120 @@
+# Student Gradebook Manager – Version 4 timing and profiling
+# Shows where the time goes when the program gets slow: loading, saving,
+# searching, drawing charts, or waiting on dialogs.
+#   - span(name) times a block of code: with metrics.span("save"): ...
+#   - count(name, amount) adds to a counter, e.g. records read or bytes written
+#   - GRADEBOOK_PROFILE=cpu and/or memory (e.g. "cpu,memory") also runs cProfile
+#     and tracemalloc for the whole session
+# Everything is off unless GRADEBOOK_METRICS=1 (or GRADEBOOK_PROFILE is set).
+# While off, span() hands back one shared do-nothing "with" block and count()
+# returns straight away, so the program runs at the same speed.
+# When on, each session adds one JSON line of timings and counters to METRICS_FILE
+# when the program exits, and the profiles are saved next to it.
+import atexit
+import contextlib
+import json
+import os
+import time
+from collections import deque
+from datetime import datetime
+
+METRICS_FILE = "Version 4 resit/gradebook_metrics.jsonl"
+PROFILE_FILE = "Version 4 resit/gradebook_profile.prof"  # cProfile stats, open with pstats or snakeviz
+PROFILE_REPORT_FILE = "Version 4 resit/gradebook_profile.txt"
+MEMORY_REPORT_FILE = "Version 4 resit/gradebook_memory.txt"
+RECENT_TIMES = 1000  # Times kept per span for the percentiles
+REPORT_LINES = 30
+
+PROFILE = {part.strip() for part in os.environ.get("GRADEBOOK_PROFILE", "").lower().split(",") if part.strip()}
+ENABLED = os.environ.get("GRADEBOOK_METRICS", "") not in ("", "0") or bool(PROFILE)
+
+spans = {}  # name -> {"count", "total", "max", "recent": deque of the last RECENT_TIMES times}
+counters = {}
+session = {"started": None, "profiler": None}
+NO_SPAN = contextlib.nullcontext()
+
+# Time one named block of code (does nothing unless metrics are on)
+def span(name):
+    if not ENABLED:
+        return NO_SPAN
+    return timed_span(name)
+
+@contextlib.contextmanager
+def timed_span(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        add_time(name, time.perf_counter() - start)
+
+# Record how long one span took
+def add_time(name, seconds):
+    stats = spans.get(name)
+    if stats is None:
+        stats = spans[name] = {"count": 0, "total": 0.0, "max": 0.0, "recent": deque(maxlen=RECENT_TIMES)}
+    stats["count"] += 1
+    stats["total"] += seconds
+    stats["max"] = max(stats["max"], seconds)
+    stats["recent"].append(seconds)
+
+# Add to a counter (does nothing unless metrics are on)
+def count(name, amount=1):
+    if not ENABLED:
+        return
+    counters[name] = counters.get(name, 0) + amount
+
+# Start measuring the session: turn on any profilers and save everything at exit
+def start():
+    if not ENABLED or session["started"]:
+        return
+    session["started"] = datetime.now().isoformat(timespec="seconds")
+    if "cpu" in PROFILE:
+        import cProfile
+        session["profiler"] = cProfile.Profile()
+        session["profiler"].enable()
+    if "memory" in PROFILE:
+        import tracemalloc
+        tracemalloc.start()
+    atexit.register(finish)
+
+# Timings and counters so far, as a dict that can be saved as JSON
+def summary():
+    result = {"started": session["started"], "ended": datetime.now().isoformat(timespec="seconds"),
+              "spans": {}, "counters": dict(counters)}
+    for name, stats in sorted(spans.items()):
+        recent = sorted(stats["recent"])
+        result["spans"][name] = {
+            "count": stats["count"], "total_ms": round(stats["total"] * 1000, 3),
+            "mean_ms": round(stats["total"] / stats["count"] * 1000, 3), "max_ms": round(stats["max"] * 1000, 3),
+            "p50_ms": round(recent[len(recent) // 2] * 1000, 3),
+            "p95_ms": round(recent[min(len(recent) - 1, int(len(recent) * 0.95))] * 1000, 3),
+        }
+    return result
+
+# Add this session's metrics to the metrics file and save any profiles
+def finish():
+    if not session["started"]:
+        return
+    with open(METRICS_FILE, "a") as f:
+        f.write(json.dumps(summary()) + "\n")
+    # Memory first, so the profile report doesn't show up in it
+    if "memory" in PROFILE:
+        import tracemalloc
+        if tracemalloc.is_tracing():
+            current, peak = tracemalloc.get_traced_memory()
+            top = tracemalloc.take_snapshot().statistics("lineno")[:REPORT_LINES]
+            tracemalloc.stop()
+            with open(MEMORY_REPORT_FILE, "w") as f:
+                f.write(f"Current: {current / 1e6:.1f} MB   Peak: {peak / 1e6:.1f} MB\n\n")
+                f.write("\n".join(str(line) for line in top) + "\n")
+    profiler = session["profiler"]
+    if profiler is not None:
+        import io
+        import pstats
+        profiler.disable()
+        profiler.dump_stats(PROFILE_FILE)
+        report = io.StringIO()
+        pstats.Stats(profiler, stream=report).sort_stats("cumulative").print_stats(REPORT_LINES)
+        with open(PROFILE_REPORT_FILE, "w") as f:
+            f.write(report.getvalue())
+    session["started"] = None
@@ -0,0 +1,250 @@
+# Student Gradebook Manager – Version 4 text log migrator
+# Versions 1 and 2 kept their students as text summaries appended to
+# gradebook_logs.txt, one block per save:
+#   Name: Amy Lee
+#   Age: 15
+#   Subjects and Scores:
+#     Maths: 88
+#   Average Score: 88.00
+#   ----------------------------------------
+# This reads such a log CHUNK_SIZE characters at a time, split at the separator
+# lines, however big it is, and turns it into a gradebook. The same student can
+# be saved many times, and the last summary in the log wins (subjects missing
+# from it are deleted). It writes to:
+#   - a JSON file in the Version 3/4 format ({name: {"age", "subjects",
+#     "total_score", "count_scores"}}), which holds one entry per student
+#     (names and subjects in lower case, as this version keeps them)
+#   - or this version's gradebook (any storage backend), in batches of
+#     BATCH_SIZE summaries, so memory use stays the same however many students
+#     there are (with GRADEBOOK_STORAGE=sharded the gradebook isn't all loaded either)
+# Blocks that aren't a readable summary, or break this version's rules (like an
+# age or score out of range), are written to a rejects CSV file.
+import csv
+import json
+import os
+import sys
+import time
+import gradebook_journal as journal
+import gradebook_rules as rules
+
+BATCH_SIZE = 5000  # Summaries per batch when migrating into the gradebook
+CHUNK_SIZE = 1 << 20  # Characters read from the log at a time
+SEPARATOR = "-" * 40
+SEPARATOR_LINE = "\n" + SEPARATOR + "\n"
+
+# Yield (line number, lines) for every summary block in a log, one at a time.
+# A last block with no separator after it (the program stopped while saving) is still read.
+def read_blocks(path):
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        # Start with a newline so a separator on the very first line is found too (it makes a blank line 0)
+        buffer = "\n"
+        line_number = 0  # Line number of the first line in the buffer
+        while True:
+            chunk = f.read(CHUNK_SIZE)
+            # At the end, finish the last line in case it is a separator with no newline
+            parts = (buffer + (chunk or "\n")).split(SEPARATOR_LINE)
+            # The last part may carry on in the next chunk
+            buffer = parts.pop() if chunk else ""
+            for part in parts:
+                block = summary_lines(part.split("\n"), line_number)
+                if block:
+                    yield block
+                # The part's lines, then the separator line
+                line_number += part.count("\n") + 2
+            if not chunk:
+                return
+
+# (line number, lines) for the summary in one part of the log, or None if it's blank.
+# Blank lines around it are dropped, and so are extra separators (two in a row
+# are split as one, leaving the second at the start of the next part).
+def summary_lines(lines, first_line):
+    start = 0
+    while start < len(lines) and (not lines[start].strip() or lines[start] == SEPARATOR):
+        start += 1
+    end = len(lines)
+    while end > start and not lines[end - 1].strip():
+        end -= 1
+    if start == end:
+        return None
+    return first_line + start, lines[start:end]
+
+# Turn one summary block back into a name and a Version 3/4 student dict.
+# Returns (name, student, None) or (name or None, None, reason the block was rejected).
+def parse_block(lines):
+    if len(lines) < 3 or not lines[0].startswith("Name: ") or not lines[1].startswith("Age: ") \
+            or lines[2].strip() != "Subjects and Scores:":
+        return None, None, "Not a student summary."
+    name = lines[0][len("Name: "):].strip()
+    if not name:
+        return None, None, "Name is blank."
+    try:
+        age = int(lines[1][len("Age: "):])
+    except ValueError:
+        return name, None, "Age is not a whole number."
+    subjects = {}
+    for line in lines[3:]:
+        if line.startswith("Average Score:"):
+            continue
+        subject, found, score = line.strip().rpartition(": ")
+        if not line.startswith("  ") or not found:
+            return name, None, f"Unexpected line: {line.strip()[:40]}"
+        try:
+            subjects[subject] = int(score)
+        except ValueError:
+            return name, None, f"Score for {subject} is not a whole number."
+    student = {"age": age, "subjects": subjects,
+               "total_score": sum(subjects.values()), "count_scores": len(subjects)}
+    return name, student, None
+
+# Yield (line number, name, student, reason) for every block in the log
+def read_summaries(path):
+    for line_number, lines in read_blocks(path):
+        name, student, reason = parse_block(lines)
+        yield line_number, name, student, reason
+
+# A summary under this version's rules: names and subjects in lower case, ages and scores in range.
+# Returns (name, student, None) or (None, None, reason the summary was rejected).
+def clean_summary(name, student):
+    name = rules.clean_name(name)
+    age, error = rules.check_age(student["age"])
+    if error:
+        return None, None, f"Age: {error}"
+    subjects = {}
+    for subject, score in student["subjects"].items():
+        score, error = rules.check_score(score)
+        if error:
+            return None, None, f"Score for {subject}: {error}"
+        if not rules.clean_name(subject):
+            return None, None, "Subject cannot be blank."
+        subjects[rules.clean_name(subject)] = score
+    student = {"age": age, "subjects": subjects,
+               "total_score": sum(subjects.values()), "count_scores": len(subjects)}
+    return name, student, None
+
+# The journal change records that make a student in the gradebook match a summary (see clean_summary).
+# Returns (changes, None) or (None, reason the summary was rejected).
+def summary_to_changes(name, student, gradebook):
+    name, student, reason = clean_summary(name, student)
+    if reason:
+        return None, reason
+    age, subjects = student["age"], student["subjects"]
+    current = gradebook.get(name)
+    if current is None:
+        changes = [{"op": "add_student", "name": name, "age": age}]
+        old_subjects = {}
+    else:
+        changes = [{"op": "set_age", "name": name, "age": age}] if current["age"] != age else []
+        old_subjects = current["subjects"]
+    changes += [{"op": "delete_subject", "name": name, "subject": subject}
+                for subject in old_subjects if subject not in subjects]
+    changes += [{"op": "set_score", "name": name, "subject": subject, "score": score}
+                for subject, score in subjects.items() if old_subjects.get(subject) != score]
+    return changes, None
+
+# Migrate a log, calling save(name, student) for each readable summary in order.
+# Returns a report dict with counts, time taken and where the rejects were written.
+def migrate(path, save, rejects_path=None):
+    if rejects_path is None:
+        rejects_path = path + ".rejected.csv"
+    report = {"summaries": 0, "migrated": 0, "rejected": 0, "students": 0, "bytes": os.path.getsize(path),
+              "rejects_file": rejects_path, "seconds": 0.0}
+    start = time.perf_counter()
+    with open(rejects_path, "w", newline="", encoding="utf-8") as rejects_file:
+        rejects = csv.writer(rejects_file)
+        rejects.writerow(["line", "reason", "name"])
+        for line_number, name, student, reason in read_summaries(path):
+            report["summaries"] += 1
+            if reason is None:
+                reason = save(name, student)
+            if reason:
+                report["rejected"] += 1
+                rejects.writerow([line_number, reason, name or ""])
+                continue
+            report["migrated"] += 1
+    report["seconds"] = time.perf_counter() - start
+    return report
+
+# Migrate a log into a Version 3/4 JSON gradebook file (written at the end, under a temporary name).
+# Summaries are checked with this version's rules first, the same as migrate_to_gradebook.
+def migrate_to_json(path, out_path, rejects_path=None):
+    gradebook = {}
+
+    def save(name, student):
+        name, student, reason = clean_summary(name, student)
+        if reason:
+            return reason
+        # Saving again moves the student to the end, so they are listed in the order last saved
+        gradebook.pop(name, None)
+        gradebook[name] = student
+        return None
+
+    report = migrate(path, save, rejects_path)
+    start = time.perf_counter()
+    journal.write_file_safely(out_path, json.dumps(gradebook, indent=2))
+    report["seconds"] += time.perf_counter() - start
+    report["students"] = len(gradebook)
+    return report
+
+# Migrate a log into this version's gradebook (a GradeBook from gradebook_core.py).
+# The latest summary of each student in a batch is turned into changes and saved in one go.
+def migrate_to_gradebook(path, book, rejects_path=None, batch_size=BATCH_SIZE):
+    latest = {}  # name -> latest summary in this batch
+
+    def save_batch():
+        changes = []
+        for name, student in latest.items():
+            # Already checked in save(), only the changes are needed
+            changes += summary_to_changes(name, student, book.students)[0]
+        book.record_changes(changes)
+        latest.clear()
+
+    def save(name, student):
+        # Check the summary now, so the rejects file says which line it came from
+        _, reason = summary_to_changes(name, student, {})
+        if reason:
+            return reason
+        name = rules.clean_name(name)
+        latest.pop(name, None)
+        latest[name] = student
+        if len(latest) >= batch_size:
+            save_batch()
+        return None
+
+    report = migrate(path, save, rejects_path)
+    start = time.perf_counter()
+    save_batch()
+    report["seconds"] += time.perf_counter() - start
+    report["students"] = len(book)
+    return report
+
+# Describe a migration report in a few lines for the terminal
+def format_report(report):
+    seconds = report["seconds"] or 1e-9
+    text = (f"Summaries read: {report['summaries']}\n"
+            f"Summaries migrated: {report['migrated']} ({report['students']} students in the gradebook)\n"
+            f"Summaries rejected: {report['rejected']}\n"
+            f"Time: {report['seconds']:.2f}s ({report['summaries'] / seconds:.0f} summaries/s, "
+            f"{report['bytes'] / seconds / 1e6:.1f} MB/s)")
+    if report["rejected"]:
+        text += f"\nRejected summaries listed in: {report['rejects_file']}"
+    return text
+
+# Migrate from the command line:
+#   python "Version 4 resit/gradebook_migrate.py" "Version 1/gradebook_logs.txt"            (into this gradebook)
+#   python "Version 4 resit/gradebook_migrate.py" "Version 2/gradebook_logs.txt" old.json   (Version 3/4 JSON file)
+if __name__ == "__main__":
+    if len(sys.argv) not in (2, 3):
+        print("Usage: python gradebook_migrate.py <gradebook_logs.txt> [<gradebook_logs.json>]")
+        sys.exit(1)
+    if len(sys.argv) == 3:
+        result = migrate_to_json(sys.argv[1], sys.argv[2])
+    else:
+        import gradebook_core as core
+
+        gradebook = core.GradeBook()
+        try:
+            result = migrate_to_gradebook(sys.argv[1], gradebook)
+            gradebook.save()
+        finally:
+            gradebook.close()
+    print(format_report(result))
@@ -0,0 +1,71 @@
+# Student Gradebook Manager – Version 4 paged student list
+# Shows the student list one page at a time instead of building one huge
+# string of every name. Names come from a list that is already sorted
+# (the search index keeps one up to date), and only the names on the page
+# being shown are looked at and formatted.
+# Pages can be filtered by an age range and/or a subject.
+
+PAGE_SIZE = 25
+
+# Set up a pager over a sorted list of names.
+# Leave min_age/max_age as None for no age limit, and subject_students as None
+# for no subject filter (otherwise it is the {name: score} dict for the subject).
+def make_pager(sorted_names, gradebook, min_age=None, max_age=None, subject_students=None, page_size=PAGE_SIZE):
+    if subject_students is not None:
+        # Only the students who took the subject need sorting
+        sorted_names = sorted(subject_students)
+    return {"names": sorted_names, "gradebook": gradebook, "min_age": min_age, "max_age": max_age,
+            "page_size": page_size, "page_starts": [0], "filtered": min_age is not None or max_age is not None}
+
+# Check a student against the pager's age range
+def matches_filter(pager, name):
+    age = pager["gradebook"][name]["age"]
+    if pager["min_age"] is not None and age < pager["min_age"]:
+        return False
+    if pager["max_age"] is not None and age > pager["max_age"]:
+        return False
+    return True
+
+# Return (names on the page, whether there is a next page) for a page number starting at 0.
+# Where each page starts is remembered, so going forwards and back never rescans earlier pages.
+def get_page(pager, page_number):
+    names = pager["names"]
+    size = pager["page_size"]
+    starts = pager["page_starts"]
+    if not pager["filtered"]:
+        start = page_number * size
+        return names[start:start + size], start + size < len(names)
+    # Walk forward from the last page we know the start of
+    while len(starts) <= page_number and starts[-1] < len(names):
+        scan_page(pager, len(starts) - 1)
+    if page_number >= len(starts):
+        return [], False
+    page, next_start = scan_page(pager, page_number)
+    return page, next_start < len(names) and any_match_from(pager, next_start)
+
+# Collect one filtered page and remember where the next page starts
+def scan_page(pager, page_number):
+    names = pager["names"]
+    position = pager["page_starts"][page_number]
+    page = []
+    while position < len(names) and len(page) < pager["page_size"]:
+        if matches_filter(pager, names[position]):
+            page.append(names[position])
+        position += 1
+    if page_number + 1 == len(pager["page_starts"]):
+        pager["page_starts"].append(position)
+    return page, position
+
+# Check whether any name from position onwards passes the filter
+def any_match_from(pager, position):
+    names = pager["names"]
+    for index in range(position, len(names)):
+        if matches_filter(pager, names[index]):
+            return True
+    return False
+
+# Number of pages, if it is known without scanning (only for unfiltered lists)
+def page_count(pager):
+    if pager["filtered"]:
+        return None
+    return max(1, -(-len(pager["names"]) // pager["page_size"]))
@@ -0,0 +1,174 @@
+# Student Gradebook Manager – Version 4 compact student records
+# A student used to be a dict holding another dict of subject names, plus
+# "total_score" and "count_scores" fields. That is several hundred bytes per
+# student, so a district-wide gradebook didn't fit in RAM on a small server.
+# A StudentRecord keeps the same information in a __slots__ object:
+#   - subjects are numbers that index into one shared table of subject names
+#   - subject numbers and scores are kept in two small arrays (2 bytes and 1 byte each)
+#   - the total is kept as the scores change, the count is the length of the array
+# Records can still be read and written like the old dicts, e.g. student["age"],
+# student["subjects"][subject] = score, student["subjects"].items(), so the rest
+# of the program works the same. They are turned back into plain dicts when saved
+# as JSON or sent to other programs (to_dict, plain_json).
+import gc
+from array import array
+from collections.abc import MutableMapping
+
+# Shared table of every subject name seen, and each name's number in it
+subject_names = []
+subject_numbers = {}
+
+# Look up a subject's number, adding it to the table if it is new
+def subject_number(subject):
+    number = subject_numbers.get(subject)
+    if number is None:
+        number = len(subject_names)
+        subject_names.append(subject)
+        subject_numbers[subject] = number
+    return number
+
+# One student: age, version, and their subjects and scores
+class StudentRecord:
+    __slots__ = ("age", "version", "total_score", "subject_ids", "scores")
+
+    # subject_ids and scores are arrays("H") and ("B") that the record takes over
+    def __init__(self, age, version=0, subject_ids=None, scores=None):
+        self.age = age
+        self.version = version
+        self.subject_ids = subject_ids if subject_ids is not None else array("H")
+        self.scores = scores if scores is not None else array("B")
+        self.total_score = sum(self.scores)
+
+    # Read a field the same way as the old student dicts
+    def __getitem__(self, key):
+        if key == "subjects":
+            return SubjectScores(self)
+        if key == "count_scores":
+            return len(self.scores)
+        if key in ("age", "version", "total_score"):
+            return getattr(self, key)
+        raise KeyError(key)
+
+    # Only age and version can be set directly, scores go through student["subjects"]
+    def __setitem__(self, key, value):
+        if key not in ("age", "version"):
+            raise KeyError(f"{key} can't be set on a student record")
+        setattr(self, key, value)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __repr__(self):
+        return f"StudentRecord({to_dict(self)})"
+
+# The subjects and scores of one record, used like a {subject: score} dict
+class SubjectScores(MutableMapping):
+    __slots__ = ("record",)
+
+    def __init__(self, record):
+        self.record = record
+
+    # Where the subject is in the record's arrays, or None
+    def position(self, subject):
+        number = subject_numbers.get(subject)
+        if number is None:
+            return None
+        try:
+            return self.record.subject_ids.index(number)
+        except ValueError:
+            return None
+
+    def __getitem__(self, subject):
+        i = self.position(subject)
+        if i is None:
+            raise KeyError(subject)
+        return self.record.scores[i]
+
+    def __setitem__(self, subject, score):
+        record = self.record
+        i = self.position(subject)
+        # The score goes in first: if it doesn't fit in the array (OverflowError) or
+        # isn't a whole number (TypeError), the record is left as it was
+        if i is None:
+            record.scores.append(score)
+            try:
+                record.subject_ids.append(subject_number(subject))
+            except OverflowError:
+                record.scores.pop()
+                raise
+        else:
+            old_score = record.scores[i]
+            record.scores[i] = score
+            record.total_score -= old_score
+        record.total_score += score
+
+    def __delitem__(self, subject):
+        record = self.record
+        i = self.position(subject)
+        if i is None:
+            raise KeyError(subject)
+        record.total_score -= record.scores[i]
+        del record.subject_ids[i]
+        del record.scores[i]
+
+    def __contains__(self, subject):
+        return self.position(subject) is not None
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.record.scores)
+
+    # Faster than looking up each subject in turn
+    def keys(self):
+        return [subject_names[number] for number in self.record.subject_ids]
+
+    def values(self):
+        return list(self.record.scores)
+
+    def items(self):
+        return list(zip(self.keys(), self.record.scores))
+
+    def __repr__(self):
+        return repr(dict(self.items()))
+
+# Make a record from an old-style student dict (from a JSON file)
+def from_dict(student):
+    subjects = student["subjects"]
+    for subject in subjects:
+        if subject not in subject_numbers:
+            subject_number(subject)
+    return StudentRecord(student["age"], student.get("version", 0),
+                         array("H", map(subject_numbers.__getitem__, subjects)), array("B", subjects.values()))
+
+# A separate copy of a record, that changes to the original don't touch
+def copy_record(student):
+    return StudentRecord(student.age, student.version, array("H", student.subject_ids), array("B", student.scores))
+
+# Turn a record back into a plain student dict
+def to_dict(student):
+    return {"age": student.age, "subjects": dict(SubjectScores(student).items()), "total_score": student.total_score,
+            "count_scores": len(student.scores), "version": student.version}
+
+# Turn a whole gradebook of plain student dicts into records
+def from_plain_gradebook(gradebook):
+    # None of the new records can be garbage, so don't let the collector keep scanning them
+    collecting = gc.isenabled()
+    gc.disable()
+    try:
+        return {name: from_dict(student) for name, student in gradebook.items()}
+    finally:
+        if collecting:
+            gc.enable()
+
+# "default" for json.dump, so records and subject views are saved as plain JSON objects
+def plain_json(value):
+    if isinstance(value, StudentRecord):
+        return to_dict(value)
+    if isinstance(value, SubjectScores):
+        return dict(value.items())
+    raise TypeError(f"{type(value).__name__} can't be saved as JSON")
@@ -0,0 +1,45 @@
+# Student Gradebook Manager – Version 4 validation rules
+# The limits and checks for ages and scores, shared by the easygui screens
+# and the bulk importer so both accept exactly the same values.
+
+# Constants
+AGE_MIN = 7
+AGE_MAX = 18
+SCORE_MIN = 0
+SCORE_MAX = 100
+
+# A whole number as text, from a string or an int (anything else, like a
+# decimal or a list sent to the server, comes back blank and is refused)
+def number_text(value):
+    if isinstance(value, bool):
+        return ""
+    if isinstance(value, int):
+        return str(value)
+    return value.strip() if isinstance(value, str) else ""
+
+# Check an age typed in or read from a file.
+# Returns (age, None) if it is valid, or (None, error message) if not.
+def check_age(age_input):
+    age_input = number_text(age_input)
+    if not age_input.isdecimal():
+        return None, "Invalid input. Please enter a number."
+    age = int(age_input)
+    if age < AGE_MIN or age > AGE_MAX:
+        return None, f"Age must be between {AGE_MIN} and {AGE_MAX}."
+    return age, None
+
+# Check a score typed in or read from a file.
+# Returns (score, None) if it is valid, or (None, error message) if not.
+def check_score(score_input):
+    score_input = number_text(score_input)
+    if not score_input.isdecimal():
+        return None, "Invalid input. Please enter a number."
+    score = int(score_input)
+    if score < SCORE_MIN or score > SCORE_MAX:
+        return None, f"Score must be between {SCORE_MIN} and {SCORE_MAX}."
+    return score, None
+
+# Tidy up a student or subject name so it matches the gradebook keys
+# (anything that isn't text, e.g. a list sent to the server, comes back blank)
+def clean_name(name):
+    return name.strip().lower() if isinstance(name, str) else ""
@@ -0,0 +1,145 @@
+# Student Gradebook Manager – Version 4 background saver
+# Saving an edit means appending to the journal and waiting for the disk (and
+# now and then rewriting the whole snapshot, see journal.compact_due). With a
+# WriteBehindSaver the screens don't wait for that:
+#   - the GradeBook applies each change in memory straight away and hands it
+#     to the saver, which returns at once
+#   - a background thread waits DELAY seconds for more edits to arrive and then
+#     saves them all together (one journal write / transaction per burst)
+#   - the batch is taken while holding the gradebook's lock, but the disk writes
+#     happen after it is let go, so the screens can keep reading and editing
+#     while a burst is being saved (only other savers wait, on the shared file lock)
+#   - flush() waits until everything handed over so far is on disk, and close()
+#     does the same before stopping the thread. close() is also called when the
+#     program exits, so edits aren't lost if the window is just closed.
+#   - if a save fails the changes are kept, and the error is raised by the next
+#     check() or flush() so it can be shown to the user
+# The snapshot itself is still written to a temporary file and renamed into
+# place (see journal.write_file_safely), so a crash never leaves half a file.
+import atexit
+import threading
+import time
+import gradebook_metrics as metrics
+
+DELAY = 0.5  # Seconds to wait for more edits before saving a burst
+
+class WriteBehindSaver:
+    # write_changes() saves the changes waiting, which are already applied in memory:
+    # it takes them with take_batch() and calls batch_saved() once they are on disk.
+    def __init__(self, write_changes, delay=DELAY):
+        self.write_changes = write_changes
+        self.delay = delay
+        self.condition = threading.Condition()
+        self.pending = []  # Changes waiting to be saved, oldest first
+        self.saving = []  # The batch being saved now, older than the pending ones
+        self.submitted = 0  # Changes handed over so far
+        self.saved = 0  # Changes saved so far
+        self.error = None  # Why the last save failed, until it is reported
+        self.hurry = False  # Save now without waiting for more edits
+        self.stopping = False
+        self.thread = threading.Thread(target=self.run, name="gradebook-saver", daemon=True)
+        self.thread.start()
+        atexit.register(self.close)
+
+    # Hand over changes to be saved soon. Returns straight away.
+    def submit(self, changes):
+        if not changes:
+            return
+        with self.condition:
+            self.pending.extend(changes)
+            self.submitted += len(changes)
+            self.condition.notify_all()
+
+    # The changes handed over but not saved yet, oldest first
+    def waiting(self):
+        with self.condition:
+            return self.saving + self.pending
+
+    # Take every change waiting as the batch to save now, and return it.
+    # Called by write_changes while nothing can add changes (holding the gradebook's lock),
+    # so the batch matches what is in memory.
+    def take_batch(self):
+        with self.condition:
+            self.saving.extend(self.pending)
+            self.pending = []
+            return list(self.saving)
+
+    # The batch from take_batch is on disk. Called by write_changes before it lets go of the
+    # shared file lock, so nothing that catches up with the saved changes still counts it as waiting.
+    def batch_saved(self):
+        with self.condition:
+            self.saved += len(self.saving)
+            self.saving = []
+            self.condition.notify_all()
+
+    # Raise the error from a save that failed since last time, if there was one
+    def check(self):
+        with self.condition:
+            self.raise_error()
+
+    # Wait until every change handed over so far is saved.
+    # Returns False if that took longer than timeout seconds.
+    def flush(self, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.condition:
+            target = self.submitted
+            self.hurry = True
+            self.condition.notify_all()
+            while self.saved < target:
+                self.raise_error()
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self.condition.wait(remaining)
+            self.raise_error()
+            return True
+
+    # Save everything and stop the background thread
+    def close(self):
+        with self.condition:
+            if self.stopping:
+                return
+        try:
+            self.flush()
+        finally:
+            with self.condition:
+                self.stopping = True
+                self.condition.notify_all()
+            self.thread.join()
+            atexit.unregister(self.close)
+
+    # Raise (once) the error from a failed save. Call while holding the condition.
+    def raise_error(self):
+        if self.error is not None:
+            error, self.error = self.error, None
+            # The failed changes are tried again now the error has been seen
+            self.condition.notify_all()
+            raise error
+
+    # The background thread: wait for edits, let a burst build up, then save it
+    def run(self):
+        while True:
+            with self.condition:
+                while not (self.pending and self.error is None) and not self.stopping:
+                    self.condition.wait()
+                if not self.pending:
+                    return
+                # More edits that arrive in the next moment are saved with these
+                deadline = time.monotonic() + self.delay
+                while not self.hurry and not self.stopping and time.monotonic() < deadline:
+                    self.condition.wait(deadline - time.monotonic())
+                self.hurry = False
+            try:
+                with metrics.span("background_save"):
+                    self.write_changes()
+            except Exception as error:
+                with self.condition:
+                    # Keep the changes that weren't saved to try again with the next edit or flush
+                    self.pending = self.saving + self.pending
+                    self.saving = []
+                    self.error = error
+                    self.condition.notify_all()
+                    if self.stopping:
+                        return
+                continue
+            metrics.count("background_saves")
@@ -0,0 +1,120 @@
+# Student Gradebook Manager – Version 4 name search
+# Finds students by exact name, by the start of their name (for partly typed
+# names) and by names that are spelt slightly wrong.
+#   - exact matches use the gradebook dict directly
+#   - prefix matches use a sorted list of names and binary search (bisect)
+#   - typo matches use an index of 3-letter pieces of each name (trigrams) to
+#     pick a few likely names, then check them with a capped edit distance
+#     (only names of about the same length that share enough trigrams, and at
+#     most MAX_CANDIDATES of them, are checked)
+import bisect
+import heapq
+
+MAX_TYPOS = 2  # Largest edit distance still counted as a match
+MAX_RESULTS = 10
+MAX_CANDIDATES = 200  # Most names checked with the edit distance per search
+
+# Split a name into padded 3-letter pieces, e.g. "amy" -> "$$a", "$am", "amy", "my$"
+def trigrams(name):
+    padded = f"$${name}$"
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+# Build the search index for every name already in the gradebook
+def build_search_index(gradebook):
+    index = {"names": sorted(gradebook), "grams": {}}
+    for name in index["names"]:
+        for gram in trigrams(name):
+            index["grams"].setdefault(gram, set()).add(name)
+    return index
+
+# Add a new name to the search index (does nothing if it is already there)
+def add_name(index, name):
+    names = index["names"]
+    position = bisect.bisect_left(names, name)
+    if position < len(names) and names[position] == name:
+        return
+    names.insert(position, name)
+    for gram in trigrams(name):
+        index["grams"].setdefault(gram, set()).add(name)
+
+# Return up to limit names that start with the prefix, in alphabetical order
+def prefix_matches(index, prefix, limit=MAX_RESULTS):
+    names = index["names"]
+    start = bisect.bisect_left(names, prefix)
+    results = []
+    for name in names[start:start + limit]:
+        if not name.startswith(prefix):
+            break
+        results.append(name)
+    return results
+
+# Edit distance between two names, giving up early once it is over max_distance.
+# Returns max_distance + 1 if the names are further apart than that.
+def edit_distance(a, b, max_distance=MAX_TYPOS):
+    too_far = max_distance + 1
+    if abs(len(a) - len(b)) > max_distance:
+        return too_far
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        # Only letters within max_distance of the same position can line up, the
+        # rest of the row is already too far
+        low = max(1, i - max_distance)
+        high = min(len(b), i + max_distance)
+        current = [too_far] * (len(b) + 1)
+        current[0] = min(i, too_far)
+        for j in range(low, high + 1):
+            cost = 0 if char_a == b[j - 1] else 1
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+        if min(current[low - 1:high + 1]) > max_distance:
+            return too_far
+        previous = current
+    return min(previous[-1], too_far)
+
+# Return up to limit (distance, name) pairs for names within max_distance edits
+# of the query, closest first
+def fuzzy_matches(index, query, max_distance=MAX_TYPOS, limit=MAX_RESULTS):
+    query_grams = trigrams(query)
+    # Each typo adds or removes at most 3 different trigrams, so a real match is
+    # missing at most 3 * max_distance of the query's trigrams. It must have one of
+    # any 3 * max_distance + 1 of them, so only the names with the rarest ones are looked at.
+    typo_grams = 3 * max_distance
+    postings = sorted((index["grams"].get(gram, set()) for gram in query_grams), key=len)
+    needed = max(1, len(postings) - typo_grams)
+    candidates = []
+    for name in set().union(*postings[:typo_grams + 1]):
+        if abs(len(name) - len(query)) > max_distance:
+            continue
+        # Count the query's trigrams the name has, giving up once too many are missing
+        shared = missing = 0
+        for names in postings:
+            if name in names:
+                shared += 1
+            else:
+                missing += 1
+                if missing > typo_grams:
+                    break
+        if shared >= needed:
+            candidates.append((shared, name))
+    results = []
+    # Names sharing the most trigrams are the likeliest matches
+    for shared, name in heapq.nlargest(MAX_CANDIDATES, candidates):
+        distance = edit_distance(query, name, max_distance)
+        if distance <= max_distance:
+            results.append((distance, name))
+    results.sort()
+    return results[:limit]
+
+# Ranked search used by the search screen: exact match first, then names that
+# start with the query, then names with small typos
+def search_names(index, gradebook, query, limit=MAX_RESULTS):
+    query = query.strip().lower()
+    results = []
+    if query in gradebook:
+        results.append(query)
+    for name in prefix_matches(index, query, limit + 1):
+        if name not in results:
+            results.append(name)
+    for distance, name in fuzzy_matches(index, query, limit=limit):
+        if name not in results:
+            results.append(name)
+    return results[:limit]
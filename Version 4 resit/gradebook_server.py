@@ -0,0 +1,292 @@
+# Student Gradebook Manager – Version 4 HTTP/JSON server
+# Runs the gradebook without the easygui screens, so other programs (the
+# timetable and LMS systems) can add students and push scores over HTTP:
+#   python "Version 4 resit/gradebook_server.py" [port]
+# It only listens on localhost. Requests and replies are JSON:
+#   GET    /students?prefix=&offset=&limit=     list names (sorted)
+#   GET    /students/<name>                     one student with their average
+#   POST   /students             {"name", "age"}  add a student
+#   PATCH  /students/<name>      {"age"}          change a student's age
+#   PUT    /students/<name>/scores/<subject>  {"score"}  set a score
+#   DELETE /students/<name>/scores/<subject>        delete a score
+#   GET    /search?q=<text>                     exact, prefix and typo matches
+#   GET    /stats                               school totals and every subject
+#   GET    /subjects/<subject>?top=5            one subject's summary and top scores
+#   POST   /batch                [change, ...]  many changes in one request
+# Connections are kept open between requests (HTTP/1.1 keep-alive). Writes from
+# every connection are queued and saved together every FLUSH_INTERVAL seconds
+# (one journal write or transaction per group), and each request gets its reply
+# once its change is on disk. Saving runs on a worker thread, so other
+# connections' reads are answered while the disk is being written. Reads first
+# catch up with changes other copies of the program have saved (unless a save
+# is writing right then, when they use what is already in memory).
+import asyncio
+import json
+import sys
+from urllib.parse import parse_qs, unquote, urlsplit
+import gradebook_core as core
+import gradebook_rules as rules
+import gradebook_search as search
+
+HOST = "127.0.0.1"
+PORT = 8080
+FLUSH_INTERVAL = 0.005  # Seconds to wait for more writes before saving a group
+MAX_BODY = 16 * 1024 * 1024
+REASONS = {200: "OK", 201: "Created", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+           409: "Conflict", 413: "Payload Too Large", 500: "Internal Server Error"}
+
+# Raised for a request we can't carry out, turned into a JSON error reply
+class RequestError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+# Turn an error from the gradebook into the matching HTTP error
+def request_error(error):
+    if isinstance(error, core.NotFoundError):
+        return RequestError(404, str(error))
+    if isinstance(error, core.AlreadyExistsError):
+        return RequestError(409, str(error))
+    return RequestError(400, str(error))
+
+# The gradebook and the queue of writes waiting to be saved
+class GradebookService:
+    def __init__(self, book):
+        self.book = book
+        self.pending = []  # (list of changes, future) waiting for the next save
+        self.flush_task = None
+
+    # Queue changes to be saved with the next group and wait until they are on disk.
+    # Returns one result per change ("ok" or the RequestError saying why it wasn't saved).
+    async def submit(self, changes):
+        future = asyncio.get_running_loop().create_future()
+        self.pending.append((changes, future))
+        if self.flush_task is None:
+            self.flush_task = asyncio.ensure_future(self.flush_soon())
+        return await future
+
+    # Wait a moment for more writes to arrive, then save them all together.
+    # Writes that arrive while a group is being saved go in the next group, so
+    # groups are saved one at a time and in order.
+    async def flush_soon(self):
+        await asyncio.sleep(FLUSH_INTERVAL)
+        loop = asyncio.get_running_loop()
+        try:
+            while self.pending:
+                batch, self.pending = self.pending, []
+                try:
+                    results = await loop.run_in_executor(None, self.flush, batch)
+                except Exception as error:
+                    results = [error] * len(batch)
+                for (_, future), result in zip(batch, results):
+                    if future.done():
+                        continue  # The client has gone
+                    if isinstance(result, Exception):
+                        future.set_exception(result)
+                    else:
+                        future.set_result(result)
+        finally:
+            self.flush_task = None
+
+    # Apply and save a group of queued writes in one go, then split the results
+    # back up by the request they came from
+    def flush(self, batch):
+        results = self.book.record_checked_changes([change for changes, _ in batch for change in changes])
+        results = [result if result == "ok" else request_error(result) for result in results]
+        all_results = []
+        for changes, _ in batch:
+            all_results.append(results[:len(changes)])
+            results = results[len(changes):]
+        return all_results
+
+# Check one change record sent by a client and return a tidy copy of it.
+# Uses the same rules as the easygui screens.
+def check_change(change):
+    try:
+        return core.check_change(change)
+    except core.GradebookError as error:
+        raise request_error(error)
+
+# A student record as sent back to clients
+def student_json(name, student):
+    average = core.calculate_average(student)
+    return {"name": name, "age": student["age"], "subjects": dict(student["subjects"].items()),
+            "average": round(average, 2), "version": student.get("version", 0)}
+
+# Read one whole number from the query string, or use the default
+def query_int(query, key, default):
+    try:
+        return max(0, int(query.get(key, [default])[0]))
+    except ValueError:
+        raise RequestError(400, f"{key} must be a whole number.")
+
+# Send one change through the write queue and turn its result into a reply
+async def single_write(service, change, status=200):
+    change = check_change(change)
+    result = (await service.submit([change]))[0]
+    if result != "ok":
+        raise result
+    return status, student_json(change["name"], service.book.student(change["name"]))
+
+# Every subject's count, average, lowest and highest score, all from the same moment
+def subject_stats(book):
+    subjects = {}
+    with book.mutex:
+        book.build_indexes()
+        for subject in sorted(book.totals["subjects"]):
+            summary = book.subject_report(subject, top=0, roster=False)
+            if summary is None:
+                continue
+            subjects[subject] = {"count": summary["count"], "average": round(summary["average"], 2),
+                                 "lowest": summary["lowest"], "highest": summary["highest"]}
+        return book.dashboard(), subjects
+
+# Work out the reply for one request. Returns (status, JSON data).
+async def handle_request(service, method, target, body):
+    if method == "GET":
+        await asyncio.get_running_loop().run_in_executor(None, service.book.sync, None, False)
+    url = urlsplit(target)
+    parts = [unquote(part) for part in url.path.strip("/").split("/") if part]
+    query = parse_qs(url.query)
+    data = None
+    if body:
+        try:
+            data = json.loads(body)
+        except json.JSONDecodeError:
+            raise RequestError(400, "Body is not valid JSON.")
+
+    if parts == ["students"]:
+        if method == "GET":
+            offset = query_int(query, "offset", 0)
+            limit = query_int(query, "limit", 100)
+            prefix = rules.clean_name(query.get("prefix", [""])[0])
+            service.book.build_indexes()
+            names = search.prefix_matches(service.book.search_index, prefix, offset + limit)[offset:] if prefix \
+                else service.book.names()[offset:offset + limit]
+            return 200, {"total": len(service.book), "names": names}
+        if method == "POST":
+            data = data or {}
+            return await single_write(service, {"op": "add_student", "name": data.get("name"), "age": data.get("age")}, 201)
+    elif len(parts) == 2 and parts[0] == "students":
+        name = rules.clean_name(parts[1])
+        if method == "GET":
+            try:
+                return 200, student_json(name, service.book.student(name))
+            except core.GradebookError as error:
+                raise request_error(error)
+        if method == "PATCH":
+            return await single_write(service, {"op": "set_age", "name": name, "age": (data or {}).get("age")})
+    elif len(parts) == 4 and parts[0] == "students" and parts[2] == "scores":
+        change = {"name": parts[1], "subject": parts[3]}
+        if method == "PUT":
+            change.update(op="set_score", score=(data or {}).get("score"))
+            return await single_write(service, change)
+        if method == "DELETE":
+            change["op"] = "delete_subject"
+            return await single_write(service, change)
+    elif parts == ["search"] and method == "GET":
+        text = query.get("q", [""])[0]
+        return 200, {"names": service.book.search(text)} if text.strip() else {"names": []}
+    elif parts == ["stats"] and method == "GET":
+        totals, subjects = subject_stats(service.book)
+        return 200, {"students": totals["students"], "scores": totals["scores"],
+                     "average": round(totals["average"], 2), "subjects": subjects}
+    elif len(parts) == 2 and parts[0] == "subjects" and method == "GET":
+        subject = rules.clean_name(parts[1])
+        summary = service.book.subject_report(subject, query_int(query, "top", 5), roster=False)
+        if summary is None:
+            raise RequestError(404, f"No students have a score for {subject.title()}.")
+        return 200, {"subject": subject, "count": summary["count"], "average": round(summary["average"], 2),
+                     "lowest": summary["lowest"], "highest": summary["highest"],
+                     "top": [{"name": name, "score": score} for name, score in summary["top"]]}
+    elif parts == ["batch"] and method == "POST":
+        if not isinstance(data, list):
+            raise RequestError(400, "Send a JSON list of changes.")
+        # Check every change before queuing any, so a bad batch saves nothing
+        changes = [check_change(change) for change in data]
+        results = await service.submit(changes)
+        results = [result if result == "ok" else result.message for result in results]
+        return 200, {"saved": results.count("ok"), "results": results}
+    else:
+        raise RequestError(404, "No such endpoint.")
+    raise RequestError(405, f"{method} is not allowed here.")
+
+# Read one HTTP request from the connection. Returns None when the client has gone.
+async def read_request(reader):
+    request_line = await reader.readline()
+    if not request_line:
+        return None
+    try:
+        method, target, version = request_line.decode("latin-1").split()
+    except ValueError:
+        raise RequestError(400, "Bad request line.")
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        key, _, value = line.decode("latin-1").partition(":")
+        headers[key.strip().lower()] = value.strip()
+    try:
+        length = int(headers.get("content-length", 0) or 0)
+    except ValueError:
+        length = -1
+    if length < 0:
+        raise RequestError(400, "Content-Length must be a whole number of bytes.")
+    if length > MAX_BODY:
+        raise RequestError(413, "Request body is too large.")
+    body = await reader.readexactly(length) if length else b""
+    keep_alive = headers.get("connection", "").lower() != "close" and version == "HTTP/1.1"
+    return method.upper(), target, body, keep_alive
+
+# Send one JSON reply
+def write_response(writer, status, data, keep_alive):
+    body = json.dumps(data).encode("utf-8")
+    head = (f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\n"
+            f"Content-Type: application/json\r\nContent-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+    writer.write(head.encode("latin-1") + body)
+
+# Serve requests on one connection until the client closes it
+async def handle_connection(service, reader, writer):
+    try:
+        while True:
+            keep_alive = False  # Only keep the connection if the request was read properly
+            try:
+                request = await read_request(reader)
+                if request is None:
+                    break
+                method, target, body, keep_alive = request
+                status, data = await handle_request(service, method, target, body)
+            except RequestError as error:
+                status, data = error.status, {"error": error.message}
+            except (asyncio.IncompleteReadError, ConnectionError):
+                break
+            except Exception as error:
+                status, data, keep_alive = 500, {"error": str(error)}, False
+            write_response(writer, status, data, keep_alive)
+            await writer.drain()
+            if not keep_alive:
+                break
+    finally:
+        writer.close()
+
+# Start the server and run until stopped with Ctrl+C
+async def serve(port=PORT, storage=None):
+    service = GradebookService(core.GradeBook(storage))
+    server = await asyncio.start_server(lambda reader, writer: handle_connection(service, reader, writer), HOST, port)
+    print(f"Gradebook server running on http://{HOST}:{port}")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        # Save everything in its final form on the way out
+        service.book.save()
+        service.book.close()
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(serve(int(sys.argv[1]) if len(sys.argv) > 1 else PORT))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,317 @@
+# Student Gradebook Manager – Version 4 sharded storage
+# The other backends read every student in the district when the program
+# starts, even if the teacher only looks at one class. This one splits the
+# gradebook into SHARD_COUNT small binary snapshot files (see
+# gradebook_snapshot.py), picked by a hash of the student's name, plus:
+#   - manifest.json: which file holds each shard, and each shard's number of
+#     students, number of scores and total score (for the menu's dashboard)
+#   - journal.jsonl: the changes since the shards were last written, like the
+#     JSON backend's journal (see gradebook_journal.py)
+# A shard is only read the first time one of its students is asked for. Shards
+# that haven't changed are dropped again, least recently used first, once the
+# loaded students go over the memory budget (GRADEBOOK_SHARD_MEMORY_MB).
+# Changed shards stay loaded until they are written back: once the journal is
+# about as big as the shards (see journal.compact_due), and on save, only the
+# changed shards are written (each to a new file, by the saver while edits go
+# on, see prepare_write_back), then the manifest is
+# replaced to point at them, so a crash leaves either the old or the new set of shards.
+# Use it with GRADEBOOK_STORAGE=sharded. The name hash keeps a student in the
+# same shard for good (ages change every year, so shards by age would not).
+import json
+import os
+import uuid
+import zlib
+from collections import OrderedDict
+from collections.abc import MutableMapping
+import gradebook_journal as journal
+import gradebook_metrics as metrics
+import gradebook_snapshot
+from gradebook_locking import FileLock
+
+SHARD_DIR = "Version 4 resit/shards"
+SHARD_COUNT = 64
+MEMORY_BUDGET_MB = int(os.environ.get("GRADEBOOK_SHARD_MEMORY_MB", "64"))
+BYTES_PER_STUDENT = 600  # Rough memory used by one loaded student, for the budget
+
+# Which shard a student's name belongs in
+def shard_of(name, shard_count):
+    return zlib.crc32(name.encode("utf-8")) % shard_count
+
+# A manifest for a gradebook with no students yet
+def empty_manifest(shard_count=SHARD_COUNT):
+    return {"shard_count": shard_count, "shards": {}}
+
+# Number of students and scores and the total score of some students
+def shard_stats(students):
+    return {"students": len(students), "scores": sum(student["count_scores"] for student in students.values()),
+            "total": sum(student["total_score"] for student in students.values())}
+
+# The gradebook dict, reading shards in as they are needed
+class ShardedGradebook(MutableMapping):
+    def __init__(self, directory, manifest, memory_budget=MEMORY_BUDGET_MB * 1024 * 1024):
+        self.directory = directory
+        self.max_students = max(1, memory_budget // BYTES_PER_STUDENT)
+        self.reset(manifest)
+
+    # Forget everything loaded and use a new manifest (after another copy rewrote the shards)
+    def reset(self, manifest):
+        self.manifest = manifest
+        self.shard_count = manifest["shard_count"]
+        self.loaded = OrderedDict()  # shard number -> {name: StudentRecord}, least recently used first
+        self.dirty = set()  # Shards changed since they were last written
+        self.writing = set()  # Shards being written back, kept loaded until their files are in place
+
+    # The students in one shard, reading the shard file if it isn't loaded
+    def shard(self, number):
+        students = self.loaded.get(number)
+        if students is not None:
+            self.loaded.move_to_end(number)
+            return students
+        try:
+            students = self.read_shard(number)
+        except FileNotFoundError:
+            # Another copy has written the shards again since we read the manifest. Use the
+            # newest files until the next sync, which loads everything again anyway.
+            self.manifest = read_manifest(self.directory, self.shard_count)
+            students = self.read_shard(number)
+        self.loaded[number] = students
+        self.evict()
+        return students
+
+    def read_shard(self, number):
+        entry = self.manifest["shards"].get(str(number))
+        if entry is None:
+            return {}
+        with metrics.span("load_shard"):
+            students = gradebook_snapshot.load(os.path.join(self.directory, entry["file"]))
+        metrics.count("shards_loaded")
+        return students
+
+    # Drop unchanged shards, oldest first, until the loaded students fit in the budget
+    # (the shard just loaded is kept, and changed shards are kept until written back)
+    def evict(self):
+        loaded_students = sum(len(students) for students in self.loaded.values())
+        for number in list(self.loaded)[:-1]:
+            if loaded_students <= self.max_students:
+                break
+            if number not in self.dirty and number not in self.writing:
+                loaded_students -= len(self.loaded.pop(number))
+                metrics.count("shards_evicted")
+
+    def __getitem__(self, name):
+        return self.shard(shard_of(name, self.shard_count))[name]
+
+    def __setitem__(self, name, student):
+        number = shard_of(name, self.shard_count)
+        self.shard(number)[name] = student
+        self.dirty.add(number)
+
+    def __delitem__(self, name):
+        number = shard_of(name, self.shard_count)
+        del self.shard(number)[name]
+        self.dirty.add(number)
+
+    # Every name, one shard at a time (reads every shard)
+    def __iter__(self):
+        for number in range(self.shard_count):
+            yield from list(self.shard(number))
+
+    # (name, student) for every student, one shard at a time, without looking each name up again
+    def items(self):
+        for number in range(self.shard_count):
+            yield from list(self.shard(number).items())
+
+    def values(self):
+        for name, student in self.items():
+            yield student
+
+    def __len__(self):
+        return sum(self.stats(number)["students"] for number in range(self.shard_count))
+
+    # Students, scores and total score of one shard, from the manifest unless it has changed
+    def stats(self, number):
+        if number in self.dirty or number in self.writing:
+            return shard_stats(self.loaded[number])
+        return self.manifest["shards"].get(str(number), {"students": 0, "scores": 0, "total": 0})
+
+    # Class-wide numbers without reading every shard, in the same form as the running totals
+    def totals(self):
+        totals = {"students": 0, "count": 0, "total": 0}
+        for number in range(self.shard_count):
+            stats = self.stats(number)
+            totals["students"] += stats["students"]
+            totals["count"] += stats["scores"]
+            totals["total"] += stats["total"]
+        return totals
+
+    # Write every changed shard to a new file, then the manifest pointing at them.
+    # Returns the number of shards written.
+    def write_back(self):
+        return self.prepare_write_back()()
+
+    # Note which shards have changed and freeze them (see journal.FrozenGradebook), and
+    # return a function that encodes and writes them, then the manifest (and returns
+    # the number of shards written). Call the function with cancel=True instead if
+    # the save is given up, so the shards are written next time.
+    # Only preparing needs the mutex: students can be changed again while the files are written.
+    def prepare_write_back(self):
+        numbers = set(self.dirty)
+        shards = {number: self.loaded.get(number, {}) for number in sorted(numbers)}
+        view = journal.FrozenGradebook(self)
+        # Until the new files are in place the shards can't be read back from disk, so keep them loaded
+        self.writing |= numbers
+        self.dirty.clear()
+
+        def write(cancel=False):
+            try:
+                if cancel:
+                    self.dirty |= numbers
+                    return 0
+                old_manifest = self.manifest
+                manifest = {"shard_count": self.shard_count, "shards": dict(old_manifest["shards"])}
+                files = []
+                for number, students in shards.items():
+                    frozen_students = {}
+                    for name in list(students):
+                        try:
+                            frozen_students[name] = view.original(name, students)
+                        except KeyError:
+                            pass  # Added since it was frozen
+                    key = str(number)
+                    if not frozen_students:
+                        manifest["shards"].pop(key, None)
+                        continue
+                    file_name = f"shard_{number:03d}_{uuid.uuid4().hex[:8]}.gbs"
+                    data = gradebook_snapshot.encode(frozen_students)
+                    files.append((file_name, data))
+                    manifest["shards"][key] = dict(shard_stats(frozen_students), file=file_name, bytes=len(data))
+                for file_name, data in files:
+                    with metrics.span("write_shard"):
+                        journal.write_file_safely(os.path.join(self.directory, file_name), data)
+                replace_manifest(self.directory, old_manifest, manifest)
+                self.manifest = manifest
+            except BaseException:
+                # Write them again next time
+                self.dirty |= numbers
+                raise
+            finally:
+                self.writing -= numbers
+                view.close()
+            metrics.count("shards_written", len(numbers))
+            return len(numbers)
+        return write
+
+def manifest_file(directory):
+    return os.path.join(directory, "manifest.json")
+
+# The manifest in a shard folder, or an empty one if there isn't one yet
+def read_manifest(directory, shard_count=SHARD_COUNT):
+    try:
+        with open(manifest_file(directory), "r") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return empty_manifest(shard_count)
+
+# Write the new manifest, then delete shard files only the old one used
+def replace_manifest(directory, old_manifest, new_manifest):
+    journal.write_file_safely(manifest_file(directory), json.dumps(new_manifest, indent=2))
+    in_use = {entry["file"] for entry in new_manifest["shards"].values()}
+    for entry in old_manifest["shards"].values():
+        if entry["file"] not in in_use:
+            try:
+                os.remove(os.path.join(directory, entry["file"]))
+            except OSError:
+                pass  # Another copy may have it open (Windows), it's tidied up next time
+
+# Sharded storage backend, with the same methods as the others in gradebook_storage.py
+class ShardedStorage:
+    lazy = True  # load() doesn't read the students until they are used
+
+    def __init__(self, directory=SHARD_DIR, shard_count=SHARD_COUNT):
+        self.directory = directory
+        self.shard_count = shard_count
+        os.makedirs(directory, exist_ok=True)
+        self.journal_file = os.path.join(directory, "journal.jsonl")
+        self.file_lock = FileLock(manifest_file(directory) + ".lock")
+        self.gradebook = None
+        # How far through the journal this copy has read
+        self.position = {"offset": 0, "generation": None, "count": 0}
+
+    def lock(self):
+        return self.file_lock
+
+    # Read the manifest and replay the journal, which only reads the shards it changes.
+    # Always returns the same ShardedGradebook, started again from the files.
+    def load(self):
+        with self.file_lock:
+            manifest = read_manifest(self.directory, self.shard_count)
+            if self.gradebook is None:
+                self.gradebook = ShardedGradebook(self.directory, manifest)
+            else:
+                self.gradebook.reset(manifest)
+            self.position = journal.replay_journal(self.gradebook, self.journal_file)
+        return self.gradebook
+
+    # Read records other copies have appended since we last looked.
+    # If someone wrote back the shards since then, our place in the journal is lost, so return None.
+    def read_new_changes(self):
+        if journal.read_generation(self.journal_file) != self.position["generation"]:
+            return None
+        changes, self.position["offset"] = journal.read_journal(self.journal_file, self.position["offset"])
+        self.position["count"] += len(changes)
+        return changes
+
+    # Append the changes to the journal, and write back the changed shards when it is due.
+    # Call read_new_changes() first while holding the lock, so nothing is skipped.
+    def prepare_save(self, gradebook, changes):
+        write_back = None
+        # Manifests written before shard sizes were kept count as 0 bytes until the shards are written again
+        shard_bytes = sum(entry.get("bytes", 0) for entry in gradebook.manifest["shards"].values())
+        if changes and journal.compact_due(self.position["offset"], shard_bytes):
+            write_back = self.prepare_checkpoint(gradebook)
+
+        def save():
+            if not changes:
+                return
+            with self.file_lock:
+                try:
+                    self.position["offset"] = journal.append_changes(changes, self.journal_file)
+                    self.position["count"] += len(changes)
+                except BaseException:
+                    if write_back is not None:
+                        write_back(cancel=True)
+                    raise
+                if write_back is not None:
+                    write_back()
+        return save
+
+    # Write back the changed shards and start a new journal. Any other gradebook
+    # (e.g. copied from another backend) replaces all of the shards.
+    def save_all(self, gradebook):
+        with self.file_lock:
+            if gradebook is not self.gradebook:
+                copy = ShardedGradebook(self.directory, empty_manifest(self.shard_count))
+                copy.update(gradebook.items())
+                # Write every shard, even empty ones, over the shard files in use now
+                copy.manifest = read_manifest(self.directory, self.shard_count)
+                copy.dirty = set(range(self.shard_count))
+                copy.write_back()
+                if self.gradebook is not None:
+                    self.gradebook.reset(copy.manifest)
+                self.position = journal.start_journal(self.journal_file)
+            else:
+                self.prepare_checkpoint(gradebook)()
+
+    # Write back the changed shards of our gradebook and start a new journal
+    def prepare_checkpoint(self, gradebook):
+        write_back = gradebook.prepare_write_back()
+
+        def save(cancel=False):
+            with self.file_lock:
+                write_back(cancel)
+                if not cancel:
+                    self.position = journal.start_journal(self.journal_file)
+        return save
+
+    def close(self):
+        pass
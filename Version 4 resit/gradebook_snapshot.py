@@ -0,0 +1,164 @@
+# Student Gradebook Manager – Version 4 binary snapshot
+# A compact alternative to the pretty-printed gradebook_logs.json snapshot, which
+# repeats "age", "subjects", "total_score" and "count_scores" for every student.
+# The binary file keeps each subject name once in a table, and stores everything
+# else as fixed-width numbers in arrays (all little-endian):
+#   header   magic, format version and the counts/sizes below
+#   version  uint32 per student
+#   start    uint32 per student + 1, where each student's scores begin
+#   subject  uint16 per score, index into the subject table
+#   age      uint8 per student
+#   score    uint8 per score (scores are 0-100, see gradebook_rules.py)
+#   names    student names, UTF-8, one per line
+#   subjects subject table, UTF-8, one per line
+# Totals and counts are worked out again while loading, so they can't go stale.
+# Loading gives StudentRecords (see gradebook_records.py) straight from the arrays.
+# Use it with GRADEBOOK_STORAGE=binary, or convert files from the command line:
+#   python "Version 4 resit/gradebook_snapshot.py" to-binary gradebook_logs.json gradebook_logs.gbs
+#   python "Version 4 resit/gradebook_snapshot.py" to-json gradebook_logs.gbs gradebook_logs.json
+import gc
+import json
+import struct
+import sys
+from array import array
+from itertools import islice
+import gradebook_records as records
+
+SNAPSHOT_FILE = "Version 4 resit/gradebook_logs.gbs"
+JOURNAL_FILE = "Version 4 resit/gradebook_logs.gbs.journal"
+EXTENSION = ".gbs"
+MAGIC = b"GBSN"
+FORMAT_VERSION = 1
+HEADER = struct.Struct("<4sHHIIIII")  # magic, format, unused, students, subjects, scores, name bytes, subject bytes
+
+# array typecodes for each fixed-width column
+UINT32 = "I" if array("I").itemsize == 4 else "L"
+UINT16 = "H"
+UINT8 = "B"
+
+# Turn a list of names into one block of UTF-8 text, one name per line
+def join_names(names, what):
+    for name in names:
+        if "\n" in name:
+            raise ValueError(f"{what} name {name!r} cannot be saved in a binary snapshot (it has a line break).")
+    return "\n".join(names).encode("utf-8")
+
+# Store an array little-endian whatever machine we are on
+def little_endian_bytes(values):
+    if sys.byteorder == "big":
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+# Read an array stored by little_endian_bytes
+def read_array(typecode, data):
+    values = array(typecode)
+    values.frombytes(data)
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values
+
+# Turn the gradebook dict into the bytes of a binary snapshot
+def encode(gradebook):
+    names = list(gradebook)
+    subject_ids = {}
+    versions = array(UINT32)
+    starts = array(UINT32, [0])
+    subjects = array(UINT16)
+    ages = array(UINT8)
+    scores = array(UINT8)
+    try:
+        for name in names:
+            student = gradebook[name]
+            versions.append(student.get("version", 0))
+            ages.append(student["age"])
+            for subject, score in student["subjects"].items():
+                subjects.append(subject_ids.setdefault(subject, len(subject_ids)))
+                scores.append(score)
+            starts.append(len(scores))
+    except OverflowError:
+        raise ValueError(f"{name.title()} has an age, score or version too large for a binary snapshot.")
+    name_bytes = join_names(names, "Student")
+    subject_bytes = join_names(list(subject_ids), "Subject")
+    header = HEADER.pack(MAGIC, FORMAT_VERSION, 0, len(names), len(subject_ids), len(scores),
+                         len(name_bytes), len(subject_bytes))
+    return b"".join([header, little_endian_bytes(versions), little_endian_bytes(starts),
+                     little_endian_bytes(subjects), ages.tobytes(), scores.tobytes(), name_bytes, subject_bytes])
+
+# Work out where each part of the file is. Returns a dict of (start, end) byte ranges.
+def layout(data):
+    if len(data) < HEADER.size:
+        raise ValueError("Binary snapshot is too short.")
+    magic, file_format, _, students, subjects, scores, name_bytes, subject_bytes = HEADER.unpack_from(data)
+    if magic != MAGIC:
+        raise ValueError("Not a gradebook binary snapshot.")
+    if file_format != FORMAT_VERSION:
+        raise ValueError(f"Binary snapshot format {file_format} is not supported.")
+    parts = {}
+    position = HEADER.size
+    for part, size in [("version", 4 * students), ("start", 4 * (students + 1)), ("subject", 2 * scores),
+                       ("age", students), ("score", scores), ("names", name_bytes), ("subjects", subject_bytes)]:
+        parts[part] = (position, position + size)
+        position += size
+    if position != len(data):
+        raise ValueError("Binary snapshot is damaged (wrong size).")
+    parts["counts"] = (students, subjects, scores)
+    return parts
+
+# Split a block of names back into a list
+def split_names(data, count):
+    if count == 0:
+        return []
+    names = bytes(data).decode("utf-8").split("\n")
+    if len(names) != count:
+        raise ValueError("Binary snapshot is damaged (wrong number of names).")
+    return names
+
+# Swap the file's subject numbers for the numbers in the shared subject table
+def shared_subject_ids(table, subject_ids):
+    numbers = [records.subject_number(subject) for subject in table]
+    return array("H", map(numbers.__getitem__, subject_ids))
+
+# Turn the bytes of a binary snapshot back into a gradebook dict of StudentRecords
+def decode(data):
+    parts = layout(data)
+    students, subject_count, _ = parts["counts"]
+    part = lambda key: data[parts[key][0]:parts[key][1]]
+    names = split_names(part("names"), students)
+    table = split_names(part("subjects"), subject_count)
+    versions = read_array(UINT32, part("version")).tolist()
+    starts = read_array(UINT32, part("start")).tolist()
+    subjects = shared_subject_ids(table, read_array(UINT16, part("subject")))
+    scores = array(UINT8, part("score"))
+    gradebook = {}
+    # The garbage collector would keep stopping to scan the new records, none of which can be garbage
+    collecting = gc.isenabled()
+    gc.disable()
+    try:
+        for name, age, version, first, last in zip(names, part("age"), versions, starts, islice(starts, 1, None)):
+            gradebook[name] = records.StudentRecord(age, version, subjects[first:last], scores[first:last])
+    finally:
+        if collecting:
+            gc.enable()
+    return gradebook
+
+# Load a binary snapshot file into a gradebook dict
+def load(path=SNAPSHOT_FILE):
+    with open(path, "rb") as f:
+        return decode(f.read())
+
+# Convert between the JSON and binary snapshot files
+if __name__ == "__main__":
+    if len(sys.argv) != 4 or sys.argv[1] not in ("to-binary", "to-json"):
+        print("Usage: python gradebook_snapshot.py <to-binary|to-json> <from file> <to file>")
+        sys.exit(1)
+    if sys.argv[1] == "to-binary":
+        with open(sys.argv[2], "r") as f:
+            gradebook = json.load(f)
+        with open(sys.argv[3], "wb") as f:
+            f.write(encode(gradebook))
+    else:
+        gradebook = load(sys.argv[2])
+        with open(sys.argv[3], "w") as f:
+            json.dump(gradebook, f, indent=2, default=records.plain_json)
+    print(f"Converted {len(gradebook)} students from {sys.argv[2]} to {sys.argv[3]}.")
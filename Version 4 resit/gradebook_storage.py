@@ -0,0 +1,478 @@
+# Student Gradebook Manager – Version 4 storage backends
+# Where the gradebook is kept on disk. Every backend has the same methods:
+#   load()                      -> the whole gradebook dict
+#   lock()                      -> a "with" lock shared by every copy of the program
+#   read_new_changes()          -> changes saved by other copies since we last looked,
+#                                  or None if the gradebook must be loaded again
+#   prepare_save(gradebook, changes) -> a function that saves a list of journal change records
+#   prepare_checkpoint(gradebook)    -> a function that tidies up the saved data, e.g. before exiting
+#   save_all(gradebook)         save the whole gradebook in one go
+#   close()
+#   lazy                        True if load() only reads students when they are used
+# Several teachers can share one gradebook: hold lock() while catching up with
+# read_new_changes() and then saving, so only this copy's own changes are added
+# on top of everyone else's instead of overwriting them.
+# Saving is done in two steps so the gradebook isn't held up by the disk: the
+# prepare_ methods are called while nothing else is changing the gradebook and
+# only note what to save (freezing it, see journal.FrozenGradebook, if a new
+# snapshot is due), and the function they return turns it into bytes and
+# writes it afterwards. Keep hold of lock() across both steps.
+# "json" is the JSON snapshot plus append-only journal, "binary" is the same but
+# with the compact binary snapshot (faster to load, see gradebook_snapshot.py),
+# "sqlite" is an SQLite database with students, subjects and scores tables that
+# reads each student when they are first used, and "sharded" splits the
+# gradebook into shard files that are read as they are needed (see gradebook_shards.py).
+# Pick one with the GRADEBOOK_STORAGE environment variable (json is the default).
+import heapq
+import json
+import os
+import sqlite3
+import sys
+import threading
+from collections.abc import MutableMapping
+import gradebook_journal as journal
+import gradebook_shards
+import gradebook_snapshot
+from gradebook_records import StudentRecord
+from gradebook_locking import FileLock
+
+STORAGE_BACKEND = os.environ.get("GRADEBOOK_STORAGE", "json")
+DATABASE_FILE = "Version 4 resit/gradebook.db"
+CHANGE_LOG_KEEP = 10000  # Changes kept in the SQLite change log for other copies to catch up with
+
+# JSON (or binary) snapshot plus journal (see gradebook_journal.py)
+class JsonStorage:
+    lazy = False
+
+    def __init__(self, snapshot_file=journal.SNAPSHOT_FILE, journal_file=journal.JOURNAL_FILE):
+        self.snapshot_file = snapshot_file
+        self.journal_file = journal_file
+        self.file_lock = FileLock(snapshot_file + ".lock")
+        # How far through the journal this copy has read
+        self.position = {"offset": 0, "generation": None, "count": 0}
+        self.snapshot_bytes = 0  # Size of the snapshot, to tell when the journal is due to be folded in
+
+    def lock(self):
+        return self.file_lock
+
+    def load(self):
+        with self.file_lock:
+            gradebook, self.position = journal.load_snapshot_and_journal(self.snapshot_file, self.journal_file)
+            self.snapshot_bytes = os.path.getsize(self.snapshot_file) if os.path.exists(self.snapshot_file) else 0
+        return gradebook
+
+    # Read records other copies have appended since we last looked.
+    # If someone compacted the journal since then, our place in it is lost, so return None.
+    def read_new_changes(self):
+        if journal.read_generation(self.journal_file) != self.position["generation"]:
+            return None
+        changes, self.position["offset"] = journal.read_journal(self.journal_file, self.position["offset"])
+        self.position["count"] += len(changes)
+        return changes
+
+    # Append the changes to the journal, and rewrite the snapshot when it is due.
+    # Call read_new_changes() first while holding the lock, so nothing is skipped.
+    def prepare_save(self, gradebook, changes):
+        if not (changes and journal.compact_due(self.position["offset"], self.snapshot_bytes)):
+            def save():
+                if changes:
+                    with self.file_lock:
+                        self.append(changes)
+            return save
+        view = journal.FrozenGradebook(gradebook)
+
+        def save_and_compact():
+            try:
+                with self.file_lock:
+                    self.append(changes)
+                    self.write_frozen(view)
+            finally:
+                view.close()
+        return save_and_compact
+
+    def append(self, changes):
+        self.position["offset"] = journal.append_changes(changes, self.journal_file)
+        self.position["count"] += len(changes)
+
+    # Write a new snapshot of the gradebook as it was when the view was made
+    def write_frozen(self, view):
+        snapshot = journal.serialize_snapshot(view, self.snapshot_file)
+        self.position = journal.write_snapshot(snapshot, self.snapshot_file, self.journal_file)
+        self.snapshot_bytes = len(snapshot)
+
+    def save_all(self, gradebook):
+        with self.file_lock:
+            self.prepare_checkpoint(gradebook)()
+
+    # Fold the journal into the snapshot
+    def prepare_checkpoint(self, gradebook):
+        view = journal.FrozenGradebook(gradebook)
+
+        def save():
+            try:
+                with self.file_lock:
+                    self.write_frozen(view)
+            finally:
+                view.close()
+        return save
+
+    def close(self):
+        pass
+
+# The gradebook dict for SQLite, reading each student from the database the first
+# time they are asked for. Until every student has been read (e.g. to build the
+# search index), the dashboard numbers and single-subject reports are added up by
+# the database for the students not read yet, plus those in memory.
+# Each student read notes the newest change log row at that moment, and
+# needs_change() tells SqliteStorage which of the changes other copies have saved
+# are already in them. Students read are kept until the next load().
+class SqliteGradebook(MutableMapping):
+    def __init__(self, database_file):
+        # A connection of its own, so it never sees a save that is half written
+        self.connection = sqlite3.connect(database_file, timeout=30, check_same_thread=False,
+                                          isolation_level=None)
+        self.connection.execute("CREATE TEMP TABLE read_names (name TEXT PRIMARY KEY) WITHOUT ROWID")
+        self.read_lock = threading.Lock()  # One query at a time on the connection
+        self.reset()
+
+    # Forget every student read so far (after loading again)
+    def reset(self):
+        with self.read_lock:
+            self.records = {}  # name -> StudentRecord, or None if they weren't there
+            self.seen = {}  # name -> newest change log row when they were read
+            self.complete = False  # True once every student has been read
+            self.connection.execute("DELETE FROM temp.read_names")
+
+    # Run queries in one read transaction, so they all see the database at the same moment
+    def read(self, queries):
+        with self.read_lock:
+            self.connection.execute("BEGIN")
+            try:
+                change_id = self.connection.execute("SELECT COALESCE(MAX(id), 0) FROM change_log").fetchone()[0]
+                return change_id, [self.connection.execute(query, args).fetchall() for query, args in queries]
+            finally:
+                self.connection.execute("COMMIT")
+
+    # Read one student from the database, unless they have been read already
+    def read_student(self, name):
+        change_id, (rows, score_rows) = self.read([
+            ("SELECT age, version FROM students WHERE name = ?", (name,)),
+            ("""SELECT subjects.name, scores.score FROM scores
+                JOIN students ON students.id = scores.student_id JOIN subjects ON subjects.id = scores.subject_id
+                WHERE students.name = ?""", (name,))])
+        student = None
+        if rows:
+            student = StudentRecord(rows[0][0], rows[0][1])
+            student["subjects"].update(score_rows)
+        with self.read_lock:
+            if name not in self.records:
+                self.records[name] = student
+                self.seen[name] = change_id
+                self.connection.execute("INSERT OR IGNORE INTO temp.read_names VALUES (?)", (name,))
+            return self.records[name]
+
+    # Read every student not read yet (for anything that goes through the whole gradebook)
+    def read_all(self):
+        if self.complete:
+            return
+        change_id, (rows, score_rows) = self.read([
+            ("SELECT id, name, age, version FROM students ORDER BY id", ()),
+            ("""SELECT scores.student_id, subjects.name, scores.score
+                FROM scores JOIN subjects ON subjects.id = scores.subject_id""", ())])
+        students = {}
+        for student_id, name, age, version in rows:
+            students[student_id] = (name, StudentRecord(age, version))
+        for student_id, subject, score in score_rows:
+            students[student_id][1]["subjects"][subject] = score
+        with self.read_lock:
+            for name, student in students.values():
+                if name not in self.records:
+                    self.records[name] = student
+                    self.seen[name] = change_id
+            self.complete = True
+
+    # Whether a change saved by another copy (at change log row change_id) still has to be applied
+    def needs_change(self, name, change_id):
+        seen = self.seen.get(name)
+        if seen is None:
+            # Not read yet, so it will be read with the change in it. Once everything
+            # has been read, a new name is a student added since.
+            return self.complete
+        return change_id > seen
+
+    def __getitem__(self, name):
+        try:
+            student = self.records[name]
+        except KeyError:
+            student = None if self.complete else self.read_student(name)
+        if student is None:
+            raise KeyError(name)
+        return student
+
+    def __setitem__(self, name, student):
+        if name not in self.records and not self.complete:
+            self.read_student(name)
+        self.records[name] = student
+
+    # Only forgets them here, like a student that was never there (nothing deletes a whole student)
+    def __delitem__(self, name):
+        self[name]
+        self.records[name] = None
+
+    def __iter__(self):
+        self.read_all()
+        return (name for name, student in list(self.records.items()) if student is not None)
+
+    def __len__(self):
+        return self.totals()["students"]
+
+    # Number of students and scores and the total score, in the same form as the running totals
+    def totals(self):
+        totals = {"students": 0, "count": 0, "total": 0}
+        if not self.complete:
+            _, ([(totals["students"],)], [(totals["count"], totals["total"])]) = self.read([
+                ("SELECT COUNT(*) FROM students WHERE name NOT IN (SELECT name FROM temp.read_names)", ()),
+                ("""SELECT COUNT(*), COALESCE(SUM(scores.score), 0) FROM scores
+                    JOIN students ON students.id = scores.student_id
+                    WHERE students.name NOT IN (SELECT name FROM temp.read_names)""", ())])
+        for student in list(self.records.values()):
+            if student is not None:
+                totals["students"] += 1
+                totals["count"] += student["count_scores"]
+                totals["total"] += student["total_score"]
+        return totals
+
+    # (count, average, lowest, highest, top n (name, score) pairs) for one subject,
+    # or None if nobody has taken it
+    def subject_summary(self, subject, n=5):
+        scores = []
+        count = total = 0
+        lowest = highest = None
+        if not self.complete:
+            _, ([(count, total, lowest, highest)], scores) = self.read([
+                ("""SELECT COUNT(*), COALESCE(SUM(scores.score), 0), MIN(scores.score), MAX(scores.score) FROM scores
+                    JOIN students ON students.id = scores.student_id JOIN subjects ON subjects.id = scores.subject_id
+                    WHERE subjects.name = ? AND students.name NOT IN (SELECT name FROM temp.read_names)""", (subject,)),
+                ("""SELECT students.name, scores.score FROM scores
+                    JOIN students ON students.id = scores.student_id JOIN subjects ON subjects.id = scores.subject_id
+                    WHERE subjects.name = ? AND students.name NOT IN (SELECT name FROM temp.read_names)
+                    ORDER BY scores.score DESC LIMIT ?""", (subject, n))])
+        for name, student in list(self.records.items()):
+            score = student["subjects"].get(subject) if student is not None else None
+            if score is None:
+                continue
+            count += 1
+            total += score
+            lowest = score if lowest is None else min(lowest, score)
+            highest = score if highest is None else max(highest, score)
+            scores.append((name, score))
+        if count == 0:
+            return None
+        return count, total / count, lowest, highest, heapq.nlargest(n, scores, key=lambda item: item[1])
+
+    def close(self):
+        self.connection.close()
+
+# SQLite database, each change is a small row-level update in one transaction.
+# load() doesn't read any students, see SqliteGradebook.
+class SqliteStorage:
+    lazy = True  # load() doesn't read the students until they are used
+
+    def __init__(self, database_file=DATABASE_FILE):
+        self.database_file = database_file
+        self.file_lock = FileLock(database_file + ".lock")
+        self.last_change_id = 0  # Newest change log row this copy has seen
+        self.gradebook = None
+        self.connection = sqlite3.connect(database_file, timeout=30, check_same_thread=False)
+        self.connection.executescript("""
+            PRAGMA journal_mode = WAL;
+            PRAGMA synchronous = NORMAL;
+            PRAGMA foreign_keys = ON;
+            CREATE TABLE IF NOT EXISTS students (
+                id INTEGER PRIMARY KEY,
+                name TEXT NOT NULL UNIQUE,
+                age INTEGER NOT NULL,
+                version INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE TABLE IF NOT EXISTS subjects (
+                id INTEGER PRIMARY KEY,
+                name TEXT NOT NULL UNIQUE
+            );
+            CREATE TABLE IF NOT EXISTS scores (
+                student_id INTEGER NOT NULL REFERENCES students(id) ON DELETE CASCADE,
+                subject_id INTEGER NOT NULL REFERENCES subjects(id),
+                score INTEGER NOT NULL,
+                PRIMARY KEY (student_id, subject_id)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS scores_by_subject ON scores(subject_id, score);
+            CREATE TABLE IF NOT EXISTS change_log (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                change TEXT NOT NULL
+            );
+        """)
+        # Databases made before version counters were added need the column
+        columns = [row[1] for row in self.connection.execute("PRAGMA table_info(students)")]
+        if "version" not in columns:
+            with self.connection:
+                self.connection.execute("ALTER TABLE students ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+
+    def lock(self):
+        return self.file_lock
+
+    # Start reading the students from the database again, as they are used.
+    # Always returns the same SqliteGradebook.
+    def load(self):
+        with self.file_lock, self.connection:
+            self.last_change_id = self.connection.execute("SELECT COALESCE(MAX(id), 0) FROM change_log").fetchone()[0]
+            if self.gradebook is None:
+                self.gradebook = SqliteGradebook(self.database_file)
+            else:
+                self.gradebook.reset()
+        return self.gradebook
+
+    # Look up a subject's id, adding the subject if it is new
+    def subject_id(self, subject):
+        self.connection.execute("INSERT OR IGNORE INTO subjects (name) VALUES (?)", (subject,))
+        return self.connection.execute("SELECT id FROM subjects WHERE name = ?", (subject,)).fetchone()[0]
+
+    # Write one change record to the database (inside the caller's transaction)
+    def write_change(self, change):
+        op = change["op"]
+        name = change["name"]
+        if op == "add_student":
+            # Adding a student that already exists starts them again with no scores
+            row = self.connection.execute("SELECT version FROM students WHERE name = ?", (name,)).fetchone()
+            self.connection.execute("DELETE FROM students WHERE name = ?", (name,))
+            self.connection.execute("INSERT INTO students (name, age, version) VALUES (?, ?, ?)",
+                                    (name, change["age"], row[0] + 1 if row else 1))
+            return
+        # Every other change adds one to the student's version, like journal.apply_change
+        self.connection.execute("UPDATE students SET version = version + 1 WHERE name = ?", (name,))
+        if op == "set_age":
+            self.connection.execute("UPDATE students SET age = ? WHERE name = ?", (change["age"], name))
+        elif op == "set_score":
+            self.connection.execute(
+                """INSERT INTO scores (student_id, subject_id, score)
+                   SELECT id, ?, ? FROM students WHERE name = ?
+                   ON CONFLICT (student_id, subject_id) DO UPDATE SET score = excluded.score""",
+                (self.subject_id(change["subject"]), change["score"], name))
+        elif op == "delete_subject":
+            self.connection.execute(
+                """DELETE FROM scores
+                   WHERE student_id = (SELECT id FROM students WHERE name = ?)
+                   AND subject_id = (SELECT id FROM subjects WHERE name = ?)""",
+                (name, change["subject"]))
+        else:
+            raise ValueError(f"Unknown journal operation: {op}")
+
+    # Save a batch of changes as one transaction, and add them to the change log
+    # so other copies of the program can catch up with them. The changes say
+    # everything that is written, so there is nothing to prepare from the gradebook.
+    def prepare_save(self, gradebook, changes):
+        def save():
+            if not changes:
+                return
+            with self.file_lock, self.connection:
+                for change in changes:
+                    self.write_change(change)
+                self.connection.executemany("INSERT INTO change_log (change) VALUES (?)",
+                                            [(json.dumps(change),) for change in changes])
+                self.last_change_id = self.connection.execute("SELECT MAX(id) FROM change_log").fetchone()[0]
+        return save
+
+    # Changes other copies have saved since we last looked, or None if the
+    # change log has been trimmed past that point. Changes to students our
+    # gradebook hasn't read yet (or read after the change) are left out.
+    def read_new_changes(self):
+        with self.connection:
+            oldest = self.connection.execute("SELECT MIN(id) FROM change_log").fetchone()[0]
+            if oldest is not None and oldest > self.last_change_id + 1:
+                return None
+            rows = self.connection.execute("SELECT id, change FROM change_log WHERE id > ? ORDER BY id",
+                                           (self.last_change_id,)).fetchall()
+        if rows:
+            self.last_change_id = rows[-1][0]
+        changes = [(change_id, json.loads(change)) for change_id, change in rows]
+        return [change for change_id, change in changes if change["op"] != "start"
+                and (self.gradebook is None or self.gradebook.needs_change(change["name"], change_id))]
+
+    # Replace everything in the database with the gradebook.
+    # The change log is cleared, so other copies will load everything again.
+    def save_all(self, gradebook):
+        students = list(gradebook.items())  # Read in first if it is our own gradebook
+        with self.file_lock, self.connection:
+            self.connection.execute("DELETE FROM scores")
+            self.connection.execute("DELETE FROM students")
+            for name, student in students:
+                self.connection.execute("INSERT INTO students (name, age, version) VALUES (?, ?, ?)",
+                                        (name, student["age"], student.get("version", 0)))
+                for subject, score in student["subjects"].items():
+                    self.write_change({"op": "set_score", "name": name, "subject": subject, "score": score})
+                self.connection.execute("UPDATE students SET version = ? WHERE name = ?",
+                                        (student.get("version", 0), name))
+            # Add a marker row so the log never looks empty to copies that were further behind
+            self.connection.execute("DELETE FROM change_log")
+            self.connection.execute("INSERT INTO change_log (change) VALUES (?)",
+                                    (json.dumps({"op": "start", "name": ""}),))
+            self.last_change_id = self.connection.execute("SELECT MAX(id) FROM change_log").fetchone()[0]
+        if self.gradebook is not None and gradebook is not self.gradebook:
+            self.gradebook.reset()
+
+    # Every change is already in the database, so just trim the change log
+    # and fold the WAL file back in
+    def prepare_checkpoint(self, gradebook):
+        def save():
+            with self.file_lock:
+                with self.connection:
+                    self.connection.execute("DELETE FROM change_log WHERE id <= ?",
+                                            (self.last_change_id - CHANGE_LOG_KEEP,))
+                self.connection.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        return save
+
+    def is_empty(self):
+        return self.connection.execute("SELECT COUNT(*) FROM students").fetchone()[0] == 0
+
+    def close(self):
+        if self.gradebook is not None:
+            self.gradebook.close()
+        self.connection.close()
+
+# Open the chosen storage backend.
+# The first time the binary or SQLite backend is used it copies in the existing JSON gradebook.
+def open_storage(backend=STORAGE_BACKEND):
+    if backend == "json":
+        return JsonStorage()
+    if backend == "binary":
+        # Uses its own journal, so it never replays changes meant for the JSON snapshot
+        storage = JsonStorage(gradebook_snapshot.SNAPSHOT_FILE, gradebook_snapshot.JOURNAL_FILE)
+        with storage.lock():
+            if not os.path.exists(gradebook_snapshot.SNAPSHOT_FILE) and os.path.exists(journal.SNAPSHOT_FILE):
+                storage.save_all(JsonStorage().load())
+        return storage
+    if backend == "sqlite":
+        storage = SqliteStorage()
+        if storage.is_empty() and os.path.exists(journal.SNAPSHOT_FILE):
+            storage.save_all(JsonStorage().load())
+        return storage
+    if backend == "sharded":
+        storage = gradebook_shards.ShardedStorage()
+        with storage.lock():
+            if not os.path.exists(gradebook_shards.manifest_file(storage.directory)) and \
+                    os.path.exists(journal.SNAPSHOT_FILE):
+                storage.save_all(JsonStorage().load())
+        return storage
+    raise ValueError(f"Unknown storage backend: {backend} (use json, binary, sqlite or sharded)")
+
+# Copy the gradebook between backends from the command line:
+#   python "Version 4 resit/gradebook_storage.py" json sqlite
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        print("Usage: python gradebook_storage.py <from: json|binary|sqlite|sharded> <to: json|binary|sqlite|sharded>")
+        sys.exit(1)
+    source = open_storage(sys.argv[1])
+    target = open_storage(sys.argv[2])
+    gradebook = source.load()
+    target.save_all(gradebook)
+    print(f"Copied {len(gradebook)} students from {sys.argv[1]} to {sys.argv[2]}.")
+    source.close()
+    target.close()
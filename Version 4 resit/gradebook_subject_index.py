@@ -0,0 +1,50 @@
+# Student Gradebook Manager – Version 4 subject index
+# The gradebook is keyed by student, so questions like "who took physics" would
+# mean looking through every student. This index flips it around:
+#   {subject: {student name: score}}
+# and is kept up to date with every change, so subject queries only look at
+# the students who actually took that subject.
+import heapq
+
+# Build the subject index from a whole gradebook (used once after loading)
+def build_subject_index(gradebook):
+    index = {}
+    for name, student in gradebook.items():
+        for subject, score in student["subjects"].items():
+            index.setdefault(subject, {})[name] = score
+    return index
+
+# Update the index for one journal change record.
+# This must be called before the change is applied to the gradebook, so that
+# re-adding a student can still see (and remove) their old subjects.
+def update_subject_index(index, gradebook, change):
+    op = change["op"]
+    name = change["name"]
+    if op == "add_student":
+        old_student = gradebook.get(name)
+        if old_student:
+            for subject in old_student["subjects"]:
+                remove_score(index, subject, name)
+    elif op == "set_score":
+        if name in gradebook:
+            index.setdefault(change["subject"], {})[name] = change["score"]
+    elif op == "delete_subject":
+        remove_score(index, change["subject"], name)
+
+# Remove one student's score from a subject, dropping the subject once it is empty
+def remove_score(index, subject, name):
+    students = index.get(subject)
+    if students is None:
+        return
+    students.pop(name, None)
+    if not students:
+        del index[subject]
+
+# Return a list of (name, score) for everyone who took a subject, sorted by name
+def subject_roster(index, subject):
+    return sorted(index.get(subject, {}).items())
+
+# Return the top n (name, score) pairs for a subject, highest score first
+def top_students(index, subject, n=5):
+    scores = index.get(subject, {})
+    return heapq.nlargest(n, scores.items(), key=lambda item: item[1])
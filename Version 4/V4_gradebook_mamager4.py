@@ -130,10 +130,10 @@ def search_student(gradebook):
     if not student_name:
         return
     student_name = student_name.strip().lower()
-    for name in gradebook:
-        if name == student_name:
-            display_summary_and_plot(name.title(), gradebook[name])
-            return
+    # Names are stored in lower case as the dict keys, so look them up directly
+    if student_name in gradebook:
+        display_summary_and_plot(student_name.title(), gradebook[student_name])
+        return
     eg.msgbox(f"No summary found for student '{student_name.title()}'.")
 
 # View a list of all students in the gradebook
@@ -0,0 +1,32 @@
+# Student Gradebook Manager – shared pytest setup for the Version 4 resit tests
+# Puts the resit folder on the path (its modules import each other by name) and
+# gives each test its own folder to keep the gradebook files in.
+import os
+import sys
+
+import pytest
+
+RESIT_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "Version 4 resit")
+sys.path.insert(0, RESIT_DIR)
+
+import gradebook_core as core  # noqa: E402
+from gradebook_records import to_dict  # noqa: E402
+from gradebook_storage import JsonStorage  # noqa: E402
+
+
+# Run each test in its own folder, so the files the gradebook keeps next to
+# itself (history, metrics) never touch the real ones
+@pytest.fixture
+def files(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    os.makedirs("Version 4 resit")
+    return {"snapshot": str(tmp_path / "gradebook_logs.json"), "journal": str(tmp_path / "gradebook_journal.jsonl")}
+
+
+# A GradeBook as another teacher's copy of the program would open it
+def open_book(files, write_behind=False):
+    return core.GradeBook(JsonStorage(files["snapshot"], files["journal"]), write_behind=write_behind)
+
+
+def plain(gradebook):
+    return {name: to_dict(student) for name, student in gradebook.items()}
@@ -0,0 +1,46 @@
+# Student Gradebook Manager – tests for the Version 4 resit bulk importer
+import csv
+
+import gradebook_journal as journal
+import gradebook_import as importer
+from conftest import open_book, plain
+
+
+def write_rows(path, rows):
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["name", "age", "subject", "score"])
+        writer.writerows(rows)
+
+
+def test_import_checks_rows_and_reports_rejects(files):
+    write_rows("rows.csv", [["Amy Lee", 15, "Maths", 88], ["", 15, "art", 50], ["Amy Lee", 15, "Art", 101],
+                            ["Ben Ng", 14, "Art", 70]])
+    book = open_book(files)
+    report = book.import_file("rows.csv", "rejects.csv")
+    assert dict(book.student("amy lee")["subjects"].items()) == {"maths": 88}
+    assert dict(book.student("ben ng")["subjects"].items()) == {"art": 70}
+    with open("rejects.csv") as f:
+        rejects = list(csv.reader(f))
+    assert len(rejects) == 3  # header and the two bad rows
+    assert report["rejected"] == 2
+    book.close()
+
+
+def test_bulk_import_only_rewrites_the_snapshot_a_few_times(files, monkeypatch):
+    # Small enough that a count-based rule would rewrite the snapshot after every batch
+    monkeypatch.setattr(journal, "COMPACT_MIN_BYTES", 4096)
+    rewrites = []
+    write_snapshot = journal.write_snapshot
+    monkeypatch.setattr(journal, "write_snapshot", lambda *args: rewrites.append(1) or write_snapshot(*args))
+    write_rows("rows.csv", [[f"student {i % 600}", 12, f"subject {i % 7}", i % 101] for i in range(12000)])
+    book = open_book(files)
+    report = importer.import_file("rows.csv", book.students, book.record_changes, batch_size=200)
+    assert report["batches"] == 60
+    assert len(book.students) == 600
+    # The snapshot is only rewritten as the journal outgrows it, not after every batch
+    assert 1 <= len(rewrites) <= 8
+    book.close()
+    fresh = open_book(files)
+    assert plain(fresh.students) == plain(book.students)
+    fresh.close()
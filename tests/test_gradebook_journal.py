@@ -0,0 +1,184 @@
+# Student Gradebook Manager – tests for the Version 4 resit journal and merging
+# Covers the parts the rest of the resit gradebook builds on: replaying the
+# journal (including a half-written last line), loading again after another
+# copy compacted it, merging two teachers' changes, and the binary snapshot.
+# Run with: python -m pytest tests (conftest.py puts the resit folder on the path)
+import os
+
+import gradebook_journal as journal
+import gradebook_snapshot
+from conftest import open_book, plain
+
+
+def test_replay_applies_changes_in_order(files):
+    journal.start_journal(files["journal"])
+    journal.append_changes([{"op": "add_student", "name": "amy", "age": 15},
+                            {"op": "set_score", "name": "amy", "subject": "maths", "score": 80},
+                            {"op": "set_score", "name": "amy", "subject": "art", "score": 60},
+                            {"op": "delete_subject", "name": "amy", "subject": "art"},
+                            {"op": "set_age", "name": "amy", "age": 16}], files["journal"])
+    gradebook, position = journal.load_snapshot_and_journal(files["snapshot"], files["journal"])
+    # Every change adds one to the student's version
+    assert plain(gradebook) == {"amy": {"age": 16, "subjects": {"maths": 80}, "total_score": 80,
+                                        "count_scores": 1, "version": 5}}
+    assert position["count"] == 5
+    assert position["offset"] == os.path.getsize(files["journal"])
+
+
+def test_torn_last_line_is_dropped_and_cut_off(files):
+    journal.start_journal(files["journal"])
+    journal.append_changes([{"op": "add_student", "name": "amy", "age": 15}], files["journal"])
+    complete = os.path.getsize(files["journal"])
+    with open(files["journal"], "ab") as f:
+        f.write(b'{"op":"set_score","name":"amy","sub')
+    gradebook, position = journal.load_snapshot_and_journal(files["snapshot"], files["journal"])
+    assert plain(gradebook)["amy"]["subjects"] == {}
+    assert position["offset"] == complete
+    assert os.path.getsize(files["journal"]) == complete
+    # The next record starts on a clean line and is read back
+    journal.append_changes([{"op": "set_score", "name": "amy", "subject": "maths", "score": 90}],
+                           files["journal"])
+    gradebook, _ = journal.load_snapshot_and_journal(files["snapshot"], files["journal"])
+    assert plain(gradebook)["amy"]["subjects"] == {"maths": 90}
+
+
+def test_read_journal_skips_a_complete_line_that_is_not_json(files):
+    journal.start_journal(files["journal"])
+    journal.append_changes([{"op": "add_student", "name": "amy", "age": 15}], files["journal"])
+    with open(files["journal"], "ab") as f:
+        f.write(b"not json\n")
+    journal.append_changes([{"op": "add_student", "name": "ben", "age": 15}], files["journal"])
+    changes, offset = journal.read_journal(files["journal"])
+    assert [change["name"] for change in changes] == ["amy", "ben"]
+    assert offset == os.path.getsize(files["journal"])
+
+
+def test_append_after_another_copy_crashed_mid_line(files):
+    first = open_book(files)
+    first.add_student("Amy Lee", 15)
+    # Another copy crashed half way through writing a record
+    with open(files["journal"], "ab") as f:
+        f.write(b'{"op":"set_score","name":"amy lee","sub')
+    first.set_score("amy lee", "maths", 70)
+    first.add_student("Ben Ng", 14)
+    first.close()
+    fresh = open_book(files)
+    assert sorted(fresh.students) == ["amy lee", "ben ng"]
+    assert dict(fresh.student("amy lee")["subjects"].items()) == {"maths": 70}
+    # Nothing that was saved is cut off the journal
+    changes, offset = journal.read_journal(files["journal"])
+    assert [change["op"] for change in changes] == ["add_student", "set_score", "add_student"]
+    assert offset == os.path.getsize(files["journal"])
+    fresh.close()
+
+
+def test_compact_starts_a_new_generation(files):
+    gradebook = {}
+    journal.apply_change(gradebook, {"op": "add_student", "name": "amy", "age": 15})
+    first = journal.compact(gradebook, files["snapshot"], files["journal"])
+    second = journal.compact(gradebook, files["snapshot"], files["journal"])
+    assert first["generation"] != second["generation"]
+    assert journal.read_generation(files["journal"]) == second["generation"]
+    assert plain(journal.read_snapshot(files["snapshot"])) == plain(gradebook)
+
+
+def test_sync_reads_other_teachers_changes(files):
+    first, second = open_book(files), open_book(files)
+    first.add_student("Amy Lee", 15)
+    first.set_score("amy lee", "maths", 88)
+    second.sync()
+    assert plain(second.students) == plain(first.students)
+    assert second.search("amy lee") == ["amy lee"]
+    first.close()
+    second.close()
+
+
+def test_sync_loads_again_after_the_journal_is_compacted(files):
+    first, second = open_book(files), open_book(files)
+    first.add_student("Amy Lee", 15)
+    # Rewrites the snapshot and starts a new journal, so the other copy's place in it is lost
+    first.save()
+    first.set_score("amy lee", "maths", 70)
+    generation = second.storage.position["generation"]
+    second.sync()
+    assert second.storage.position["generation"] != generation
+    assert plain(second.students) == plain(first.students)
+    assert second.dashboard()["scores"] == 1
+    first.close()
+    second.close()
+
+
+def test_concurrent_adds_keep_the_first_students_scores(files):
+    first, second = open_book(files), open_book(files)
+    first.add_student("Amy Lee", 15)
+    first.set_score("amy lee", "maths", 88)
+    # The second teacher hasn't seen Amy yet, so their add becomes an age change
+    conflicts = second.add_student("Amy Lee", 16)
+    assert conflicts == ["amy lee"]
+    first.sync()
+    for book in (first, second):
+        assert plain(book.students)["amy lee"] == {"age": 16, "subjects": {"maths": 88}, "total_score": 88,
+                                                    "count_scores": 1, "version": 3}
+    first.close()
+    second.close()
+
+
+def test_changes_to_different_students_are_both_kept(files):
+    first, second = open_book(files), open_book(files)
+    first.add_student("Amy Lee", 15)
+    second.add_student("Ben Ng", 14)
+    first.set_score("amy lee", "maths", 88)
+    second.sync()
+    second.set_score("ben ng", "art", 70)
+    first.sync()
+    assert plain(first.students) == plain(second.students)
+    assert sorted(first.students) == ["amy lee", "ben ng"]
+    first.close()
+    second.close()
+
+
+def test_stale_version_is_reported_as_a_conflict(files):
+    first, second = open_book(files), open_book(files)
+    first.add_student("Amy Lee", 15)
+    second.sync()
+    seen = second.student("amy lee").version
+    first.set_score("amy lee", "maths", 50)
+    assert second.set_score("amy lee", "art", 60, seen_version=seen) == ["amy lee"]
+    assert dict(second.student("amy lee")["subjects"].items()) == {"maths": 50, "art": 60}
+    first.close()
+    second.close()
+
+
+def test_late_conflict_with_unsaved_background_change(files):
+    first = open_book(files)
+    first.add_student("Amy Lee", 15)
+    second = open_book(files, write_behind=True)
+    # Keep the second teacher's change waiting until flush()
+    second.saver.delay = 60
+    second.set_score("amy lee", "maths", 50)
+    first.set_score("amy lee", "maths", 70)
+    second.sync()
+    # The other teacher's change is loaded and ours is put back on top of it
+    assert second.take_late_conflicts() == ["amy lee"]
+    assert second.take_late_conflicts() == []
+    assert second.student("amy lee")["subjects"]["maths"] == 50
+    assert second.flush(timeout=10)
+    first.sync()
+    assert first.student("amy lee")["subjects"]["maths"] == 50
+    second.close()
+    first.close()
+
+
+def test_binary_snapshot_round_trip(files):
+    gradebook = {}
+    journal.apply_change(gradebook, {"op": "add_student", "name": "amy lee", "age": 15})
+    journal.apply_change(gradebook, {"op": "add_student", "name": "tāne", "age": 17})
+    journal.apply_change(gradebook, {"op": "add_student", "name": "no scores", "age": 9})
+    for subject, score in [("maths", 0), ("te reo māori", 100), ("art", 55)]:
+        journal.apply_change(gradebook, {"op": "set_score", "name": "amy lee", "subject": subject, "score": score})
+    journal.apply_change(gradebook, {"op": "set_score", "name": "tāne", "subject": "art", "score": 99})
+    path = os.path.join(os.path.dirname(files["snapshot"]), "gradebook_logs" + gradebook_snapshot.EXTENSION)
+    journal.compact(gradebook, path, files["journal"])
+    loaded = journal.read_snapshot(path)
+    assert plain(loaded) == plain(gradebook)
+    assert list(loaded) == list(gradebook)
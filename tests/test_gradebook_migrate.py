@@ -0,0 +1,68 @@
+# Student Gradebook Manager – tests for the Version 4 resit text log migrator
+import csv
+import json
+
+import gradebook_migrate as migrate
+from conftest import open_book, plain
+
+LOG = """Name: Amy Lee
+Age: 15
+Subjects and Scores:
+  Maths: 88
+Average Score: 88.00
+----------------------------------------
+Name: Ben Ng
+Age: 40
+Subjects and Scores:
+  Maths: 50
+Average Score: 50.00
+----------------------------------------
+Name: AMY LEE
+Age: 16
+Subjects and Scores:
+  Maths: 90
+  Art : 70
+Average Score: 80.00
+----------------------------------------
+Name: Cy Ho
+Age: 12
+Subjects and Scores:
+  Maths: 150
+Average Score: 150.00
+----------------------------------------
+"""
+
+
+def write_log(tmp_path):
+    path = tmp_path / "gradebook_logs.txt"
+    path.write_text(LOG, encoding="utf-8")
+    return str(path)
+
+
+def rejected(report):
+    with open(report["rejects_file"], newline="", encoding="utf-8") as f:
+        return [(row["name"], row["reason"].split(":")[0]) for row in csv.DictReader(f)]
+
+
+def test_json_migration_uses_this_versions_rules(files, tmp_path):
+    out_path = str(tmp_path / "migrated.json")
+    report = migrate.migrate_to_json(write_log(tmp_path), out_path)
+    with open(out_path, encoding="utf-8") as f:
+        gradebook = json.load(f)
+    assert gradebook == {"amy lee": {"age": 16, "subjects": {"maths": 90, "art": 70},
+                                     "total_score": 160, "count_scores": 2}}
+    assert rejected(report) == [("Ben Ng", "Age"), ("Cy Ho", "Score for Maths")]
+    assert (report["migrated"], report["rejected"], report["students"]) == (2, 2, 1)
+
+
+def test_json_and_gradebook_migrations_agree(files, tmp_path):
+    log_path = write_log(tmp_path)
+    out_path = str(tmp_path / "migrated.json")
+    migrate.migrate_to_json(log_path, out_path)
+    book = open_book(files)
+    migrate.migrate_to_gradebook(log_path, book)
+    with open(out_path, encoding="utf-8") as f:
+        gradebook = json.load(f)
+    assert {name: (student["age"], student["subjects"]) for name, student in plain(book.students).items()} \
+        == {name: (student["age"], student["subjects"]) for name, student in gradebook.items()}
+    book.close()
@@ -0,0 +1,107 @@
+# Student Gradebook Manager – tests for the Version 4 resit background saver
+import json
+import threading
+
+import pytest
+
+import gradebook_history as score_history
+import gradebook_journal as journal
+from conftest import open_book, plain
+
+
+def history_lines():
+    with open(score_history.HISTORY_FILE) as f:
+        return [json.loads(line) for line in f]
+
+
+def test_changes_are_saved_in_the_background_and_on_close(files):
+    book = open_book(files, write_behind=True)
+    book.add_student("Amy Lee", 15)
+    book.set_score("amy lee", "maths", 60)
+    assert book.flush(timeout=10)
+    book.set_score("amy lee", "art", 70)
+    book.close()
+    fresh = open_book(files)
+    assert dict(fresh.student("amy lee")["subjects"].items()) == {"maths": 60, "art": 70}
+    fresh.close()
+
+
+def test_failed_background_save_is_tried_again_with_its_history(files, monkeypatch):
+    book = open_book(files, write_behind=True)
+    book.add_student("Amy Lee", 15)
+    assert book.flush(timeout=10)
+    append_changes = journal.append_changes
+
+    def disk_full(*args):
+        raise OSError("No space left on device")
+    monkeypatch.setattr(journal, "append_changes", disk_full)
+    book.set_score("amy lee", "maths", 60)
+    with pytest.raises(OSError):
+        book.flush(timeout=10)
+    # The change is still in memory and waiting to be saved
+    assert book.student("amy lee")["subjects"]["maths"] == 60
+    monkeypatch.setattr(journal, "append_changes", append_changes)
+    assert book.flush(timeout=10)
+    assert [line[1:] for line in history_lines() if line[1] is not None] == [["amy lee", "maths", 60, None]]
+    book.close()
+    fresh = open_book(files)
+    assert plain(fresh.students) == plain(book.students)
+    fresh.close()
+
+
+def test_change_that_fails_to_save_is_undone(files, monkeypatch):
+    book = open_book(files)
+    book.add_student("Amy Lee", 15)
+    book.set_score("amy lee", "maths", 60)
+
+    def disk_full(*args):
+        raise OSError("No space left on device")
+    monkeypatch.setattr(journal, "append_changes", disk_full)
+    with pytest.raises(OSError):
+        book.set_score("amy lee", "maths", 90)
+    with pytest.raises(OSError):
+        book.add_student("Ben Ng", 16)
+    assert book.student("amy lee")["subjects"]["maths"] == 60
+    assert "ben ng" not in book.students
+    assert book.dashboard()["students"] == 1
+    book.close()
+
+
+def test_menu_sync_skips_a_round_while_another_copy_is_writing(files):
+    book = open_book(files)
+    other = open_book(files)
+    book.add_student("Amy Lee", 15)
+    lock = other.storage.lock()
+    assert lock.acquire()
+    try:
+        assert book.sync(wait=False) is False
+        assert other.sync(wait=False) is True  # The copy holding the lock isn't kept waiting
+    finally:
+        lock.release()
+    assert book.sync(wait=False) is True
+
+
+def test_edits_carry_on_while_a_snapshot_is_written(files, monkeypatch):
+    book = open_book(files)
+    book.add_student("Amy Lee", 15)
+    book.set_score("amy lee", "maths", 60)
+    serialize_snapshot = journal.serialize_snapshot
+
+    def edit_while_serializing(gradebook, snapshot_file):
+        def edit():
+            with book.mutex:
+                book.apply({"op": "set_score", "name": "amy lee", "subject": "maths", "score": 90})
+                book.apply({"op": "add_student", "name": "ben ng", "age": 16})
+        thread = threading.Thread(target=edit)
+        thread.start()
+        thread.join(timeout=10)
+        assert not thread.is_alive()
+        return serialize_snapshot(gradebook, snapshot_file)
+    monkeypatch.setattr(journal, "serialize_snapshot", edit_while_serializing)
+    book.save()
+    assert book.student("amy lee")["subjects"]["maths"] == 90
+    # The snapshot is the gradebook as it was when the save started
+    fresh = open_book(files)
+    assert fresh.student("amy lee")["subjects"]["maths"] == 60
+    assert "ben ng" not in fresh.students
+    fresh.close()
@@ -0,0 +1,94 @@
+# Student Gradebook Manager – tests for the Version 4 resit HTTP/JSON server
+import asyncio
+import json
+
+import pytest
+
+import gradebook_journal as journal
+import gradebook_server as server
+from conftest import open_book, plain
+
+
+def request(service, method, target, data=None):
+    body = json.dumps(data).encode("utf-8") if data is not None else b""
+    try:
+        return asyncio.run(server.handle_request(service, method, target, body))
+    except server.RequestError as error:
+        return error.status, {"error": error.message}
+
+
+def disk_full(*args):
+    raise OSError("No space left on device")
+
+
+def test_write_that_fails_to_save_is_not_kept_in_memory(files, monkeypatch):
+    service = server.GradebookService(open_book(files))
+    assert request(service, "POST", "/students", {"name": "Amy Lee", "age": 15})[0] == 201
+    monkeypatch.setattr(journal, "append_changes", disk_full)
+    with pytest.raises(OSError):
+        request(service, "POST", "/students", {"name": "Ben Ng", "age": 16})
+    with pytest.raises(OSError):
+        request(service, "PUT", "/students/amy lee/scores/maths", {"score": 60})
+    assert request(service, "GET", "/students/ben ng")[0] == 404
+    assert request(service, "GET", "/students/amy lee")[1]["subjects"] == {}
+    assert request(service, "GET", "/stats")[1]["students"] == 1
+    service.book.close()
+
+
+@pytest.mark.parametrize("data", [
+    {"name": ["Amy Lee"], "age": 15},
+    {"name": {"first": "Amy"}, "age": 15},
+    {"name": 7, "age": 15},
+    {"name": "Amy Lee", "age": 15.5},
+    {"name": "Amy Lee", "age": [15]},
+    {"name": "Amy Lee", "age": True},
+    {"name": "Amy Lee", "age": "1²"},
+])
+def test_values_of_the_wrong_type_are_refused(files, data):
+    service = server.GradebookService(open_book(files))
+    assert request(service, "POST", "/students", data)[0] == 400
+    assert request(service, "GET", "/students")[1]["total"] == 0
+    service.book.close()
+
+
+def test_ages_and_scores_may_be_numbers_or_text(files):
+    service = server.GradebookService(open_book(files))
+    assert request(service, "POST", "/students", {"name": "Amy Lee", "age": "15"})[0] == 201
+    assert request(service, "PUT", "/students/amy lee/scores/maths", {"score": 60})[0] == 200
+    assert request(service, "PUT", "/students/amy lee/scores/art", {"score": " 70 "})[0] == 200
+    bad = {"op": "set_score", "name": "amy lee", "subject": ["maths"], "score": 80}
+    assert request(service, "POST", "/batch", [bad])[0] == 400
+    assert request(service, "GET", "/students/amy lee")[1]["subjects"] == {"maths": 60, "art": 70}
+    service.book.close()
+
+
+def test_reads_see_what_other_copies_have_saved(files):
+    service = server.GradebookService(open_book(files))
+    assert request(service, "GET", "/stats")[1]["students"] == 0
+    other = open_book(files)
+    other.add_student("Amy Lee", 15)
+    other.set_score("amy lee", "maths", 60)
+    other.set_score("amy lee", "art", 70)
+    assert request(service, "GET", "/students/amy lee")[1]["subjects"] == {"maths": 60, "art": 70}
+    assert list(request(service, "GET", "/stats")[1]["subjects"]) == ["art", "maths"]
+    other.delete_subject("amy lee", "art")
+    stats = request(service, "GET", "/stats")[1]
+    assert list(stats["subjects"]) == ["maths"]
+    assert stats["scores"] == 1
+    other.close()
+    service.book.close()
+
+
+def test_reads_dont_wait_while_another_copy_is_saving(files):
+    service = server.GradebookService(open_book(files))
+    other = open_book(files)
+    other.add_student("Amy Lee", 15)
+    lock = other.storage.lock()
+    assert lock.acquire()
+    try:
+        assert request(service, "GET", "/students/amy lee")[0] == 404
+    finally:
+        lock.release()
+    assert request(service, "GET", "/students/amy lee")[0] == 200
+    other.close()
+    service.book.close()
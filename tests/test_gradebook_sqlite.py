@@ -0,0 +1,71 @@
+# Student Gradebook Manager – tests for the Version 4 resit SQLite storage
+import pytest
+
+import gradebook_core as core
+from conftest import plain
+from gradebook_storage import SqliteStorage
+
+
+@pytest.fixture
+def database(files, tmp_path):
+    return str(tmp_path / "gradebook.db")
+
+
+def open_book(database):
+    return core.GradeBook(SqliteStorage(database))
+
+
+def report(book, subject):
+    return book.subject_report(subject, top=2, roster=False)
+
+
+def fill(book):
+    for name, age, scores in [("Amy Lee", 15, {"maths": 60, "art": 90}), ("Ben Ng", 16, {"maths": 80}),
+                              ("Cy Ho", 14, {"maths": 70, "art": 40})]:
+        book.add_student(name, age)
+        for subject, score in scores.items():
+            book.set_score(name, subject, score)
+
+
+def test_students_are_read_as_they_are_used(database):
+    teacher = open_book(database)
+    fill(teacher)
+    book = open_book(database)
+    # The database adds up the dashboard and subject reports without reading the students in
+    assert book.dashboard() == teacher.dashboard()
+    assert len(book) == 3
+    assert report(book, "maths") == report(teacher, "maths")
+    assert report(book, "music") is None
+    assert book.students.records == {}
+    # Reading one student adds theirs in from memory, the rest still come from the database
+    book.set_score("amy lee", "maths", 100)
+    assert list(book.students.records) == ["amy lee"]
+    assert book.dashboard()["average"] == pytest.approx((100 + 90 + 80 + 70 + 40) / 5)
+    assert report(book, "maths")["top"] == [("amy lee", 100), ("ben ng", 80)]
+    assert report(book, "maths")["lowest"] == 70
+    book.close()
+    teacher.close()
+
+
+def test_other_copies_changes_are_applied_once(database):
+    teacher = open_book(database)
+    fill(teacher)
+    book = open_book(database)
+    book.student("amy lee")
+    teacher.set_score("amy lee", "art", 95)
+    teacher.set_score("ben ng", "art", 50)
+    # Read after the other copy saved the change, so catching up must not apply it again
+    book.student("ben ng")
+    book.sync()
+    assert plain({name: book.student(name) for name in ("amy lee", "ben ng", "cy ho")}) == \
+        plain({name: teacher.student(name) for name in ("amy lee", "ben ng", "cy ho")})
+    assert book.dashboard() == teacher.dashboard()
+    # Building the indexes reads everyone else in too
+    assert book.names() == ["amy lee", "ben ng", "cy ho"]
+    assert book.students.complete
+    teacher.add_student("Di Wu", 17)
+    book.sync()
+    assert plain(book.students) == plain(teacher.students)
+    assert report(book, "art") == report(teacher, "art")
+    book.close()
+    teacher.close()
@@ -0,0 +1,60 @@
+# Student Gradebook Manager – tests for the summary log index in Versions 1 and 2
+import importlib.util
+import os
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+VERSIONS = {"Version 1": "V1_gradebook_manager1.py", "Version 2": "V2_gradebook_mamager2.py"}
+
+
+# One of the earlier versions, with its log and index kept in the test's own folder
+@pytest.fixture(params=sorted(VERSIONS))
+def version(request, tmp_path, monkeypatch):
+    path = os.path.join(ROOT, request.param, VERSIONS[request.param])
+    spec = importlib.util.spec_from_file_location(VERSIONS[request.param][:-3], path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    monkeypatch.setattr(module, "LOG_FILE", str(tmp_path / "gradebook_logs.txt"))
+    monkeypatch.setattr(module, "INDEX_FILE", str(tmp_path / "gradebook_logs.idx"))
+    if hasattr(module, "eg"):
+        monkeypatch.setattr(module.eg, "msgbox", lambda *args, **kwargs: None)  # No screens in the tests
+    return module
+
+
+def save(version, name, score):
+    version.display_and_save_summary(name, {"age": 15, "subjects": {"maths": score}, "total_score": score,
+                                            "count_scores": 1})
+
+
+def first_line(version, positions):
+    start, end = positions[-1]
+    with open(version.LOG_FILE, "rb") as file:
+        return version.read_summary(file.read(), start, end).splitlines()[0]
+
+
+def test_index_is_rebuilt_when_the_log_is_cut_short(version):
+    save(version, "Amy Lee", 60)
+    save(version, "Ben Ngo", 70)
+    with open(version.LOG_FILE, "rb") as file:
+        ben = file.read()[version.load_index()["Ben Ngo"][0][0]:]
+    with open(version.LOG_FILE, "wb") as file:
+        file.write(ben)
+    index = version.load_index()
+    assert list(index) == ["Ben Ngo"]
+    assert first_line(version, index["Ben Ngo"]) == "Name: Ben Ngo"
+
+
+def test_index_is_rebuilt_when_the_log_is_replaced_by_one_of_the_same_size(version):
+    save(version, "Amy Lee", 60)
+    save(version, "Ben Ngo", 70)
+    with open(version.LOG_FILE, "rb") as file:
+        log = file.read()
+    index = version.load_index()
+    (amy_start, amy_end), = index["Amy Lee"]
+    (ben_start, ben_end), = index["Ben Ngo"]
+    with open(version.LOG_FILE, "wb") as file:
+        file.write(log[ben_start:ben_end] + log[amy_start:amy_end])
+    index = version.load_index()
+    assert first_line(version, index["Amy Lee"]) == "Name: Amy Lee"
+    assert first_line(version, index["Ben Ngo"]) == "Name: Ben Ngo"